@@ -16,6 +16,8 @@ from .common.repo import Repo
 from .common import (  # noqa
     config as config_mod,
     filters,
+    http_client,
+    probe_cache,
     stores,
     sources,
     repo,
@@ -93,6 +95,27 @@ def add_add_artifact_parser(parent_parser):
             'NUM'
         )
     )
+    add_artifact.add_argument(
+        '--sequential', action='store_true',
+        help=(
+            'Expand all the sources, then download all the artifacts and '
+            'then add them, instead of doing it at the same time (same as '
+            'the sequential_add config option)'
+        )
+    )
+
+    return parent_parser
+
+
+def add_invalidate_probe_cache_parser(parent_parser):
+    invalidate = parent_parser.add_parser(
+        'invalidate-probe-cache',
+        help='Remove the cached metadata of remote artifacts.'
+    )
+    invalidate.add_argument(
+        'url_prefix', nargs='*',
+        help='Remove only the urls starting with these, all if none passed'
+    )
 
     return parent_parser
 
@@ -192,6 +215,7 @@ def parse_args():
     repo_subparser = add_createrepo_parser(repo_subparser)
     repo_subparser = add_remove_old_parser(repo_subparser)
     repo_subparser = add_sign_artifacts_parser(repo_subparser)
+    repo_subparser = add_invalidate_probe_cache_parser(repo_subparser)
     repo_subparser = add_docs_parser(repo_subparser)
 
     return parser.parse_args()
@@ -333,6 +357,9 @@ def do_add(args, config, repo):
         LOGGER.error('keep-latest must be >0')
         return 1
 
+    if args.sequential:
+        config.set('sequential_add', 'true')
+
     LOGGER.info('Adding artifacts to the repo %s', repo.path)
     for art_src in args.artifact_source:
         repo.add_source(art_src.strip())
@@ -387,6 +414,19 @@ def do_generate_src(config, repo):
     return 0
 
 
+def do_invalidate_probe_cache(args):
+    cache = probe_cache.get_cache()
+    if cache is None:
+        LOGGER.error('No probe_cache configured')
+        return 1
+
+    removed = 0
+    for url_prefix in args.url_prefix or ['']:
+        removed += cache.invalidate(url_prefix)
+    LOGGER.info('Removed %d entries from the probe cache', removed)
+    return 0
+
+
 def do_show_docs(args):
     if args.subject == 'config':
         print config_mod.DEFAULT_CONFIG
@@ -461,5 +501,8 @@ def main():
         exit_code = do_createrepo(repo)
     elif args.repoaction in ['sign-rpms', 'sign-artifacts']:
         exit_code = do_sign_artifacts(repo)
+    elif args.repoaction == 'invalidate-probe-cache':
+        exit_code = do_invalidate_probe_cache(args)
 
+    http_client.log_stats()
     sys.exit(exit_code)
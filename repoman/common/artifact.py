@@ -39,17 +39,26 @@ For clarification, here's a dictionary like diagram::
 **NOTE**:You have to implement at least the Artifact class
 """
 import os
-import hashlib
 import logging
+from bisect import (
+    bisect_left,
+    insort,
+)
+from itertools import islice
 from abc import (
     ABCMeta,
     abstractproperty,
 )
 
+from .downloader import (
+    fetch,
+    get_downloaded_checksums,
+    get_temp_path,
+)
 from .utils import (
-    download,
-    cmpfullver,
+    hash_file,
     sign_detached,
+    version_key,
 )
 
 
@@ -58,33 +67,39 @@ logger = logging.getLogger(__name__)
 
 class Artifact(object):
     __metaclass__ = ABCMeta
+    # artifacts are kept in memory for the whole repository, so avoid the
+    # per-instance dict, subclasses should define their own slots too
+    __slots__ = ('path', 'inode', '_checksums')
 
-    def __init__(self, path, temp_dir='/tmp', verify_ssl=True):
+    def __init__(self, path, temp_dir='/tmp', verify_ssl=True,
+                 metadata_only=False):
         """
         :param path: Path or url to the artifact
         :param temp_dir: If url specified, will use that temporary dir to store
             it, the caller should take care of creating and deleting that
             temporary dir if needed
+        :param metadata_only: If set, urls will not be downloaded, for the
+            artifacts that can get all their metadata from the url itself
         """
-        if path.startswith('http:') or path.startswith('https:'):
-            name = path.rsplit('/', 1)[-1]
-            if not name:
-                raise Exception('Passed trailing slash in path %s, '
-                                'unable to guess package name'
-                                % path)
-            fpath = temp_dir + '/' + name
-            download(path, fpath, verify=verify_ssl)
+        is_url = path.startswith('http:') or path.startswith('https:')
+        if is_url and not metadata_only:
+            fpath = get_temp_path(temp_dir, path)
+            fetch(path, fpath, verify=verify_ssl)
             path = fpath
         self.path = path
-        # will be calculated if needed
-        self._md5 = None
-        # this property should uniquely identify an artifact entity, in the
-        # sense that if you have two rpms with the same full_name they must
-        # package the same content or one of them is wrongly generated (the
-        # version was not bumped or something)
-        self.full_name = '%s(%s %s)' % (
-            self.type, self.name, self.version,
-        )
+        # known if it was just downloaded, will be calculated if needed
+        # otherwise
+        self._checksums = get_downloaded_checksums(path)
+
+    @property
+    def full_name(self):
+        """
+        This property should uniquely identify an artifact entity, in the
+        sense that if you have two rpms with the same full_name they must
+        package the same content or one of them is wrongly generated (the
+        version was not bumped or something)
+        """
+        return '%s(%s %s)' % (self.type, self.name, self.version)
 
     @abstractproperty
     def version(self):
@@ -102,15 +117,46 @@ class Artifact(object):
     def type(self):
         return 'artifact'
 
+    @property
+    def checksums(self):
+        """
+        Lazy calculation of all the checksums (md5, sha1 and sha256) of the
+        file, in a single pass.
+        """
+        if self._checksums is None:
+            self._checksums = hash_file(self.path)
+        return self._checksums
+
+    @property
+    def has_checksums(self):
+        """
+        True if the checksums are already known, so getting them is free
+        """
+        return self._checksums is not None
+
+    def set_checksums(self, checksums):
+        """
+        Sets the already calculated checksums, as returned by
+        `repoman.common.utils.hash_file`
+        """
+        self._checksums = checksums
+
     @property
     def md5(self):
         """
         Lazy md5 calculation.
         """
-        if self._md5 is None:
-            with open(self.path) as fdno:
-                self._md5 = hashlib.md5(fdno.read()).hexdigest()
-        return self._md5
+        return self.checksums['md5']
+
+    def get_metadata(self):
+        """
+        Returns the metadata needed to load this artifact again without
+        inspecting the file, as a plain serializable dict
+        """
+        metadata = {'inode': self.inode}
+        if self._checksums is not None:
+            metadata['checksums'] = self._checksums
+        return metadata
 
     def generate_path(self):
         """
@@ -148,6 +194,8 @@ class ArtifactInode(list, object):
     """
     Simple list, abstracts a set of rpm instances
     """
+    __slots__ = ('inode', )
+
     def __init__(self, inode):
         self.inode = inode
         super(ArtifactInode, self).__init__(self)
@@ -217,45 +265,107 @@ class ArtifactVersion(dict, object):
 
 
 class ArtifactName(dict, object):
-    """Dict of available versions for an artifact name"""
+    """
+    Dict of available versions for an artifact name, that also keeps the
+    versions sorted so the newest ones can be retrieved without sorting them
+    all each time.
+
+    The versions must be added and removed only through the item assignment,
+    `del`, `pop` and `update` methods, as those keep the sorted index in sync
+    """
     def __init__(self, name, version_class=ArtifactVersion):
         self.name = name
         super(ArtifactName, self).__init__(self)
         self.version_class = version_class
+        # (version_key, version) tuples, from oldest to newest
+        self._sorted_versions = []
+
+    def __setitem__(self, version, value):
+        if version not in self:
+            insort(self._sorted_versions, (version_key(version), version))
+        super(ArtifactName, self).__setitem__(version, value)
+
+    def __delitem__(self, version):
+        super(ArtifactName, self).__delitem__(version)
+        self._unindex(version)
+
+    def pop(self, version, *default):
+        if version in self:
+            self._unindex(version)
+        return super(ArtifactName, self).pop(version, *default)
+
+    def update(self, *args, **kwargs):
+        for version, value in dict(*args, **kwargs).iteritems():
+            self[version] = value
+
+    def _unindex(self, version):
+        entry = (version_key(version), version)
+        pos = bisect_left(self._sorted_versions, entry)
+        if (
+            pos < len(self._sorted_versions)
+            and self._sorted_versions[pos] == entry
+        ):
+            del self._sorted_versions[pos]
+
+    def iter_newest(self):
+        """
+        Iterates over the version strings, from the newest to the oldest
+        """
+        for _, version in reversed(self._sorted_versions):
+            yield version
+
+    def newest_version(self):
+        """
+        Returns the newest version string, or None if there are no versions
+        """
+        if not self._sorted_versions:
+            return None
+        return self._sorted_versions[-1][1]
 
     def add_artifact(self, artifact, onlyifnewer):
-        if onlyifnewer and (
-            artifact.ver_rel in self or
-            next(
-                (
-                    ver for ver in self.keys()
-                    if cmpfullver(ver, artifact.version) >= 0
-                ),
-                None,
-            )
+        """
+        Adds the given artifact to it's version
+
+        :param artifact: Artifact instance to add
+        :param onlyifnewer: If set, the artifact will only be added if it's
+            version is newer than any of the existing ones
+        :returns: False if it was not added
+        """
+        if onlyifnewer and self._sorted_versions and (
+            self._sorted_versions[-1][0] >= version_key(artifact.version)
         ):
             return False
         elif artifact.version not in self:
             self[artifact.version] = self.version_class(artifact.version)
         return self[artifact.version].add_artifact(artifact)
 
-    def get_latest(self, num=1):
-        """
-        Returns the list of available inodes for the latest version
-        if any
-        """
+    def _select_latest(self, versions, num):
         if not self:
             return None
         if not num:
             num = len(self)
-        sorted_list = self.keys()
-        sorted_list.sort(cmp=cmpfullver)
-        latest = {}
-        if num > len(sorted_list):
-            num = len(sorted_list)
-        for pos in xrange(num):
-            latest[sorted_list[pos]] = self.get(sorted_list[pos])
-        return latest
+        return dict(
+            (version, self[version])
+            for version in islice(versions, num)
+        )
+
+    def get_latest(self, num=1):
+        """
+        Returns the dict of the latest num versions, if any
+        """
+        return self._select_latest(self.iter_newest(), num)
+
+    def get_all_but_latest(self, num=1):
+        """
+        Returns the list of versions that are not in the latest num ones, from
+        the oldest to the newest
+        """
+        latest = self.get_latest(num=num) or {}
+        return [
+            self[version]
+            for _, version in self._sorted_versions
+            if version not in latest
+        ]
 
     def delete_version(self, version, noop=False):
         if version in self:
@@ -322,6 +432,41 @@ class ArtifactList(dict, object):
             if not self[art_name]:
                 self.pop(art_name)
 
+    def pop_version(self, art_name, art_version):
+        """
+        Removes the given artifact's version from the list, without removing
+        any files
+
+        Args:
+            art_name (str): Name of the artifact to remove it's version
+            art_version (str): Version to remove
+
+        Returns:
+            ArtifactVersion: the removed version, or None if it was not there
+        """
+        if art_name not in self:
+            return None
+        version = self[art_name].pop(art_version, None)
+        if not self[art_name]:
+            self.pop(art_name)
+        return version
+
+    def get_all_but_latest(self, num=1):
+        """
+        Gets the versions that are not in the latest num ones for each name
+
+        Args:
+            num (int): Number of latest versions to skip for each name
+
+        Returns:
+            list of (str, ArtifactVersion): the name and version pairs
+        """
+        return [
+            (name, version)
+            for name, art_name in self.iteritems()
+            for version in art_name.get_all_but_latest(num=num)
+        ]
+
     def delete(self):
         """
         Deletes all the artifacts in this list
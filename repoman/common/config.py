@@ -36,6 +36,68 @@ verify_ssl = true
 # What to do whet a source to be added has no artifacts valid values are
 # fail|warn|ignore
 on_empty_source = fail
+
+# Path to the persistent artifacts metadata index (relative paths are taken
+# from the repository root), used to avoid inspecting again the artifacts that
+# did not change when loading the repo. If empty, no index will be used
+metadata_index =
+
+# Number of directories to scan in parallel when loading a repository, bigger
+# values help on wide trees over network filesystems
+scan_workers = 1
+
+# Number of files to calculate the checksums of in parallel, when needed (for
+# example, when signing isos)
+hash_workers = 1
+
+# Number of artifacts to download at the same time when adding a source, and
+# the maximum of those that can come from the same host (0 for no limit)
+download_workers = 1
+download_workers_per_host = 0
+
+# Number of sources to expand at the same time when adding a list of sources
+# (from a conf: file or stdin)
+source_workers = 1
+
+# If true, all the sources are expanded, then all the artifacts downloaded and
+# then added to the stores, one step after the other. If false, each artifact
+# is added to the stores as soon as it's downloaded, while the next ones are
+# still being downloaded and the next sources expanded
+sequential_add = false
+# Maximum number of downloads started ahead of the artifact being added to the
+# stores when not in sequential mode (never less than download_workers). It
+# does not limit the disk used, the downloaded files are kept in the temporary
+# dir until the repo is saved
+pending_downloads = 20
+
+# All the http requests share the same connections, these are the number of
+# hosts to keep connections to, and how many connections to keep to each host
+# (it will never be less than download_workers nor source_workers)
+http_pool_hosts = 10
+http_pool_size = 10
+
+# Directory to keep the downloaded artifacts in between runs, the urls
+# downloaded again are only checked for changes with the server and taken from
+# the cache if not changed. If empty, no cache will be used
+download_cache =
+# Maximum size of the cache in MB, the least recently used files are removed
+# when over it
+download_cache_max_mb = 10240
+
+# File to keep the links and api responses extracted from the pages fetched
+# when expanding the sources, the pages are only checked for changes with the
+# server and not parsed again if not changed (finished jenkins builds are not
+# even checked). If empty, no cache will be used
+page_cache =
+
+# File to keep the metadata read from the headers of the remote rpms that are
+# only checked and not downloaded (like with the latest or only-missing
+# filters), the rpms are only checked for changes with a HEAD request and not
+# probed again if not changed. If empty, no cache will be used
+probe_cache =
+# Maximum number of rpms to keep the metadata of, the least recently used are
+# removed when over it
+probe_cache_max_entries = 100000
 """
 
 logger = logging.getLogger(__name__ )  # flake8: noqa
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+Persistent cache for the downloaded artifacts.
+
+The files are stored only once, by the sha256 of their contents, and each
+url points to the file it downloaded last time, along with the ETag and
+Last-Modified headers the server sent for it::
+
+    $cache_dir/
+    ├── index.db
+    └── objects/
+        └── $sha256[:2]/
+            └── $sha256
+
+    urls: url | digest | etag | last_modified
+    objects: digest | size | mtime | atime | checksums
+
+When a cached url is requested again, a conditional request is done, and if
+the server says it did not change, the cached file is copied into the
+destination instead of downloading it again. When the total size goes over
+the configured maximum, the least recently used files are evicted.
+
+The files are copied instead of hardlinked so the ones in the repos can be
+signed or modified without touching the cache (the copy is a reflink when the
+filesystem supports it, so it's cheap). If the size or mtime of a cached file
+changes anyway, it's discarded.
+"""
+import fcntl
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+from .sqlite_cache import SharedCache, SqliteCache
+from .utils import (
+    NotModified,
+    download,
+)
+
+
+logger = logging.getLogger(__name__)
+# ioctl to make a copy-on-write clone of a file, on linux
+FICLONE = 0x40049409
+
+
+def _copy_out(src_path, dest_path):
+    """
+    Copies the file, as a reflink if the filesystem supports it, so the copy
+    does not share the inode (nor the read only mode) of the cached file
+    """
+    with open(src_path, 'rb') as src:
+        with open(dest_path, 'wb') as dest:
+            try:
+                fcntl.ioctl(dest.fileno(), FICLONE, src.fileno())
+            except (IOError, OSError):
+                shutil.copyfileobj(src, dest, 1024 * 1024)
+    stat = os.stat(src_path)
+    os.utime(dest_path, (stat.st_atime, stat.st_mtime))
+
+
+class DownloadCache(SqliteCache):
+    CONFIG_OPTION = 'download_cache'
+
+    def __init__(self, path, max_size):
+        """
+        :param path: Directory to keep the cache in, will be created if it
+            does not exist
+        :param max_size: Maximum size of the cached files, in bytes
+        """
+        super(DownloadCache, self).__init__(path)
+        self.max_size = max_size
+        self.objects_dir = os.path.join(path, 'objects')
+        self.tmp_dir = os.path.join(path, 'tmp')
+        for dir_path in (self.objects_dir, self.tmp_dir):
+            if not os.path.exists(dir_path):
+                os.makedirs(dir_path)
+        self._open_db(
+            os.path.join(path, 'index.db'),
+            'CREATE TABLE IF NOT EXISTS urls ('
+            'url TEXT PRIMARY KEY, digest TEXT, etag TEXT, '
+            'last_modified TEXT)',
+            'CREATE TABLE IF NOT EXISTS objects ('
+            'digest TEXT PRIMARY KEY, size INTEGER, mtime REAL, '
+            'atime REAL, checksums TEXT)',
+        )
+
+    @classmethod
+    def get_options(cls, config):
+        return {
+            'max_size': config.getint('download_cache_max_mb') * 1024 * 1024,
+        }
+
+    def _object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def _lookup(self, url):
+        """
+        Returns the cached entry for the url, if the file is still there and
+        untouched
+        """
+        with self._lock:
+            entry = self._conn.execute(
+                'SELECT u.digest, u.etag, u.last_modified, o.size, o.mtime, '
+                'o.checksums '
+                'FROM urls u JOIN objects o ON u.digest = o.digest '
+                'WHERE u.url = ?',
+                (url, ),
+            ).fetchone()
+        if entry is None:
+            return None
+        digest, etag, last_modified, size, mtime, checksums = entry
+        try:
+            stat = os.stat(self._object_path(digest))
+        except OSError:
+            stat = None
+        if stat is None or (stat.st_size, stat.st_mtime) != (size, mtime):
+            logger.debug('Discarding modified cached file for %s', url)
+            self._drop_object(digest)
+            return None
+        return digest, etag, last_modified, json.loads(checksums)
+
+    def _drop_object(self, digest):
+        try:
+            os.remove(self._object_path(digest))
+        except OSError:
+            pass
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    'DELETE FROM objects WHERE digest = ?', (digest, ),
+                )
+                self._conn.execute(
+                    'DELETE FROM urls WHERE digest = ?', (digest, ),
+                )
+
+    def _touch(self, digest):
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    'UPDATE objects SET atime = ? WHERE digest = ?',
+                    (time.time(), digest),
+                )
+
+    def _store(self, url, tmp_path, checksums, headers):
+        """
+        Moves the downloaded file into the pool, if there's no file with the
+        same contents already
+        """
+        digest = checksums['sha256']
+        obj_path = self._object_path(digest)
+        if not os.path.exists(os.path.dirname(obj_path)):
+            try:
+                os.makedirs(os.path.dirname(obj_path))
+            except OSError:
+                # created by someone else meanwhile
+                pass
+        if os.path.exists(obj_path):
+            os.remove(tmp_path)
+        else:
+            os.chmod(tmp_path, 0o444)
+            os.rename(tmp_path, obj_path)
+        stat = os.stat(obj_path)
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO objects '
+                    '(digest, size, mtime, atime, checksums) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (
+                        digest,
+                        stat.st_size,
+                        stat.st_mtime,
+                        time.time(),
+                        json.dumps(checksums, sort_keys=True),
+                    ),
+                )
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO urls '
+                    '(url, digest, etag, last_modified) VALUES (?, ?, ?, ?)',
+                    (
+                        url,
+                        digest,
+                        headers.get('etag'),
+                        headers.get('last-modified'),
+                    ),
+                )
+
+    def _copy_out(self, digest, dest_path):
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        _copy_out(self._object_path(digest), dest_path)
+
+    def fetch(self, url, dest_path, verify=True, checksums=None):
+        """
+        Gets the given url into dest_path, from the cache if the server says
+        that it did not change since it was cached.
+
+        :param url: Url to download
+        :param dest_path: Path to put the file at
+        :param verify: If False, will not check the ssl certificates
+        :param checksums: Expected checksums of the file, if known
+        :returns: the checksums of the file, as returned by
+            `repoman.common.utils.hash_file`
+        """
+        cached = self._lookup(url)
+        headers = {}
+        if cached is not None:
+            _, etag, last_modified, _ = cached
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        tmp_fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir)
+        os.close(tmp_fd)
+        try:
+            got_checksums, response_headers = download(
+                url,
+                tmp_path,
+                verify=verify,
+                progress=False,
+                headers=headers,
+                checksums=checksums,
+            )
+            self._store(url, tmp_path, got_checksums, response_headers)
+        except NotModified:
+            logger.info('Using cached %s', url)
+            digest, _, _, got_checksums = cached
+            self._touch(digest)
+        else:
+            digest = got_checksums['sha256']
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self._copy_out(digest, dest_path)
+        self.evict()
+        return got_checksums
+
+    def evict(self):
+        """
+        Removes the least recently used files until the cache is under the
+        maximum size
+        """
+        with self._lock:
+            total = self._conn.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM objects'
+            ).fetchone()[0]
+            if total <= self.max_size:
+                return
+            candidates = self._conn.execute(
+                'SELECT digest, size FROM objects ORDER BY atime'
+            ).fetchall()
+        for digest, size in candidates:
+            if total <= self.max_size:
+                break
+            logger.debug('Evicting %s from the download cache', digest)
+            self._drop_object(digest)
+            total -= size
+
+
+_CACHE = SharedCache(DownloadCache)
+configure_from_config = _CACHE.configure_from_config
+get_cache = _CACHE.get_cache
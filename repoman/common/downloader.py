@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+"""
+Helper to download all the remote artifacts of a source at once, reusing the
+connections to the same hosts and limiting how many downloads are done at the
+same time, in total and for each host.
+"""
+import logging
+import os
+import tempfile
+import threading
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+from six.moves.urllib.parse import urlparse
+
+from . import download_cache
+from .utils import download
+
+
+logger = logging.getLogger(__name__)
+
+
+def is_url(path):
+    return path.startswith('http:') or path.startswith('https:')
+
+
+# checksums published by the sources for the urls they return, and the ones
+# calculated for the downloaded files, shared by all the threads
+_EXPECTED_CHECKSUMS = {}
+_DOWNLOADED_CHECKSUMS = {}
+
+
+def expect_checksums(url, checksums):
+    """
+    Registers the checksums that the file at the given url must have, for
+    the sources that know them beforehand
+
+    :param url: Url of the artifact
+    :param checksums: dict of algorithm and hex digest
+    """
+    _EXPECTED_CHECKSUMS[url] = checksums
+
+
+def get_downloaded_checksums(path):
+    """
+    Returns the checksums calculated while downloading the file at the given
+    local path, or None if it was not downloaded
+    """
+    return _DOWNLOADED_CHECKSUMS.get(path)
+
+
+# local paths already given to downloads, shared by all the threads
+_USED_PATHS = set()
+_PATHS_LOCK = threading.Lock()
+
+
+def get_temp_path(temp_dir, url):
+    """
+    Gets a path in the given dir to download the given url to, with the same
+    file name, that is not used by any other download
+
+    :param temp_dir: Directory to download the file to
+    :param url: Url to download
+    """
+    name = url.rsplit('/', 1)[-1]
+    if not name:
+        raise Exception('Passed trailing slash in path %s, '
+                        'unable to guess package name'
+                        % url)
+    path = os.path.join(temp_dir, name)
+    with _PATHS_LOCK:
+        # different urls can have the same file name (for example the same
+        # noarch package built in different jobs), and the same url can be
+        # downloaded by several sources at the same time, don't overwrite
+        # them
+        if path in _USED_PATHS:
+            path = os.path.join(tempfile.mkdtemp(dir=temp_dir), name)
+        _USED_PATHS.add(path)
+    return path
+
+
+def fetch(url, dest_path, verify=True, progress=True):
+    """
+    Downloads the given url, through the download cache if it's enabled,
+    checking the expected checksums if any
+
+    :param url: Url to download
+    :param dest_path: Path to save the file to
+    :param verify: If False, will not check the ssl certificates
+    :param progress: If False, will not show the progress bar
+    """
+    cache = download_cache.get_cache()
+    expected = _EXPECTED_CHECKSUMS.get(url)
+    if cache is None:
+        checksums, _ = download(
+            url,
+            dest_path,
+            verify=verify,
+            progress=progress,
+            checksums=expected,
+        )
+    else:
+        checksums = cache.fetch(
+            url, dest_path, verify=verify, checksums=expected,
+        )
+    if checksums:
+        _DOWNLOADED_CHECKSUMS[dest_path] = checksums
+
+
+class DownloadManager(object):
+    """
+    Downloads urls into a temporary dir using a pool of workers, all of them
+    use the process wide session from `repoman.common.http_client`.
+    """
+    def __init__(self, temp_dir, workers=1, per_host=0, verify_ssl=True,
+                 max_pending=0):
+        """
+        :param temp_dir: Directory to download the files to, the caller
+            should take care of creating and deleting it
+        :param workers: Maximum number of downloads at the same time
+        :param per_host: Maximum number of downloads at the same time from
+            the same host, 0 for no limit
+        :param verify_ssl: If False, will not check the ssl certificates
+        :param max_pending: Maximum number of downloads started ahead of the
+            one the caller is waiting for when using `iter_download`, at
+            least the number of workers, the files already downloaded don't
+            count
+        """
+        self.temp_dir = temp_dir
+        self.workers = max(workers, 1)
+        self.per_host = per_host
+        self.verify_ssl = verify_ssl
+        self.max_pending = max(max_pending, self.workers)
+        self._host_limits = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            temp_dir=config.get('temp_dir'),
+            workers=config.getint('download_workers'),
+            per_host=config.getint('download_workers_per_host'),
+            verify_ssl=config.getboolean('verify_ssl'),
+            max_pending=config.getint('pending_downloads'),
+        )
+
+    def _host_limit(self, url):
+        if not self.per_host:
+            return None
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(
+                    self.per_host
+                )
+            return self._host_limits[host]
+
+    def _dest_path(self, url):
+        return get_temp_path(self.temp_dir, url)
+
+    def _download(self, task):
+        url, dest_path = task
+        host_limit = self._host_limit(url)
+        if host_limit is not None:
+            host_limit.acquire()
+        try:
+            fetch(
+                url,
+                dest_path,
+                verify=self.verify_ssl,
+                progress=self.workers == 1,
+            )
+        finally:
+            if host_limit is not None:
+                host_limit.release()
+        return dest_path
+
+    def download_all(self, paths):
+        """
+        Downloads all the urls in the given paths, concurrently.
+
+        :param paths: Iterable of paths or urls, anything that's not an url
+            is ignored
+        :returns: dict with the local path for each of the downloaded urls
+        """
+        urls = sorted(set(path for path in paths if is_url(path)))
+        if not urls:
+            return {}
+        tasks = [(url, self._dest_path(url)) for url in urls]
+        logger.info(
+            'Downloading %d artifacts with %d workers',
+            len(tasks),
+            min(self.workers, len(tasks)),
+        )
+        if self.workers > 1 and len(tasks) > 1:
+            pool = ThreadPool(min(self.workers, len(tasks)))
+            try:
+                local_paths = pool.map(self._download, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            local_paths = [self._download(task) for task in tasks]
+        return dict(zip(urls, local_paths))
+
+    def iter_download(self, paths):
+        """
+        Downloads the urls in the given paths concurrently, yielding each of
+        them with its local path as soon as it's downloaded, in the same
+        order.
+
+        The paths are consumed as needed, so it can be a generator that is
+        still expanding the sources, and no more than `max_pending`
+        downloads are started ahead of the path being yielded, so the
+        downloads don't get too far ahead of a slow caller. The downloaded
+        files are not removed, the caller owns them.
+
+        :param paths: Iterable of paths or urls, the paths that are not urls
+            are their own local path
+        :returns: iterator of (path, local_path) tuples
+        """
+        pool = ThreadPool(self.workers)
+        pending = deque()
+        downloaded = {}
+        try:
+            for path in paths:
+                if is_url(path) and path not in downloaded:
+                    if not downloaded:
+                        logger.info(
+                            'Downloading artifacts with %d workers',
+                            self.workers,
+                        )
+                    downloaded[path] = pool.apply_async(
+                        self._download,
+                        ((path, self._dest_path(path)), ),
+                    )
+                pending.append(path)
+                while len(pending) > self.max_pending:
+                    path = pending.popleft()
+                    yield path, self._get_local_path(path, downloaded)
+            while pending:
+                path = pending.popleft()
+                yield path, self._get_local_path(path, downloaded)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    @staticmethod
+    def _get_local_path(path, downloaded):
+        if path not in downloaded:
+            return path
+        return downloaded[path].get()
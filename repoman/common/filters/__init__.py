@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 import logging
+from functools import partial
 from abc import (
     ABCMeta,
     abstractmethod,
@@ -7,6 +8,7 @@ from abc import (
 )
 
 
+from ..stores import get_name_key
 from ..utils import get_plugins
 
 
@@ -25,6 +27,13 @@ class ArtifactFilter(object):
             if name != 'ArtifactFilter':
                 FILTERS[name] = cls
 
+    # if the filter checks the artifacts already in the stores of the repo,
+    # then nothing can be added to them while it's being applied
+    READS_REPO = False
+    # if the filter selects among the artifacts with the same name (like
+    # latest), the name filters after it can't be applied before it
+    SELECTS_PER_NAME = False
+
     def __init__(self, config, stores):
         self.stores = stores
         self.config = config
@@ -45,14 +54,107 @@ class ArtifactFilter(object):
         pass
 
     @abstractmethod
-    def filter(self, filter_str, art_list):
+    def compile(self, filters_str):
+        """
+        Gets the operator for the first filter of filters_str, if it's one
+        this filter handles
+
+        :param filters_str: string with the filter or filters to apply
+        :returns: tuple with the operator, a function that gets an iterable
+            of artifacts and returns an iterable with the ones that pass the
+            filter, and the rest of filters_str, or (None, filters_str) if
+            the first filter is not handled by this one
+        """
+        pass
+
+    def filter(self, filters_str, art_list):
         """
         Filters the given art_list according to filter_str and config
 
         :param filter_str: string with the filter or filters to apply
         :param art_list: list of expanded artifacts
+        :returns: tuple with the rest of filters_str and the set of artifacts
+            that passed the filter
         """
-        pass
+        operator, rest = self.compile(filters_str)
+        if operator is None:
+            return filters_str, art_list
+        if self.SELECTS_PER_NAME:
+            art_list = sorted(
+                art_list,
+                key=partial(get_name_key, stores=self.stores),
+            )
+        return rest, set(operator(art_list))
+
+    def iter_latest(self, artifacts, num=1):
+        """
+        Yields the artifacts in the latest num versions of each name, for the
+        filters that have to compare them, as soon as all the artifacts with
+        that name were seen.
+
+        The artifacts are expected to come together by name, as sorted by
+        `repoman.common.stores.get_name_key`, so the artifacts of each name
+        are released when the next name starts, instead of keeping the
+        metadata of all of them until the end. Only the metadata of the
+        versions that passed is kept after that, so if a name shows up again
+        the new versions are compared with those, though the ones already
+        passed can't be taken back.
+
+        :param artifacts: iterable of artifact paths or urls
+        :param num: number of newest versions to pass for each name
+        """
+        temp_stores = [store.get_empty_copy() for store in self.stores]
+        group = None
+        pending = []
+        released = set()
+        passed = set()
+        for path in artifacts:
+            for store in temp_stores:
+                if store.handles_artifact(path):
+                    break
+            else:
+                continue
+            name_key = get_name_key(path, [store])[0]
+            if name_key != group:
+                for artifact in self._release(
+                    pending, num, released, passed
+                ):
+                    yield artifact
+                pending = []
+                group = name_key
+            artifact = store.add_artifact(path, metadata_only=True)
+            if artifact is not None and (store, artifact.name) not in pending:
+                pending.append((store, artifact.name))
+        for artifact in self._release(pending, num, released, passed):
+            yield artifact
+
+    @staticmethod
+    def _release(pending, num, released, passed):
+        for store, name in pending:
+            art_name = store.artifacts.get(name)
+            if not art_name:
+                continue
+            for version in (art_name.get_latest(num=num) or {}).values():
+                for artifact in version.get_artifacts():
+                    if artifact.path in passed:
+                        continue
+                    if (store, name) in released:
+                        logger.warn(
+                            'The artifacts of %s did not come together, '
+                            'more than %d versions of it might pass: %s',
+                            name,
+                            num,
+                            artifact.path,
+                        )
+                    passed.add(artifact.path)
+                    yield artifact
+            # keep only the ones that passed, to compare with if the name
+            # shows up again
+            store.forget_versions([
+                (name, version)
+                for version in art_name.get_all_but_latest(num=num)
+            ])
+            released.add((store, name))
 
 
 # Force the load of all the plugins
@@ -9,6 +9,7 @@ Get's the latest N rpms (1 by default)
 """
 import re
 import logging
+from functools import partial
 
 from . import ArtifactFilter
 from ..utils import split
@@ -22,27 +23,22 @@ class LatestFilter(ArtifactFilter):
 
     DEFAULT_CONFIG = {}
     CONFIG_SECTION = 'LatestFilter'
+    SELECTS_PER_NAME = True
 
-    def filter(self, filters_str, art_list):
+    def compile(self, filters_str):
         match = re.match(r'latest(=(?P<num>\d+))?(:.*)?$', filters_str)
-        if not match or not art_list:
-            return filters_str, art_list
-        filters_str = split(filters_str, ':', 1)[-1]
-        latest = match.groupdict().get('num', 1) or 1
-        stores = [store.get_empty_copy() for store in self.stores]
-        # populate the stores with the artifacts
-        for artifact in art_list:
-            for store in stores:
-                if store.handles_artifact(artifact):
-                    store.add_artifact(artifact)
-                    # only add it to the first matching store
-                    break
-        # gather the latest artifacts from each store
-        filtered_arts = set()
-        for store in stores:
-            filtered_arts = filtered_arts.union(
-                art.path for art in store.get_latest(num=int(latest))
-            )
-        for artifact in filtered_arts:
-            logger.debug("Passed the filter: %s", artifact)
-        return (filters_str, filtered_arts)
+        if not match:
+            return None, filters_str
+        latest = int(match.groupdict().get('num', 1) or 1)
+        return (
+            partial(self.get_latest, num=latest),
+            split(filters_str, ':', 1)[-1],
+        )
+
+    def get_latest(self, artifacts, num):
+        """
+        Yields the latest num versions of each name from the given artifacts
+        """
+        for artifact in self.iter_latest(artifacts, num=num):
+            logger.debug("Passed the filter: %s", artifact.path)
+            yield artifact.path
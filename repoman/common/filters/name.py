@@ -10,26 +10,71 @@ Filter packges by file name, for example::
 
 Will match all the packages in that url that have vdsm.* as name (will not
 match any previous path in the url)
+
+The name filters before any latest or only-missing filter are also passed to
+the sources, so they can skip the artifacts that don't match while they are
+expanded instead of listing all of them first.
 """
 import re
 from . import ArtifactFilter
 from ..utils import split
 
 
+NAME_FILTER_REGEX = re.compile(r'(?:^|:)name~([^:]*)')
+
+
+class NameMatch(object):
+    """
+    Predicate that tells if an artifact passes all the name filters of a
+    source string, and counts how many were checked, so the caller can tell
+    a source that did not match the source string from one whose artifacts
+    were all filtered out.
+    """
+    def __init__(self, patterns):
+        """
+        :param patterns: Regular expressions of the name filters
+        """
+        self.patterns = patterns
+        self.name_regs = [re.compile(pattern) for pattern in patterns]
+        self.checked = 0
+
+    def __call__(self, path):
+        self.checked += 1
+        file_name = path.rsplit('/', 1)[-1]
+        return all(name_reg.match(file_name) for name_reg in self.name_regs)
+
+    def filter(self, artifacts):
+        """
+        Yields the given artifacts that pass the name filters
+        """
+        return (path for path in artifacts if self(path))
+
+
 class NameFilter(ArtifactFilter):
     __doc__ = __doc__
 
     DEFAULT_CONFIG = {}
     CONFIG_SECTION = 'NameFilter'
 
-    def filter(self, filters_str, art_list):
-        filtered_arts = set()
-        if filters_str.startswith('name~'):
-            name_reg, filters_str = split(filters_str, ':', 1)
-            name_match = re.compile(name_reg.split('~', 1)[-1])
-            for art in art_list:
-                if name_match.match(art.rsplit('/', 1)[-1]):
-                    filtered_arts.add(art)
-            return filters_str, filtered_arts
-        else:
-            return filters_str, art_list
+    @staticmethod
+    def get_name_match(source_str):
+        """
+        Gets the name filters from a full source string, to apply them while
+        expanding the source.
+
+        Only the name filters before any filter that selects per name (like
+        latest) must be passed, as the name filters match the version too,
+        see `repoman.common.parser.Parser.get_name_match`.
+
+        :returns: `NameMatch` instance, or None if there are no name filters
+        """
+        patterns = NAME_FILTER_REGEX.findall(source_str)
+        if not patterns:
+            return None
+        return NameMatch(patterns)
+
+    def compile(self, filters_str):
+        if not filters_str.startswith('name~'):
+            return None, filters_str
+        name_reg, filters_str = split(filters_str, ':', 1)
+        return NameMatch([name_reg.split('~', 1)[-1]]).filter, filters_str
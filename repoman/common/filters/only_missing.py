@@ -24,51 +24,47 @@ class OnlyMissingFilter(ArtifactFilter):
 
     DEFAULT_CONFIG = {}
     CONFIG_SECTION = 'OnlyMissingFilter'
+    READS_REPO = True
+    SELECTS_PER_NAME = True
 
-    def filter(self, filters_str, art_list):
-        if not filters_str.endswith('only-missing') or not art_list:
-            return filters_str, art_list
-        filters_str = split(filters_str, ':', 1)[-1]
-        temp_stores = [store.get_empty_copy() for store in self.stores]
-        # populate the stores with the artifacts
-        for artifact_path in art_list:
-            for store in temp_stores:
-                if store.handles_artifact(artifact_path):
-                    store.add_artifact(artifact_path)
-                    # only add it to the first matching store
-                    break
-        # gather the latest artifacts from each store
-        filtered_art_paths = set()
+    def compile(self, filters_str):
+        if split(filters_str, ':', 1)[0] != 'only-missing':
+            return None, filters_str
+        return self.get_missing, split(filters_str, ':', 1)[-1]
+
+    def get_missing(self, artifacts):
+        """
+        Yields the latest version of each name from the given artifacts, if
+        there's none with that name in the repo already
+        """
         filtered_art_names = set()
-        for tmp_store in temp_stores:
-            for artifact in tmp_store.get_latest(num=1):
-                if artifact.name in filtered_art_names:
-                    logger.debug(
-                        "Did not pass the filter, already checked: %s",
-                        artifact,
-                    )
-                    continue
+        for artifact in self.iter_latest(artifacts, num=1):
+            if artifact.name in filtered_art_names:
+                logger.debug(
+                    "Did not pass the filter, already checked: %s",
+                    artifact,
+                )
+                continue
 
-                def same_name(art1):
-                    return art1.name == artifact.name
+            def same_name(art1):
+                return art1.name == artifact.name
 
-                already_in_dst_store = [
-                    store.get_latest(
-                        fmatch=same_name,
-                        num=1,
-                    )
-                    for store in self.stores
-                ]
-                if any(already_in_dst_store):
-                    logger.debug(
-                        (
-                            "Did not pass the filter, already in the "
-                            "destination: %s",
-                        ),
-                        artifact
-                    )
-                else:
-                    filtered_art_paths.add(artifact.path)
-                    filtered_art_names.add(artifact.name)
-                    logger.debug("Passed the filter: %s", artifact)
-        return (filters_str, filtered_art_paths)
+            already_in_dst_store = [
+                store.get_latest(
+                    fmatch=same_name,
+                    num=1,
+                )
+                for store in self.stores
+            ]
+            if any(already_in_dst_store):
+                logger.debug(
+                    (
+                        "Did not pass the filter, already in the "
+                        "destination: %s",
+                    ),
+                    artifact
+                )
+            else:
+                filtered_art_names.add(artifact.name)
+                logger.debug("Passed the filter: %s", artifact)
+                yield artifact.path
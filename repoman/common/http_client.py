@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""
+Process wide HTTP client.
+
+All the sources, filters and downloads make their requests through the same
+`requests.Session`, so the connections to the same host are kept alive and
+reused instead of doing a new TCP (and TLS) handshake for every page or
+artifact.
+
+Index pages are requested compressed (requests asks for gzip by default),
+while the artifacts are requested as they are (see `RAW_HEADERS`), as they
+are already compressed and byte ranges must refer to the actual file.
+"""
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+logger = logging.getLogger(__name__)
+
+# headers to use when getting the artifacts themselves
+RAW_HEADERS = {'Accept-Encoding': 'identity'}
+
+_SETTINGS = {
+    'pool_connections': 10,
+    'pool_maxsize': 10,
+    'verify': True,
+}
+_SESSION = None
+_LOCK = threading.Lock()
+
+
+def configure(pool_connections=None, pool_maxsize=None, verify_ssl=None):
+    """
+    Changes the settings of the client, if the session was already created,
+    it will be recreated on the next request.
+
+    :param pool_connections: Number of hosts to keep connection pools for
+    :param pool_maxsize: Maximum number of connections to keep for each host,
+        should be at least the number of threads using the same host
+    :param verify_ssl: Default value to check the ssl certificates with
+    """
+    global _SESSION
+    with _LOCK:
+        if pool_connections is not None:
+            _SETTINGS['pool_connections'] = pool_connections
+        if pool_maxsize is not None:
+            _SETTINGS['pool_maxsize'] = pool_maxsize
+        if verify_ssl is not None:
+            _SETTINGS['verify'] = verify_ssl
+        if _SESSION is not None:
+            _SESSION.close()
+            _SESSION = None
+
+
+def configure_from_config(config):
+    """
+    Configures the client from the main repoman configuration
+
+    :param config: `repoman.common.config.Config` instance
+    """
+    configure(
+        pool_connections=config.getint('http_pool_hosts'),
+        pool_maxsize=max(
+            config.getint('http_pool_size'),
+            config.getint('download_workers'),
+            config.getint('source_workers'),
+        ),
+        verify_ssl=config.getboolean('verify_ssl'),
+    )
+
+
+def get_session():
+    """
+    Returns the shared session, creating it if needed
+    """
+    global _SESSION
+    with _LOCK:
+        if _SESSION is None:
+            _SESSION = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=_SETTINGS['pool_connections'],
+                pool_maxsize=_SETTINGS['pool_maxsize'],
+            )
+            _SESSION.mount('http://', adapter)
+            _SESSION.mount('https://', adapter)
+        return _SESSION
+
+
+def request(method, url, **kwargs):
+    """
+    Makes a request with the shared session, with the same parameters as
+    `requests.request`, using the configured ssl verification by default
+    """
+    kwargs.setdefault('verify', _SETTINGS['verify'])
+    return get_session().request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def head(url, **kwargs):
+    kwargs.setdefault('allow_redirects', False)
+    return request('HEAD', url, **kwargs)
+
+
+def get_stats():
+    """
+    Returns the connection reuse statistics of the shared session
+
+    :returns: dict with the number of requests and new connections done for
+        each host
+    """
+    stats = {}
+    with _LOCK:
+        if _SESSION is None:
+            return stats
+        adapters = set(_SESSION.adapters.values())
+    for adapter in adapters:
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host_stats = stats.setdefault(
+                '%s://%s:%s' % (pool.scheme, pool.host, pool.port),
+                {'requests': 0, 'connections': 0},
+            )
+            host_stats['requests'] += pool.num_requests
+            host_stats['connections'] += pool.num_connections
+    return stats
+
+
+def log_stats():
+    for host, host_stats in sorted(get_stats().items()):
+        logger.debug(
+            'HTTP %s: %d requests over %d connections',
+            host,
+            host_stats['requests'],
+            host_stats['connections'],
+        )
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+"""
+This module holds the persistent metadata index of a repository.
+
+Inspecting the artifacts (mainly reading the rpm headers) is the most
+expensive part of loading a big repository, so the metadata extracted from
+each file is stored in a small sqlite database, one table per store, keyed by
+the path of the file and validated with its stat info (inode, size and
+mtime)::
+
+    key (path) | validator (inode:size:mtime) | data (json metadata)
+
+Any file that changed since it was indexed will be inspected again, and the
+entries for the files that are not there anymore are pruned.
+"""
+import json
+import logging
+import os
+import re
+import sqlite3
+
+import six
+
+
+logger = logging.getLogger(__name__)
+
+
+def stat_validator(stat):
+    """
+    Generates the string used to check if an index entry is still valid for a
+    file
+
+    :param stat: stat result for the file, as returned by `os.stat`
+    """
+    return '%d:%d:%.6f' % (stat.st_ino, stat.st_size, stat.st_mtime)
+
+
+def _to_native(value):
+    """
+    The json module returns unicode strings on python 2, convert them back to
+    native strings so the loaded artifacts are the same as the parsed ones
+    """
+    if isinstance(value, dict):
+        return dict(
+            (_to_native(key), _to_native(val))
+            for key, val in six.iteritems(value)
+        )
+    if six.PY2 and isinstance(value, six.text_type):
+        return value.encode('utf-8')
+    return value
+
+
+def _decode(data):
+    return _to_native(json.loads(data))
+
+
+class ArtifactIndex(object):
+    """
+    Persistent key -> metadata store, where each entry is only valid while
+    the validator string passed when reading it matches the one it was
+    stored with.
+    """
+    def __init__(self, path, table):
+        """
+        :param path: Path to the index file, will be created if it does not
+            exist
+        :param table: Name of the table to use, usually one per store
+        """
+        if not re.match(r'^\w+$', table):
+            raise ValueError('Invalid index table name %s' % table)
+        self.path = path
+        self.table = table
+        self._conn = sqlite3.connect(path, timeout=60)
+        self._conn.text_factory = str
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS %s ('
+            'key TEXT PRIMARY KEY, validator TEXT, data TEXT)' % table
+        )
+        self._entries = dict(
+            (key, (validator, data))
+            for key, validator, data in self._conn.execute(
+                'SELECT key, validator, data FROM %s' % table
+            )
+        )
+        self._seen = set()
+        self._updated = {}
+
+    @classmethod
+    def from_config(cls, config, repo_path, table):
+        """
+        Opens the index configured with the `metadata_index` option, relative
+        paths are taken from the repo root.
+
+        :returns: the index instance, or None if not configured or it could
+            not be opened
+        """
+        index_path = config.get('metadata_index', '')
+        if not index_path or not repo_path:
+            return None
+        if not os.path.isabs(index_path):
+            index_path = os.path.join(repo_path, index_path)
+        try:
+            if not os.path.exists(os.path.dirname(index_path)):
+                os.makedirs(os.path.dirname(index_path))
+            return cls(index_path, table)
+        except (OSError, sqlite3.Error) as error:
+            logger.warn(
+                'Unable to open the metadata index %s, ignoring it: %s',
+                index_path,
+                error,
+            )
+            return None
+
+    def get(self, key, validator):
+        """
+        Returns the stored metadata for the given key, or None if there's no
+        entry for it or it's not valid anymore.
+        """
+        self._seen.add(key)
+        stored_validator, data = self._entries.get(key, (None, None))
+        if stored_validator != validator:
+            return None
+        try:
+            return _decode(data)
+        except ValueError:
+            logger.debug('Ignoring corrupted index entry for %s', key)
+            return None
+
+    def set(self, key, validator, metadata):
+        """
+        Stores the given metadata for the key, it will be persisted on the
+        next commit
+        """
+        self._seen.add(key)
+        data = json.dumps(metadata, sort_keys=True)
+        self._entries[key] = (validator, data)
+        self._updated[key] = (validator, data)
+
+    def prune(self):
+        """
+        Removes all the entries that were not requested or set since the
+        index was opened
+        """
+        stale = [key for key in self._entries if key not in self._seen]
+        for key in stale:
+            self._entries.pop(key)
+        if stale:
+            logger.debug('Pruning %d stale index entries', len(stale))
+            self._conn.executemany(
+                'DELETE FROM %s WHERE key = ?' % self.table,
+                ((key,) for key in stale),
+            )
+
+    def commit(self):
+        """
+        Persists all the changes made to the index
+        """
+        try:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO %s (key, validator, data) '
+                'VALUES (?, ?, ?)' % self.table,
+                (
+                    (key, validator, data)
+                    for key, (validator, data) in six.iteritems(self._updated)
+                ),
+            )
+            self._conn.commit()
+        except sqlite3.Error as error:
+            logger.warn(
+                'Unable to update the metadata index %s: %s',
+                self.path,
+                error,
+            )
+        self._updated = {}
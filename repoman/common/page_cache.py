@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+"""
+Persistent cache for the pages fetched when expanding the sources.
+
+Instead of the pages themselves, it keeps what was extracted from them (the
+list of links of an index page, the json of a Jenkins build...) along with
+the ETag and Last-Modified headers the server sent::
+
+    pages: url | etag | last_modified | immutable | atime | data
+
+When a cached page is requested again, a conditional request is done, and if
+the server says it did not change, the stored data is returned without
+downloading nor parsing the page again. Pages marked as immutable (like the
+ones of finished Jenkins builds) are not requested again at all.
+
+The entries not used in `MAX_UNUSED_DAYS` are removed.
+"""
+import json
+import logging
+import time
+
+import six
+
+from . import http_client
+from .sqlite_cache import SharedCache, SqliteCache
+
+
+logger = logging.getLogger(__name__)
+MAX_UNUSED_DAYS = 30
+
+
+def _to_native(value):
+    """
+    The json module returns unicode strings on python 2, convert them back to
+    native strings, so the cached data is the same as the freshly parsed one
+    """
+    if isinstance(value, dict):
+        return dict(
+            (_to_native(key), _to_native(val))
+            for key, val in six.iteritems(value)
+        )
+    if isinstance(value, list):
+        return [_to_native(val) for val in value]
+    if six.PY2 and isinstance(value, six.text_type):
+        return value.encode('utf-8')
+    return value
+
+
+class PageCache(SqliteCache):
+    CONFIG_OPTION = 'page_cache'
+
+    def __init__(self, path):
+        """
+        :param path: Path to the cache database, the directory will be
+            created if it does not exist
+        """
+        super(PageCache, self).__init__(path)
+        self._open_db(
+            path,
+            'CREATE TABLE IF NOT EXISTS pages ('
+            'url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, '
+            'immutable INTEGER, atime REAL, data TEXT)',
+        )
+        with self._conn:
+            self._conn.execute(
+                'DELETE FROM pages WHERE atime < ?',
+                (time.time() - MAX_UNUSED_DAYS * 24 * 3600, ),
+            )
+
+    def lookup(self, url):
+        """
+        :returns: tuple with the etag, last modified date, immutable flag and
+            data stored for the url, or None if not cached
+        """
+        with self._lock:
+            entry = self._conn.execute(
+                'SELECT etag, last_modified, immutable, data FROM pages '
+                'WHERE url = ?',
+                (url, ),
+            ).fetchone()
+        if entry is None:
+            return None
+        etag, last_modified, immutable, data = entry
+        return (
+            etag,
+            last_modified,
+            bool(immutable),
+            _to_native(json.loads(data)),
+        )
+
+    def touch(self, url):
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    'UPDATE pages SET atime = ? WHERE url = ?',
+                    (time.time(), url),
+                )
+
+    def store(self, url, headers, data, immutable=False):
+        """
+        :param url: Url of the page
+        :param headers: Headers of the response
+        :param data: Data extracted from the page, anything that can be
+            serialized to json
+        :param immutable: If True, the page will never be requested again
+        """
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO pages '
+                    '(url, etag, last_modified, immutable, atime, data) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (
+                        url,
+                        headers.get('etag'),
+                        headers.get('last-modified'),
+                        int(immutable),
+                        time.time(),
+                        json.dumps(data),
+                    ),
+                )
+
+
+_CACHE = SharedCache(PageCache)
+configure_from_config = _CACHE.configure_from_config
+get_cache = _CACHE.get_cache
+
+
+def fetch_parsed(url, parse, immutable=None, http=None):
+    """
+    Fetches the given page and returns the data extracted from it, going
+    through the cache if it's enabled.
+
+    :param url: Url of the page
+    :param parse: Function that gets the response and returns the data
+        extracted from it, it must be serializable to json. On python 2 the
+        unicode strings in it are returned as native strings, as when read
+        from the cache
+    :param immutable: Function that gets the extracted data and returns True
+        if the page will never change
+    :param http: Object to do the request with, the shared
+        `repoman.common.http_client` by default
+    :raises requests.exceptions.RequestException: if the page could not be
+        fetched
+    """
+    http = http or http_client
+    cache = get_cache()
+    if cache is None:
+        response = http.get(url, stream=True)
+        cached = None
+    else:
+        cached = cache.lookup(url)
+        headers = {}
+        if cached is not None:
+            etag, last_modified, is_immutable, data = cached
+            if is_immutable:
+                logger.debug('Using cached immutable page %s', url)
+                cache.touch(url)
+                return data
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        response = http.get(url, stream=True, headers=headers)
+    try:
+        if cached is not None and response.status_code == 304:
+            logger.debug('Using cached page %s', url)
+            cache.touch(url)
+            return cached[-1]
+        if not response.ok:
+            response.raise_for_status()
+        data = _to_native(parse(response))
+        if cache is not None:
+            cache.store(
+                url,
+                response.headers,
+                data,
+                immutable=bool(immutable and immutable(data)),
+            )
+        return data
+    finally:
+        response.close()
@@ -10,10 +10,13 @@ For each source, it will be expanded, and filtered. An example::
 
 """
 import logging
+from functools import partial
+
 from . import (
     sources,
     filters,
 )
+from .stores import get_name_key
 
 
 logger = logging.getLogger(__name__)
@@ -58,50 +61,80 @@ class Parser(object):
 
     def parse(self, full_source_str):
         """
-        Parses the given source sting and returns a list of resolved artifact
-        paths
+        Parses the given source sting and returns an iterator over the
+        resolved artifact paths.
+
+        The source is expanded right away, but the filters are applied while
+        the artifacts are consumed, so the ones that pass can be used before
+        the rest are filtered. The artifacts are sorted so the ones with the
+        same name come together (see `repoman.common.stores.get_name_key`),
+        and the filters that select per name release each name as soon as
+        the next one starts.
 
         :param full_source_str: Source sting to parse
         :type full_source_str: Sting
-        :rtype: list of strings
+        :rtype: iterator of strings
         """
         art_list = set()
+        operators = []
         for stuple in self.sources.iteritems():
             aname = stuple[0]
             source = stuple[1]
             source_str = full_source_str
             logger.debug('Checking source %s with %s', aname, source_str)
-            result = source.expand(source_str)
-            filters_str = result[0]
-            art_list = result[1]
-            if not art_list:
+            name_match = self.get_name_match(full_source_str)
+            filters_str, art_list = source.expand(
+                source_str,
+                name_match=name_match,
+            )
+            # if the name filters were checked, the source matched even if
+            # all its artifacts were filtered out
+            pushed_down = name_match is not None and name_match.checked
+            if not art_list and not pushed_down:
                 # if no artifacts for this source type, try next
                 continue
 
-            # check if there were any filters in the source definition, finish
-            # if not
-            if not filters_str:
-                break
-
-            # check all the filters until finished or we can't resolve any more
-            # of the filters strings
-            prev_filters_str = ''
-            while filters_str and filters_str != prev_filters_str:
-                prev_filters_str = filters_str
-                for fname, fclass in self.filters.iteritems():
-                    logger.info('Filtering filter %s with %s',
-                                filters_str, fname)
-                    result = fclass.filter(
-                        filters_str,
-                        art_list,
-                    )
-                    filters_str, art_list = result
-                if not filters_str:
+            operators = self.compile_filters(filters_str)
+            applied_names = []
+            for fname, filter_str, _ in operators:
+                if self.filters[fname].SELECTS_PER_NAME:
                     break
+                if fname == 'NameFilter':
+                    applied_names.append(filter_str.split('~', 1)[-1])
+            if (
+                pushed_down
+                and sorted(applied_names) != sorted(name_match.patterns)
+            ):
+                # the filters chain will not apply the same name filters
+                # before selecting per name that were passed to the source, do
+                # it the long way
+                logger.debug(
+                    'Name filters not applied as expected for %s, '
+                    'expanding again',
+                    source_str,
+                )
+                filters_str, art_list = source.expand(source_str)
+                operators = self.compile_filters(filters_str)
             # We skip all other sources if we found the matching one
             break
 
-        if not art_list:
+        art_list = sorted(
+            art_list,
+            key=partial(get_name_key, stores=self.stores.values()),
+        )
+        return self._check_not_empty(
+            self.apply_filters(operators, art_list),
+            source_str,
+            full_source_str,
+        )
+
+    def _check_not_empty(self, artifacts, source_str, full_source_str):
+        num_artifacts = 0
+        for artifact in artifacts:
+            num_artifacts += 1
+            yield artifact
+
+        if not num_artifacts:
             empty_source_action = self.config.get('on_empty_source')
             msg = 'No artifacts found for source %s' % source_str
             if empty_source_action in ['fail', 'warn']:
@@ -110,8 +143,90 @@ class Parser(object):
                 raise Exception(msg)
 
         logging.debug(
-            'From source string %s got: %s',
+            'From source string %s got %d artifacts',
             full_source_str,
-            art_list
+            num_artifacts,
+        )
+
+    def get_name_match(self, full_source_str):
+        """
+        Gets the name filters to apply while expanding the given source, only
+        the ones before any filter that selects per name (like latest), as
+        those select among all the versions, and the name filters match the
+        version too
+
+        :param full_source_str: Source string to get the name filters from
+        :returns: `repoman.common.filters.name.NameMatch` instance, or None
+            if there are no name filters to apply
+        """
+        if 'NameFilter' not in self.filters:
+            return None
+        parts = full_source_str.split(':')
+        for index, part in enumerate(parts):
+            if any(
+                fclass.compile(part)[0] is not None
+                for fclass in self.filters.itervalues()
+                if fclass.SELECTS_PER_NAME
+            ):
+                parts = parts[:index]
+                break
+        return self.filters['NameFilter'].get_name_match(':'.join(parts))
+
+    def reads_repo(self, full_source_str):
+        """
+        Tells if any of the filters in the given source string checks the
+        artifacts already in the repo. As the filters are not separated from
+        the source until it's expanded, any part of it that looks like one of
+        those filters counts.
+
+        :param full_source_str: Source string to check
+        """
+        return any(
+            fclass.compile(part)[0] is not None
+            for part in full_source_str.split(':')
+            for fclass in self.filters.itervalues()
+            if fclass.READS_REPO
         )
-        return art_list
+
+    def compile_filters(self, filters_str):
+        """
+        Parses the given filters string into the filters to apply, in order
+
+        :param filters_str: string with the filters, as extracted from the
+            source string
+        :returns: list of tuples with the name of the filter, the part of the
+            filters string it handles and the operator to apply, see
+            `repoman.common.filters.ArtifactFilter.compile`
+        """
+        operators = []
+        while filters_str:
+            for fname, fclass in self.filters.iteritems():
+                operator, rest = fclass.compile(filters_str)
+                if operator is not None:
+                    break
+            else:
+                logger.warn('No filter matches %s, ignoring it', filters_str)
+                break
+            logger.debug('Got filter %s for %s', fname, filters_str)
+            operators.append((
+                fname,
+                filters_str[:len(filters_str) - len(rest)].rstrip(':'),
+                operator,
+            ))
+            filters_str = rest
+        return operators
+
+    @staticmethod
+    def apply_filters(operators, artifacts):
+        """
+        Chains the given filter operators over the artifacts, they are
+        evaluated lazily, so each artifact goes through the filters that
+        don't need to compare it with the rest as soon as it's got
+
+        :param operators: Filters to apply, as returned by `compile_filters`
+        :param artifacts: iterable of artifact paths or urls
+        :returns: iterable of the artifacts that passed all the filters
+        """
+        for _, _, operator in operators:
+            artifacts = operator(artifacts)
+        return artifacts
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+"""
+Persistent cache for the metadata of remote artifacts.
+
+When an artifact is only needed to decide if it has to be added (like in the
+latest or only-missing filters), only its headers are fetched, and the
+metadata extracted from them is kept here along with the ETag,
+Last-Modified and Content-Length of the url::
+
+    probes: url | etag | last_modified | length | atime | metadata
+
+When the same url is probed again, only a HEAD request is done, and if the
+headers did not change the stored metadata is used. Each url is checked only
+once per run. When there are more than the configured maximum of entries,
+the least recently used are removed.
+"""
+import json
+import logging
+import time
+
+from requests.exceptions import RequestException
+
+from . import http_client
+from .sqlite_cache import SharedCache, SqliteCache
+
+
+logger = logging.getLogger(__name__)
+# check the number of entries only every these many new ones
+EVICT_EVERY = 1000
+
+
+def _to_str(obj):
+    """
+    The metadata is stored as json, but the artifacts expect the same str
+    values as when it's read from the files
+    """
+    return dict(
+        (key, value.encode('utf-8') if isinstance(value, unicode) else value)
+        for key, value in obj.items()
+    )
+
+
+def get_validators(url, verify=True):
+    """
+    Gets the headers that tell if the file at the url changed
+
+    :returns: tuple with the etag, last modified date and length of the file,
+        or None if they could not be fetched or there's no etag nor last
+        modified date to compare
+    """
+    try:
+        response = http_client.head(url, verify=verify, allow_redirects=True)
+    except RequestException as error:
+        logger.debug('Unable to get the headers of %s: %s', url, error)
+        return None
+    if response.status_code != 200:
+        return None
+    etag = response.headers.get('etag')
+    last_modified = response.headers.get('last-modified')
+    if not etag and not last_modified:
+        return None
+    return etag, last_modified, response.headers.get('content-length')
+
+
+class ProbeCache(SqliteCache):
+    CONFIG_OPTION = 'probe_cache'
+
+    def __init__(self, path, max_entries):
+        """
+        :param path: Path to the cache database, the directory will be
+            created if it does not exist
+        :param max_entries: Maximum number of urls to keep
+        """
+        super(ProbeCache, self).__init__(path)
+        self.max_entries = max_entries
+        # urls already checked in this run
+        self._validated = {}
+        self._stored = 0
+        self._open_db(
+            path,
+            'CREATE TABLE IF NOT EXISTS probes ('
+            'url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT, '
+            'length TEXT, atime REAL, metadata TEXT)',
+        )
+        self.evict()
+
+    @classmethod
+    def get_options(cls, config):
+        return {'max_entries': config.getint('probe_cache_max_entries')}
+
+    def get(self, url, validators):
+        """
+        :param url: Url of the artifact
+        :param validators: Current validators of the url, as returned by
+            `get_validators`
+        :returns: the cached metadata, or None if not cached or the file
+            changed
+        """
+        with self._lock:
+            entry = self._conn.execute(
+                'SELECT etag, last_modified, length, metadata FROM probes '
+                'WHERE url = ?',
+                (url, ),
+            ).fetchone()
+            if entry is None or tuple(entry[:3]) != tuple(validators):
+                return None
+            with self._conn:
+                self._conn.execute(
+                    'UPDATE probes SET atime = ? WHERE url = ?',
+                    (time.time(), url),
+                )
+        return json.loads(entry[3], object_hook=_to_str)
+
+    def put(self, url, validators, metadata):
+        """
+        :param url: Url of the artifact
+        :param validators: Validators of the url when it was probed
+        :param metadata: Metadata of the artifact, serializable to json
+        """
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO probes '
+                    '(url, etag, last_modified, length, atime, metadata) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (url, ) + tuple(validators) + (
+                        time.time(),
+                        json.dumps(metadata),
+                    ),
+                )
+            self._stored += 1
+            evict = self._stored % EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def probe(self, url, probe_func, verify=True):
+        """
+        Gets the metadata of the given url from the cache, or calling
+        `probe_func(url)` if not cached or it changed
+
+        :param url: Url of the artifact
+        :param probe_func: Function that gets the metadata from the url
+        :param verify: If False, will not check the ssl certificates
+        """
+        with self._lock:
+            if url in self._validated:
+                return self._validated[url]
+        validators = get_validators(url, verify=verify)
+        metadata = None
+        if validators is not None:
+            metadata = self.get(url, validators)
+            if metadata is not None:
+                logger.debug('Using cached metadata for %s', url)
+        if metadata is None:
+            metadata = probe_func(url)
+            if metadata is not None and validators is not None:
+                self.put(url, validators, metadata)
+        with self._lock:
+            self._validated[url] = metadata
+        return metadata
+
+    def evict(self):
+        """
+        Removes the least recently used entries until there are no more than
+        the maximum
+        """
+        with self._lock:
+            with self._conn:
+                count = self._conn.execute(
+                    'SELECT COUNT(*) FROM probes'
+                ).fetchone()[0]
+                if count <= self.max_entries:
+                    return
+                logger.debug(
+                    'Evicting %d entries from the probe cache',
+                    count - self.max_entries,
+                )
+                self._conn.execute(
+                    'DELETE FROM probes WHERE url IN ('
+                    'SELECT url FROM probes ORDER BY atime LIMIT ?)',
+                    (count - self.max_entries, ),
+                )
+
+    def invalidate(self, url_prefix=''):
+        """
+        Removes the entries of the urls starting with the given prefix, all
+        of them by default
+
+        :returns: the number of entries removed
+        """
+        with self._lock:
+            self._validated.clear()
+            with self._conn:
+                return self._conn.execute(
+                    'DELETE FROM probes WHERE substr(url, 1, ?) = ?',
+                    (len(url_prefix), url_prefix),
+                ).rowcount
+
+
+_CACHE = SharedCache(ProbeCache)
+configure_from_config = _CACHE.configure_from_config
+get_cache = _CACHE.get_cache
@@ -16,17 +16,32 @@ import logging
 import os
 import shutil
 import sys
-from functools import wraps
+from functools import (
+    partial,
+    wraps,
+)
+from itertools import chain
 
 import tempfile
 import atexit
-
-from . import utils
+from multiprocessing.pool import ThreadPool
+
+from . import (
+    download_cache,
+    http_client,
+    page_cache,
+    probe_cache,
+    utils,
+)
+from .downloader import DownloadManager
 from .parser import Parser
 from .stores import STORES
 
 
 logger = logging.getLogger(__name__)
+# sources that are not expanded to artifacts, but change how the rest of
+# sources are handled
+META_SOURCES = ('conf:', 'repo-suffix:', 'repo-extra-dir:')
 
 
 def cleanup(temp_dir):
@@ -35,6 +50,29 @@ def cleanup(temp_dir):
         logger.info('Cleaning up temporary dir %s', temp_dir)
 
 
+def iter_unique(paths, seen):
+    """
+    Yields the given paths skipping the ones already in seen, adding them to
+    it
+
+    :param paths: iterable with the paths
+    :param seen: set of paths already seen
+    """
+    for path in paths:
+        if path not in seen:
+            seen.add(path)
+            yield path
+
+
+def _iter_and_close(results, pool):
+    try:
+        for result in results:
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
 def loaded(func):
     @wraps(func)
     def _func(self, *args, **kwargs):
@@ -92,6 +130,11 @@ class Repo(object):
 
         atexit.register(cleanup, temp_dir)
         self.config.set('temp_dir', temp_dir)
+        http_client.configure_from_config(self.config)
+        download_cache.configure_from_config(self.config)
+        page_cache.configure_from_config(self.config)
+        probe_cache.configure_from_config(self.config)
+        self.downloader = DownloadManager.from_config(self.config)
 
     def load(self):
         """
@@ -101,16 +144,31 @@ class Repo(object):
             return
 
         logger.debug('Loading repo %s', self.path)
+        store_classes = dict([
+            (key, val)
+            for (key, val) in STORES.iteritems()
+            if key in self.stores or 'all' in self.stores
+        ])
+        # walk the repo only once, handing each file to the stores that load
+        # it
+        store_entries = dict((key, []) for key in store_classes)
+        for entry in utils.scan_tree(
+            self.path,
+            workers=self.config.getint('scan_workers'),
+        ):
+            for key, store_class in store_classes.iteritems():
+                if store_class.handles_file(entry.name):
+                    store_entries[key].append(entry)
         self.stores = dict([
             (
                 key,
                 val(
                     config=self.config.get_section('store.' + key),
-                    repo_path=self.path
+                    repo_path=self.path,
+                    entries=store_entries[key],
                 )
             )
-            for (key, val) in STORES.iteritems()
-            if key in self.stores or 'all' in self.stores
+            for (key, val) in store_classes.iteritems()
         ])
         self.config.set('stores', ', '.join(self.stores.keys()))
         self.parser = Parser(
@@ -170,27 +228,194 @@ class Repo(object):
             self.add_path_extra_dir(dirname=repo_extra_dir)
             return
 
-        self.load()
+        self.add_artifacts(self.expand_source(
+            artifact_source,
+            lazy=not self.config.getboolean('sequential_add'),
+        ))
+
+    @loaded
+    def expand_source(self, artifact_source, lazy=False):
+        """
+        Resolves the given source string to the artifacts it refers to
+
+        :param artifact_source: source string, not a meta-source
+        :param lazy: If True, returns an iterator that applies the filters
+            while the artifacts are consumed, instead of a list
+        :returns: list or iterator with the paths or urls of the artifacts,
+            sorted so the ones with the same name are together
+        """
         logger.info('Resolving artifact source %s', artifact_source)
         artifact_paths = self.parser.parse(artifact_source)
-        for artifact_path in artifact_paths:
-            for store in self.stores.itervalues():
-                if store.handles_artifact(artifact_path):
-                    store.add_artifact(artifact_path)
-                    self.added_artifacts.append(artifact_path)
+        if lazy:
+            return artifact_paths
+        return list(artifact_paths)
+
+    def handles_artifact(self, artifact_path):
+        return any(
+            store.handles_artifact(artifact_path)
+            for store in self.stores.itervalues()
+        )
+
+    def _store_artifact(self, artifact_path, local_path=None):
+        """
+        Adds the given artifact to the stores that handle it
+
+        :param artifact_path: path or url of the artifact, as given by the
+            source, it's the one recorded as added
+        :param local_path: path to the already downloaded file, if any
+        """
+        for store in self.stores.itervalues():
+            if store.handles_artifact(artifact_path):
+                store.add_artifact(local_path or artifact_path)
+                self.added_artifacts.append(artifact_path)
+
+    @loaded
+    def add_artifacts(self, artifact_paths):
+        """
+        Adds the given artifacts to the stores that handle them, downloading
+        the remote ones.
+
+        Unless `sequential_add` is set, each artifact is added as soon as
+        it's downloaded, while the next ones are still being downloaded, in
+        the same order they are passed.
+
+        :param artifact_paths: iterable of paths or urls of the artifacts, in
+            sequential mode it must be a list
+        """
+        if self.config.getboolean('sequential_add'):
+            # fetch all the remote artifacts at once, before the stores
+            # inspect them
+            local_paths = self.downloader.download_all(
+                artifact_path for artifact_path in artifact_paths
+                if self.handles_artifact(artifact_path)
+            )
+            for artifact_path in artifact_paths:
+                self._store_artifact(
+                    artifact_path,
+                    local_paths.get(artifact_path),
+                )
+            return
+
+        for artifact_path, local_path in self.downloader.iter_download(
+            artifact_path for artifact_path in artifact_paths
+            if self.handles_artifact(artifact_path)
+        ):
+            self._store_artifact(artifact_path, local_path)
 
     def parse_source_stream(self, source_stream):
         """
         Given a iterable of sources, add all that apply, skipping comments and
-        empty lines
+        empty lines.
+
+        The consecutive sources are expanded in batch, up to `source_workers`
+        at the same time, and their artifacts are added without duplicates,
+        in the order of the sources (see `add_source_batch`). The
+        meta-sources (like `repo-suffix:`) are handled in order between those
+        batches.
 
         :param source_stream: iterable with the sources, can be an open file
             object as returned by `open`
         """
+        batch = []
         for line in source_stream:
             if not line.strip() or line.strip().startswith('#'):
                 continue
-            self.add_source(line.strip())
+            source = line.strip()
+            if source.startswith(META_SOURCES):
+                self.add_source_batch(batch)
+                batch = []
+                self.add_source(source)
+            else:
+                batch.append(source)
+        self.add_source_batch(batch)
+
+    def add_source_batch(self, artifact_sources):
+        """
+        Expands all the given sources concurrently, and adds all the
+        artifacts found.
+
+        The sources that check the artifacts already in the repo (like the
+        only-missing filter) must see the artifacts of all the previous
+        sources, so the batch is split before them.
+
+        Unless `sequential_add` is set, the artifacts of each source start
+        being downloaded and added while the next sources are still being
+        expanded.
+
+        :param artifact_sources: list of source strings, not meta-sources
+        """
+        if not artifact_sources:
+            return
+        self.load()
+        start = 0
+        for index, source in enumerate(artifact_sources):
+            if index > start and self.parser.reads_repo(source):
+                self._add_sources(artifact_sources[start:index])
+                start = index
+        self._add_sources(artifact_sources[start:])
+
+    def _add_sources(self, artifact_sources):
+        seen = set()
+        if self.config.getboolean('sequential_add'):
+            artifact_paths = list(iter_unique(
+                chain.from_iterable(self.expand_sources(artifact_sources)),
+                seen,
+            ))
+            logger.info(
+                'Got %d artifacts from %d sources',
+                len(artifact_paths),
+                len(artifact_sources),
+            )
+            self.add_artifacts(artifact_paths)
+            return
+
+        # add the artifacts of each source while the next ones are still
+        # being expanded, only the first one can check the repo, and it's
+        # expanded before anything is added
+        self.add_artifacts(iter_unique(
+            chain.from_iterable(
+                self.expand_sources(artifact_sources, lazy=True)
+            ),
+            seen,
+        ))
+        logger.info(
+            'Got %d artifacts from %d sources',
+            len(seen),
+            len(artifact_sources),
+        )
+
+    def expand_sources(self, artifact_sources, lazy=False):
+        """
+        Expands the given sources, up to `source_workers` at the same time
+
+        :param artifact_sources: list of source strings, not meta-sources
+        :param lazy: If True, returns an iterator that yields the artifacts
+            of each source as soon as it's expanded, instead of waiting for
+            all of them, the artifacts of each source are filtered while
+            they are consumed
+        :returns: iterable with the list of artifacts of each source, in the
+            same order
+        """
+        workers = min(
+            self.config.getint('source_workers'),
+            len(artifact_sources),
+        )
+        if workers <= 1 and not lazy:
+            return [self.expand_source(source) for source in artifact_sources]
+        pool = ThreadPool(workers)
+        if lazy:
+            return _iter_and_close(
+                pool.imap(
+                    partial(self.expand_source, lazy=True),
+                    artifact_sources,
+                ),
+                pool,
+            )
+        try:
+            return pool.map(self.expand_source, artifact_sources)
+        finally:
+            pool.close()
+            pool.join()
 
     @loaded
     def save(self):
@@ -212,13 +437,18 @@ class Repo(object):
             return
         removed = []
         for store in self.stores.itervalues():
-            for artifact in store.get_all_but_latest(num=num_to_keep):
-                removed.append(artifact)
-                if not noop:
-                    store.delete_version(
-                        art_name=artifact.name,
-                        art_version=artifact.version,
-                    )
+            old_versions = store.get_old_versions(num=num_to_keep)
+            for _, version in old_versions:
+                removed.extend(version.get_artifacts())
+            if not noop:
+                store.forget_versions(old_versions)
+        if noop:
+            for artifact in removed:
+                logger.info(
+                    'NOOP::%s would have been removed', artifact.path,
+                )
+        else:
+            utils.remove_files(artifact.path for artifact in removed)
         return removed
 
     def add_path_suffix(self, suffix):
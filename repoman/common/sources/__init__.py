@@ -45,9 +45,14 @@ class ArtifactSource(object):
         pass
 
     @abstractmethod
-    def expand(self, source_str):
+    def expand(self, source_str, name_match=None):
         """
         Gets a source string and expands it to it's elements.
+
+        :param source_str: Source string to expand
+        :param name_match: If passed, function that gets the path or url of
+            an artifact and returns False if it does not pass the name
+            filters, the artifacts that don't pass can be skipped
         """
         pass
 
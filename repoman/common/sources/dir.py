@@ -85,7 +85,7 @@ class DirSource(ArtifactSource):
             logger.error(error_msg + '\nAllowed paths: %s', allowed_paths)
             raise IOError(error_msg)
 
-    def expand(self, source_str):
+    def expand(self, source_str, name_match=None):
         orig_source_str = source_str
         if source_str.startswith('dir:'):
             source_str = source_str.split(':', 1)[-1]
@@ -105,5 +105,11 @@ class DirSource(ArtifactSource):
         self.check_if_allowed(source_path)
         return (
             filters_str,
-            find_recursive(source_path, lambda x: has_store(x, self.stores))
+            find_recursive(
+                source_path,
+                lambda x: (
+                    has_store(x, self.stores)
+                    and (name_match is None or name_match(x))
+                ),
+            )
         )
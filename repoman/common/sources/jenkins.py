@@ -22,19 +22,127 @@ this::
 """
 import logging
 import re
+import threading
 import time
+from collections import Counter
+from multiprocessing.pool import ThreadPool
 
-import requests
+from requests.exceptions import RequestException
+from six.moves.urllib.parse import urlparse
 
-from ..stores import has_store
-from ..utils import (
-    split,
-    response2str,
+from .. import (
+    http_client,
+    page_cache,
 )
+from ..downloader import expect_checksums
+from ..stores import has_store
+from ..utils import split
 from . import ArtifactSource
 
 
 logger = logging.getLogger(__name__)
+# only the fields that are used from the builds, the full api responses of
+# the matrix jobs can be many megabytes
+BUILD_FIELDS = (
+    'url,number,building,'
+    'artifacts[relativePath],fingerprint[fileName,hash]'
+)
+BUILD_TREE = '%s,runs[%s]' % (BUILD_FIELDS, BUILD_FIELDS)
+MAX_TRIES = 4
+MAX_BACKOFF = 60
+# consecutive failures for each jenkins host, shared by all the threads
+_HOST_FAILURES = {}
+_LOCK = threading.Lock()
+
+
+def _backoff(host, failed):
+    """
+    Updates the failures count of the host and returns the seconds to wait
+    before retrying, doubling for each consecutive failure
+    """
+    with _LOCK:
+        if not failed:
+            _HOST_FAILURES.pop(host, None)
+            return 0
+        failures = _HOST_FAILURES.get(host, 0) + 1
+        _HOST_FAILURES[host] = failures
+    return min(2 ** failures, MAX_BACKOFF)
+
+
+def is_immutable_build(build_url, build):
+    """
+    Tells if the api data of the given url will never change, that's only
+    for finished builds requested by their number, the permalinks (like
+    lastSuccessfulBuild) and the jobs point to different builds over time
+
+    :param build_url: Url the build was requested with
+    :param build: Api data of the build
+    """
+    last_part = build_url.rstrip('/').rsplit('/', 1)[-1]
+    return (
+        build.get('building') is False
+        and last_part == str(build.get('number'))
+    )
+
+
+def get_build(build_url, tree=BUILD_TREE):
+    """
+    Gets the api data of a jenkins build or job, with only the given fields,
+    retrying with exponential backoff on errors
+
+    :param build_url: Url of the build or job
+    :param tree: Jenkins tree expression with the fields to get
+    """
+    api_url = '%s/api/json?tree=%s' % (build_url.rstrip('/'), tree)
+    host = urlparse(build_url).netloc
+    for tries_left in reversed(range(MAX_TRIES)):
+        try:
+            build = page_cache.fetch_parsed(
+                api_url,
+                parse=lambda response: response.json(),
+                immutable=lambda build: is_immutable_build(build_url, build),
+                http=http_client,
+            )
+            _backoff(host, failed=False)
+            return build
+        except (RequestException, ValueError) as exc:
+            logger.error('Failed to get %s: %s', api_url, exc)
+            if not tries_left:
+                break
+            time.sleep(_backoff(host, failed=True))
+    logger.error(
+        'Failed to download %s after %d tries',
+        build_url,
+        MAX_TRIES,
+    )
+    raise exc
+
+
+def get_fingerprints(run):
+    """
+    Gets the fingerprints of the archived files of the given run, that are
+    their md5, to verify the downloads. The fingerprints only have the file
+    name, so the ones for file names archived more than once in the run (for
+    example from different paths) are skipped, as they can't be told apart.
+
+    :param run: Api data of the build or run
+    :returns: dict with the md5 of each file name
+    """
+    archived = Counter(
+        artifact['relativePath'].rsplit('/', 1)[-1]
+        for artifact in run.get('artifacts', [])
+    )
+    fingerprinted = Counter()
+    fingerprints = {}
+    for fingerprint in run.get('fingerprint', []):
+        if fingerprint.get('fileName') and fingerprint.get('hash'):
+            fingerprinted[fingerprint['fileName']] += 1
+            fingerprints[fingerprint['fileName']] = fingerprint['hash']
+    return dict(
+        (file_name, md5)
+        for file_name, md5 in fingerprints.iteritems()
+        if archived[file_name] <= 1 and fingerprinted[file_name] == 1
+    )
 
 
 class JenkinsSource(ArtifactSource):
@@ -42,6 +150,7 @@ class JenkinsSource(ArtifactSource):
 
     DEFAULT_CONFIG = {
         'jenkins_host_re': r'jenkins\.ovirt\.org',
+        'jenkins_workers': '4',
     }
     CONFIG_SECTION = 'JenkinsSource'
 
@@ -51,7 +160,36 @@ class JenkinsSource(ArtifactSource):
             "https?://{JenkinsSource[jenkins_host_re]/*}",
         )
 
-    def expand(self, source_str):
+    def get_full_runs(self, runs):
+        """
+        Makes sure that all the runs have their artifacts, fetching the
+        ones that were not inlined in the parent build concurrently
+        """
+        missing = [run for run in runs if 'artifacts' not in run]
+        if not missing:
+            return runs
+        workers = min(self.config.getint('jenkins_workers'), len(missing))
+        logger.debug('Fetching %d runs', len(missing))
+        if workers > 1:
+            pool = ThreadPool(workers)
+            try:
+                fetched = pool.map(
+                    lambda run: get_build(run['url'], tree=BUILD_FIELDS),
+                    missing,
+                )
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            fetched = [
+                get_build(run['url'], tree=BUILD_FIELDS) for run in missing
+            ]
+        fetched = dict(
+            (id(run), full_run) for run, full_run in zip(missing, fetched)
+        )
+        return [fetched.get(id(run), run) for run in runs]
+
+    def expand(self, source_str, name_match=None):
         art_list = []
         if (
             has_store(source_str, self.stores)
@@ -67,43 +205,35 @@ class JenkinsSource(ArtifactSource):
 
         filters_str = split(source_str, ':', 2)[-1]
         source_str = ':'.join(source_str.split(':', 2)[:2])
-        tries = 3
-        while tries >= 0:
-            try:
-                lvl1_page = requests.get(
-                    source_str + '/api/json?depth=3'
-                )
-                if lvl1_page.ok:
-                    lvl1_page = lvl1_page.json()
-                    break
-                else:
-                    logger.error(response2str(lvl1_page))
-            except ValueError as exc:
-                logger.error(response2str(lvl1_page))
-            time.sleep(2)
-            tries -= 1
-        else:
-            logger.error(
-                'Failed to download %s after %d tries',
-                source_str,
-                tries,
-            )
-            raise exc
+        lvl1_page = get_build(source_str)
         url = lvl1_page['url']
         logger.info('Parsing jenkins URL: %s', source_str)
         if url.endswith('/'):
             url = url[:-1]
         # handle multicongif jobs
-        for run in lvl1_page.get('runs', (lvl1_page,)):
-            if run.get('number', None) != lvl1_page.get('number', None):
-                continue
+        runs = [
+            run
+            for run in lvl1_page.get('runs', (lvl1_page,))
+            if run.get('number', None) == lvl1_page.get('number', None)
+        ]
+        if 'runs' in lvl1_page:
+            runs = self.get_full_runs(runs)
+        for run in runs:
+            fingerprints = get_fingerprints(run)
             for artifact in run.get('artifacts', []):
                 if not has_store(artifact['relativePath'], self.stores):
                     continue
+                if name_match is not None and not name_match(
+                    artifact['relativePath']
+                ):
+                    continue
                 new_url = '%s/artifact/%s' % (
                     run['url'],
                     artifact['relativePath']
                 )
+                file_name = artifact['relativePath'].rsplit('/', 1)[-1]
+                if file_name in fingerprints:
+                    expect_checksums(new_url, {'md5': fingerprints[file_name]})
                 art_list.append(new_url)
                 logger.info('    Got URL: %s', new_url)
         if not art_list:
@@ -7,8 +7,15 @@ Usage::
     koji:name-version-release
 
 Handles koji builds
+
+The rpms of all the builds are listed with multicalls of up to
+`koji_multicall_batch` calls each, and the sessions and tag listings are
+reused for the whole run.
 """
+import atexit
 import logging
+import threading
+from contextlib import contextmanager
 
 import koji
 
@@ -18,6 +25,84 @@ from ..stores import has_store
 
 
 logger = logging.getLogger(__name__)
+# idle sessions of each hub and latest builds of each tag, shared by all the
+# sources of the run
+_SESSIONS = {}
+_LATEST_BUILDS = {}
+_LOCK = threading.Lock()
+
+
+@contextmanager
+def get_session(server, opts):
+    """
+    Gets a client session for the given hub for the duration of the with
+    block. The sessions can't be used from two threads at the same time, so
+    each one is taken by a single source and given back when done, to be
+    reused by the next sources for the rest of the run. Only the sources
+    expanded at the same time get different sessions. If the with block
+    fails, the session might be left in a bad state, so it's logged out and
+    dropped instead.
+
+    :param server: Url of the koji hub
+    :param opts: dict with the extra options for the session
+    """
+    key = (server, tuple(sorted(opts.items())))
+    with _LOCK:
+        idle = _SESSIONS.setdefault(key, [])
+        session = idle.pop() if idle else None
+    if session is None:
+        session = koji.ClientSession(server, opts)
+    try:
+        yield session
+    except Exception:
+        try:
+            session.logout()
+        except Exception as error:
+            logger.debug('Failed to log out from koji: %s', error)
+        raise
+    with _LOCK:
+        idle.append(session)
+
+
+@atexit.register
+def logout_sessions():
+    """
+    Logs out all the sessions opened during the run
+    """
+    with _LOCK:
+        sessions = [
+            session
+            for idle in _SESSIONS.itervalues()
+            for session in idle
+        ]
+        _SESSIONS.clear()
+    for session in sessions:
+        try:
+            session.logout()
+        except Exception as error:
+            logger.debug('Failed to log out from koji: %s', error)
+
+
+def multicall(client, method, calls, batch, strict=False):
+    """
+    Does the given calls using koji multicalls of up to `batch` calls each
+
+    :param client: Koji client session
+    :param method: Name of the method to call
+    :param calls: List of dicts with the keyword arguments of each call
+    :param batch: Maximum number of calls to send in each multicall
+    :param strict: If True, raise the first error returned instead of
+        returning it
+    :returns: list with the result of each call, as returned by koji, a one
+        element list with the value or a dict with the fault
+    """
+    results = []
+    for start in range(0, len(calls), max(batch, 1)):
+        client.multicall = True
+        for kwargs in calls[start:start + batch]:
+            getattr(client, method)(**kwargs)
+        results.extend(client.multiCall(strict=strict))
+    return results
 
 
 class KojiBuildSource(ArtifactSource):
@@ -27,7 +112,8 @@ class KojiBuildSource(ArtifactSource):
         'koji_server': 'https://koji.fedoraproject.org/kojihub',
         'koji_topurl': 'https://kojipkgs.fedoraproject.org/',
         'koji_skip_unavailable': 'true',
-        'koji_extra_opts': 'krbservice=host'
+        'koji_extra_opts': 'krbservice=host',
+        'koji_multicall_batch': '100',
     }
     CONFIG_SECTION = 'KojiBuildSource'
 
@@ -39,18 +125,35 @@ class KojiBuildSource(ArtifactSource):
             "koji:name-version-release",
         )
 
-    def expand(self, source_str):
+    @staticmethod
+    def get_latest_builds(client, server, tag, package=None):
+        """
+        Returns the latest builds of the given tag, asking the hub only once
+        for each tag and package during the run
+        """
+        key = (server, tag, package)
+        with _LOCK:
+            if key in _LATEST_BUILDS:
+                return _LATEST_BUILDS[key]
+        if package is None:
+            builds = client.getLatestBuilds(tag=tag)
+        else:
+            builds = client.getLatestBuilds(tag=tag, package=package)
+        with _LOCK:
+            _LATEST_BUILDS[key] = builds
+        return builds
+
+    def get_rpm_urls(self, client, server, source, name_match=None):
+        """
+        Gets the urls of the rpms of the builds the given source refers to
+
+        :param client: Koji client session to use
+        :param server: Url of the koji hub
+        :param source: Source string, without the `koji:` prefix nor filters
+        :param name_match: If passed, the rpms that don't pass it are skipped
+        :returns: list of urls
+        """
         art_list = []
-        if not source_str.startswith('koji:'):
-            return '', art_list
-        source_str = source_str.split(':', 1)[1]
-        # remove filters
-        source, filters_str = split(source_str, ':', 1)
-        logger.info('Parsing Koji build: %s', source)
-        client = koji.ClientSession(
-            self.config.get('koji_server'),
-            self.config.getdict('koji_extra_opts'),
-        )
         topurl = self.config.get('koji_topurl')
         if source.startswith('@'):
             tag = source[1:]
@@ -58,7 +161,7 @@ class KojiBuildSource(ArtifactSource):
             if tag.endswith('@inherit'):
                 inherit = True
                 tag = tag.rsplit('@', 1)[0]
-            builds = client.getLatestBuilds(tag=tag)
+            builds = self.get_latest_builds(client, server, tag)
             if not inherit:
                 builds = [
                     build
@@ -67,31 +170,33 @@ class KojiBuildSource(ArtifactSource):
                 ]
         elif '@' in source:
             name, tag = source.split('@', 1)
-            builds = client.getLatestBuilds(
-                tag=tag,
-                package=name,
-            )
+            builds = self.get_latest_builds(client, server, tag, name)
         else:
             builds = [client.getBuild(source)]
+        builds = [build for build in builds if build]
         logging.info('    Got %d builds' % len(builds))
-        for build in builds:
-            if not build:
-                continue
-            if 'build_id' in build:
-                build_id = build.get('build_id')
-            else:
-                build_id = build.get('id')
-            pathinfo = koji.PathInfo(topdir=topurl)
-            try:
-                rpms = client.listRPMs(buildID=build_id)
-            except Exception as error:
+        build_ids = [
+            build['build_id'] if 'build_id' in build else build.get('id')
+            for build in builds
+        ]
+        skip_unavailable = self.config.getboolean('koji_skip_unavailable')
+        results = multicall(
+            client,
+            'listRPMs',
+            [{'buildID': build_id} for build_id in build_ids],
+            batch=self.config.getint('koji_multicall_batch'),
+            strict=not skip_unavailable,
+        )
+        pathinfo = koji.PathInfo(topdir=topurl)
+        for build, build_id, result in zip(builds, build_ids, results):
+            if isinstance(result, dict):
                 logger.error(
                     '        Failed to get build for %s:/n%s',
                     build_id,
-                    error,
+                    result.get('faultString'),
                 )
-                if not self.config.getboolean('koji_skip_unavailable'):
-                    raise
+                continue
+            rpms = result[0]
             if not rpms:
                 logger.warn('        No rpms for build %d', build_id)
             else:
@@ -100,8 +205,25 @@ class KojiBuildSource(ArtifactSource):
                 )
             for rpm in rpms:
                 url = pathinfo.build(build) + '/' + pathinfo.rpm(rpm)
+                if name_match is not None and not name_match(url):
+                    continue
                 if has_store(url, self.stores):
                     art_list.append(url)
+        return art_list
+
+    def expand(self, source_str, name_match=None):
+        art_list = []
+        if not source_str.startswith('koji:'):
+            return '', art_list
+        source_str = source_str.split(':', 1)[1]
+        # remove filters
+        source, filters_str = split(source_str, ':', 1)
+        logger.info('Parsing Koji build: %s', source)
+        server = self.config.get('koji_server')
+        with get_session(
+            server, self.config.getdict('koji_extra_opts')
+        ) as client:
+            art_list = self.get_rpm_urls(client, server, source, name_match)
         if not art_list:
             logger.warn('    No packages found')
             logger.info('    Done')
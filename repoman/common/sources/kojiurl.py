@@ -13,10 +13,8 @@ import logging
 import re
 
 
-import requests
-
-
 from . import ArtifactSource
+from .. import page_cache
 from .url import URLSource
 from ..utils import split
 
@@ -38,7 +36,20 @@ class KojiURLSource(ArtifactSource):
             "https?://{KojiURLSource[koji_host_re]}/*",
         )
 
-    def expand(self, source_str):
+    @staticmethod
+    def get_task_links(page_url, data):
+        """
+        Returns the urls of the buildArch and buildSRPM tasks linked from the
+        given build page contents
+        """
+        lvl2_reg = re.compile(r'(?<=href=")[^"]+(?=.*(buildArch|buildSRPM))')
+        return [
+            URLSource.get_link(page_url, match.group())
+            for match in (lvl2_reg.search(i) for i in data.splitlines())
+            if match
+        ]
+
+    def expand(self, source_str, name_match=None):
         art_list = []
         if not re.match('https?://%s/' % self.config.get('koji_host_re'),
                         source_str):
@@ -47,21 +58,21 @@ class KojiURLSource(ArtifactSource):
         proto, url = source_str.split('://', 1)
         url, filters_str = split(url, ':', 1)
         lvl1_url = '%s://%s' % (proto, url)
-        lvl1_page = requests.get(lvl1_url).text
-        lvl2_reg = re.compile(r'(?<=href=")[^"]+(?=.*(buildArch|buildSRPM))')
         logger.info('Parsing Koji URL: %s', lvl1_url)
-        lvl2_urls = [
-            URLSource.get_link(lvl1_url, match.group())
-            for match in (lvl2_reg.search(i) for i in lvl1_page.splitlines())
-            if match
-        ]
+        lvl2_urls = page_cache.fetch_parsed(
+            lvl1_url,
+            parse=lambda response: self.get_task_links(
+                lvl1_url,
+                response.text,
+            ),
+        )
         for url in lvl2_urls:
             logger.info('    Got 2nd level URL: %s', url)
             art_list.extend(
                 URLSource(
                     config=self.config,
                     stores=self.stores
-                ).expand_page(url)
+                ).expand_page(url, name_match=name_match)
             )
         if not art_list:
             logger.warn('    No packages found')
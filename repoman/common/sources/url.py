@@ -6,29 +6,180 @@ Usage::
 
     URL -> Will parse the url and get all the packages in that page
     rec:URL -> Will parse the urls recursively
+
+The recursive crawl fetches each page only once, and up to `rec_workers`
+pages at the same time, level by level. It can be limited with
+`rec_max_depth` and `rec_max_pages` (0 means no limit).
 """
 import logging
+import posixpath
 import re
+from functools import partial
+from multiprocessing.pool import ThreadPool
 
 
-import requests
 from urlparse import (
     urljoin,
     urlsplit,
+    urlunsplit,
 )
 
 
+from requests.exceptions import RequestException
+
 from . import ArtifactSource
+from .. import page_cache
 from ..stores import has_store
 
 
 logger = logging.getLogger(__name__)
+CHUNK_SIZE = 64 * 1024
+ABSOLUTE_URL_REG = re.compile('https?://')
+SCHEME_REG = re.compile('[^:]+?://')
+
+
+class LinkExtractor(object):
+    """
+    Incremental extractor for the href links of an html page, it can be fed
+    the page in chunks as they arrive, and only keeps the unique links and
+    the unfinished tail of the last chunk. The links longer than
+    `MAX_LINK_LENGTH` are dropped, so a never closed href does not keep the
+    rest of the page in memory.
+    """
+    HREF_REG = re.compile(r'href="([^"]*)"')
+    HREF_START = 'href="'
+    MAX_LINK_LENGTH = 8192
+
+    def __init__(self):
+        self.links = set()
+        self._tail = ''
+        self._skipping = False
+
+    def feed(self, data):
+        if self._skipping:
+            # drop the rest of the too long link, up to its closing quote
+            link_end = data.find('"')
+            if link_end == -1:
+                return
+            data = data[link_end + 1:]
+            self._skipping = False
+        data = self._tail + data
+        last_end = 0
+        for match in self.HREF_REG.finditer(data):
+            if 0 < len(match.group(1)) <= self.MAX_LINK_LENGTH:
+                self.links.add(match.group(1))
+            last_end = match.end()
+        # keep any unfinished link for the next chunk, or a possible start
+        # of one
+        unfinished = data.find(self.HREF_START, last_end)
+        if unfinished == -1:
+            unfinished = max(last_end, len(data) - len(self.HREF_START) + 1)
+        self._tail = data[unfinished:]
+        if len(self._tail) > len(self.HREF_START) + self.MAX_LINK_LENGTH:
+            logger.debug(
+                'Skipping too long link %s...',
+                self._tail[:len(self.HREF_START) + 80],
+            )
+            self._tail = ''
+            self._skipping = True
+
+    def close(self):
+        self._tail = ''
+        self._skipping = False
+        return self.links
+
+
+class LinkResolver(object):
+    """
+    Resolves the links of a page against its url, that is parsed only once
+    """
+    def __init__(self, page_url):
+        self.page_url = page_url
+        self.base_url = URLSource.strip_qs(page_url)
+
+    def get_link(self, link_url, internal=False):
+        """
+        Returns the absolute url for the given link
+
+        :param link_url: Link as found in the page
+        :param internal: If True, will return False for the links outside
+            the page url
+        """
+        if not ABSOLUTE_URL_REG.match(link_url):
+            if link_url[:1] in './?#' or '/.' in link_url or ':' in link_url:
+                link_url = urljoin(self.base_url, link_url)
+            else:
+                # plain relative link, the most common case in the indexes
+                link_url = self.base_url + link_url
+        if link_url.startswith(self.base_url):
+            return link_url
+        else:
+            if internal:
+                return False
+            else:
+                return link_url
+
+    def is_subdir_link(self, link_url):
+        """
+        Returns True if the link looks like one to a sub-directory of the
+        page, relative or absolute
+        """
+        return (
+            len(link_url) > 1
+            and link_url.endswith('/')
+            and link_url != self.page_url
+            and (
+                link_url.startswith('/')
+                or link_url.startswith(self.page_url)
+                or not SCHEME_REG.match(link_url)
+            )
+        )
+
+
+def _extract_links(response):
+    extractor = LinkExtractor()
+    for chunk in response.iter_content(
+        chunk_size=CHUNK_SIZE,
+        decode_unicode=True,
+    ):
+        extractor.feed(chunk)
+    return sorted(extractor.close())
+
+
+def get_page_key(page_url):
+    """
+    Returns the url of the page with the path normalized, as the links
+    resolved against the directory pages can have repeated slashes and dot
+    segments, so the same page is not crawled twice
+    """
+    split_url = urlsplit(page_url)
+    path = posixpath.normpath(split_url.path or '/')
+    if split_url.path.endswith('/') and not path.endswith('/'):
+        path += '/'
+    return urlunsplit(split_url._replace(path=path))
+
+
+def get_page_links(page_url):
+    """
+    Fetches the given page and returns all the links in it, parsing it while
+    it's downloaded, or taking them from the page cache if the page did not
+    change
+
+    :returns: set with the links as they are in the page
+    :raises requests.exceptions.RequestException: if the page could not be
+        fetched
+    """
+    return set(page_cache.fetch_parsed(page_url, _extract_links))
 
 
 class URLSource(ArtifactSource):
     __doc__ = __doc__
 
-    DEFAULT_CONFIG = {}
+    DEFAULT_CONFIG = {
+        'rec_workers': '4',
+        'rec_max_depth': '0',
+        'rec_max_pages': '0',
+    }
     CONFIG_SECTION = 'URLSource'
 
     @classmethod
@@ -38,7 +189,7 @@ class URLSource(ArtifactSource):
             "rec:URL"
         )
 
-    def expand(self, source_str):
+    def expand(self, source_str, name_match=None):
         urls = set()
         # for some reason it requires two chars in the last group
         source_match = re.match(
@@ -49,29 +200,88 @@ class URLSource(ArtifactSource):
             return set(), urls
         source = source_match.groupdict()
         if source['recursive']:
-            urls = urls.union(self.expand_recursive(source['url']))
+            urls = urls.union(
+                self.expand_recursive(source['url'], name_match=name_match)
+            )
         elif has_store(source['url'], self.stores):
             urls.add(source['url'])
         else:
-            urls = urls.union(self.expand_page(source['url']))
+            urls = urls.union(
+                self.expand_page(source['url'], name_match=name_match)
+            )
         return source['filters'], urls
 
-    def expand_page(self, page_url):
+    def expand_page(self, page_url, name_match=None):
         logger.info('Parsing URL: %s', page_url)
-        data = requests.get(page_url).text
-        link_reg = re.compile(r'(?<=href=")[^"]+')
-        art_list = set()
-        for line in data.splitlines():
-            links = link_reg.findall(line)
-            art_list = art_list.union(set([
-                self.get_link(page_url, link)
-                for link in links
-                if has_store(link, self.stores)
-            ]))
+        art_list = self.get_artifact_links(
+            LinkResolver(page_url),
+            get_page_links(page_url),
+            name_match=name_match,
+        )
         for art_url in art_list:
             logger.info('    Got artifact URL: %s', art_url)
         return art_list
 
+    def get_artifact_links(self, resolver, links, name_match=None):
+        """
+        Returns the set of absolute urls of the links to artifacts
+
+        :param resolver: `LinkResolver` for the page the links are from
+        :param links: Links found in the page
+        :param name_match: If passed, only the artifacts that pass it are
+            returned
+        """
+        art_urls = (
+            resolver.get_link(link)
+            for link in links
+            if has_store(link, self.stores)
+        )
+        if name_match is None:
+            return set(art_urls)
+        return set(art_url for art_url in art_urls if name_match(art_url))
+
+    @staticmethod
+    def get_subdir_links(resolver, links):
+        """
+        Returns the set of absolute urls of the links to sub-directories of
+        the page
+
+        :param resolver: `LinkResolver` for the page the links are from
+        :param links: Links found in the page
+        """
+        next_urls = (
+            resolver.get_link(link, internal=True)
+            for link in links
+            if resolver.is_subdir_link(link)
+        )
+        return set(next_url for next_url in next_urls if next_url)
+
+    def crawl_page(self, page_url, name_match=None, level=0):
+        """
+        Fetches a page once, and extracts both the sub-directories and the
+        artifacts it links to
+
+        :param level: Depth of the page from the crawled url, if the page is
+            not the crawled url itself (level 0) and it can't be fetched it's
+            skipped with a warning
+        :returns: tuple with the set of sub-directory urls and the set of
+            artifact urls, both empty if the page could not be fetched
+        :raises requests.exceptions.RequestException: if the crawled url
+            could not be fetched
+        """
+        try:
+            links = get_page_links(page_url)
+        except RequestException as error:
+            if not level:
+                raise
+            logger.warn('Failed to fetch %s: %s', page_url, error)
+            return set(), set()
+        resolver = LinkResolver(page_url)
+        return (
+            self.get_subdir_links(resolver, links),
+            self.get_artifact_links(resolver, links, name_match=name_match),
+        )
+
     @staticmethod
     def strip_qs(url):
         split_url = urlsplit(url)
@@ -82,36 +292,84 @@ class URLSource(ArtifactSource):
 
     @staticmethod
     def get_link(page_url, link_url, internal=False):
-        page_url = URLSource.strip_qs(page_url)
-        if not re.match('https?://', link_url):
-            link_url = urljoin(page_url, link_url)
-        if link_url.startswith(page_url):
-            return link_url
-        else:
-            if internal:
-                return False
-            else:
-                return link_url
+        return LinkResolver(page_url).get_link(link_url, internal=internal)
 
-    def expand_recursive(self, page_url, level=0):
-        if level > 0:
-            logger.debug('Recursively fetching URL (level %d): %s',
-                         level, page_url)
-        else:
-            logger.info('Recursively fetching URL (level %d): %s', level,
-                        page_url)
-        pkg_list = []
-        data = requests.get(page_url).text
-        url_reg = re.compile(
-            r'(?<=href=")(/|%s|(?![^:]+?://))[^"]+/(?=")' % page_url)
-        next_urls = (
-            self.get_link(page_url, match.group(), internal=True)
-            for match in url_reg.finditer(data)
-            if match.group() != page_url
+    def expand_recursive(self, page_url, name_match=None):
+        """
+        Crawls the given url and all the sub-directories under it, breadth
+        first, fetching each page only once
+
+        :param page_url: Url to start crawling from
+        :param name_match: If passed, only the artifacts that pass it are
+            returned
+        :returns: set of the artifact urls found
+        """
+        logger.info('Recursively fetching URL: %s', page_url)
+        workers = self.config.getint('rec_workers')
+        max_depth = self.config.getint('rec_max_depth')
+        max_pages = self.config.getint('rec_max_pages')
+        pkg_list = set()
+        visited = set([get_page_key(page_url)])
+        # only the pages under the given one, not the parents the links
+        # with dot segments point to
+        root_key = get_page_key(page_url).rstrip('/') + '/'
+        pending = [page_url]
+        level = 0
+        truncated = False
+        pool = ThreadPool(workers) if workers > 1 else None
+        try:
+            while pending:
+                logger.debug(
+                    'Fetching %d pages of level %d', len(pending), level,
+                )
+                if pool is not None and len(pending) > 1:
+                    results = pool.map(
+                        partial(
+                            self.crawl_page,
+                            name_match=name_match,
+                            level=level,
+                        ),
+                        pending,
+                    )
+                else:
+                    results = [
+                        self.crawl_page(url, name_match, level=level)
+                        for url in pending
+                    ]
+                level += 1
+                pending = []
+                for subdirs, artifacts in results:
+                    pkg_list.update(artifacts)
+                    if max_depth and level > max_depth:
+                        continue
+                    for subdir in sorted(subdirs):
+                        subdir_key = get_page_key(subdir)
+                        if (
+                            subdir_key in visited
+                            or not subdir_key.startswith(root_key)
+                        ):
+                            continue
+                        if max_pages and len(visited) >= max_pages:
+                            truncated = True
+                            break
+                        visited.add(subdir_key)
+                        pending.append(subdir)
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        if truncated:
+            logger.warn(
+                'Reached the maximum of %d pages crawling %s, ignoring the '
+                'rest',
+                max_pages,
+                page_url,
+            )
+        logger.info(
+            '    Crawled %d pages, got %d artifact URLs',
+            len(visited),
+            len(pkg_list),
         )
-        for next_url in next_urls:
-            if not next_url:
-                continue
-            pkg_list.extend(self.expand_recursive(next_url, level + 1))
-        pkg_list.extend(self.expand_page(page_url))
+        for art_url in sorted(pkg_list):
+            logger.debug('    Got artifact URL: %s', art_url)
         return pkg_list
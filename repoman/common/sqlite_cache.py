@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Common parts of the persistent caches kept in sqlite databases (see the
+`download_cache`, `page_cache` and `probe_cache` modules).
+
+Each cache is enabled with a config option with its path, and there's only
+one process wide instance of each, shared by all the threads.
+"""
+import logging
+import os
+import sqlite3
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class SqliteCache(object):
+    """
+    Base class for the caches, the subclasses must set `CONFIG_OPTION` and
+    open their database with `_open_db`
+    """
+    # config option with the path to the cache, empty to disable it
+    CONFIG_OPTION = None
+
+    def __init__(self, path):
+        """
+        :param path: Path to the cache
+        """
+        self.path = path
+        # the caches are used from several threads
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _open_db(self, db_path, *statements):
+        """
+        Opens the database of the cache, creating its directory if it does
+        not exist
+
+        :param db_path: Path to the sqlite database
+        :param statements: Statements to run to create the tables if needed
+        """
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        self._conn = sqlite3.connect(
+            db_path,
+            timeout=60,
+            check_same_thread=False,
+        )
+        self._conn.text_factory = str
+        with self._conn:
+            for statement in statements:
+                self._conn.execute(statement)
+
+    @classmethod
+    def get_options(cls, config):
+        """
+        Returns the extra parameters of the constructor from the config
+        """
+        return {}
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Opens the cache configured with the `CONFIG_OPTION` option
+
+        :returns: the cache instance, or None if not configured or it could
+            not be opened
+        """
+        cache_path = config.get(cls.CONFIG_OPTION, '')
+        if not cache_path:
+            return None
+        cache_path = os.path.expanduser(cache_path)
+        try:
+            return cls(path=cache_path, **cls.get_options(config))
+        except (OSError, sqlite3.Error) as error:
+            logger.warn(
+                'Unable to open the %s %s, ignoring it: %s',
+                cls.CONFIG_OPTION.replace('_', ' '),
+                cache_path,
+                error,
+            )
+            return None
+
+
+class SharedCache(object):
+    """
+    Holder for the process wide instance of a cache class
+    """
+    def __init__(self, cache_class):
+        """
+        :param cache_class: `SqliteCache` subclass to hold an instance of
+        """
+        self.cache_class = cache_class
+        self.cache = None
+
+    def configure_from_config(self, config):
+        """
+        Sets up the process wide cache from the main repoman configuration, if
+        enabled
+        """
+        cache_path = os.path.expanduser(
+            config.get(self.cache_class.CONFIG_OPTION, '')
+        )
+        if self.cache is not None and self.cache.path == cache_path:
+            return
+        self.cache = self.cache_class.from_config(config)
+
+    def get_cache(self):
+        """
+        Returns the process wide cache, or None if not enabled
+        """
+        return self.cache
@@ -46,19 +46,35 @@ For clarification, here's a dictionary like diagram::
 import os
 import logging
 import re
+from functools import partial
 
-import rpm
 import pexpect
+from six.moves import intern
 
+try:
+    import rpm
+except ImportError:
+    rpm = None
+
+from ... import probe_cache
+from ...downloader import (
+    fetch,
+    get_downloaded_checksums,
+    get_temp_path,
+)
 from ...utils import (
-    download,
-    cmpfullver,
+    fetch_range,
     gpg_unlock,
     gpg_get_keyuid,
 )
+from .header import (
+    RPMHeaderError,
+    TruncatedHeaderError,
+    parse_header,
+    read_header,
+)
 from ...artifact import (
     Artifact,
-    ArtifactVersion,
     ArtifactList,
     ArtifactName,
 )
@@ -68,7 +84,157 @@ class WrongDistroException(Exception):
     pass
 
 
+def read_rpm_metadata(path, reader='builtin'):
+    """
+    Reads the header of the given rpm file and returns the values repoman
+    uses from it, as a plain serializable dict.
+
+    :param path: Path to the rpm file
+    :param reader: How to read the header, 'builtin' to use the included
+        parser or 'rpm' to use the rpm python bindings
+    """
+    with open(path) as fdno:
+        try:
+            if reader == 'builtin':
+                metadata = read_header(fdno)
+            elif reader == 'rpm':
+                metadata = _read_header_with_rpm(fdno)
+            else:
+                raise ValueError('Unknown rpm header reader %s' % reader)
+        except Exception:
+            logging.error("Failed to parse header for %s", path)
+            raise
+        metadata['inode'] = os.fstat(fdno.fileno()).st_ino
+    return metadata
+
+
+# bytes to get on the first request when probing a remote rpm, enough for the
+# headers of most packages
+PROBE_SIZE = 64 * 1024
+
+
+def probe_rpm_metadata(url, verify_ssl=True):
+    """
+    Gets the same metadata as `read_rpm_metadata` from a remote rpm, but
+    downloading only the lead and headers of it with HTTP range requests.
+
+    As there's no inode for a remote file, the url is used instead.
+
+    :param url: Url of the rpm
+    :param verify_ssl: If False, will not check the ssl certificates
+    :returns: the metadata dict, or None if the server does not support range
+        requests, so the whole file has to be downloaded instead
+    """
+    data = fetch_range(url, 0, PROBE_SIZE - 1, verify=verify_ssl)
+    if data is None:
+        return None
+    while True:
+        try:
+            metadata = parse_header(data)
+        except TruncatedHeaderError as error:
+            # get at least what's needed, but avoid too many small requests
+            end = max(error.needed, 2 * len(data))
+            extra = fetch_range(url, len(data), end - 1, verify=verify_ssl)
+            if extra is None:
+                return None
+            if not extra:
+                raise RPMHeaderError('Truncated rpm file %s' % url)
+            data += extra
+            continue
+        metadata['inode'] = url
+        return metadata
+
+
+def get_remote_metadata(url, verify_ssl=True):
+    """
+    Same as `probe_rpm_metadata`, but going through the probe cache if it's
+    enabled, so the headers of the rpms that did not change are not fetched
+    again
+    """
+    cache = probe_cache.get_cache()
+    if cache is None:
+        return probe_rpm_metadata(url, verify_ssl=verify_ssl)
+    return cache.probe(
+        url,
+        partial(probe_rpm_metadata, verify_ssl=verify_ssl),
+        verify=verify_ssl,
+    )
+
+
+# name-version-release.arch.rpm
+RPM_FILE_NAME_REGEX = re.compile(
+    r'^(?P<name>.+)-(?P<version>[^-]+)-(?P<release>[^-]+)'
+    r'\.(?P<arch>[^.-]+)\.rpm$'
+)
+
+
+def parse_rpm_file_name(path):
+    """
+    Gets the metadata of an rpm from its file name, without reading it, for
+    when it's only needed to decide which packages to get. The file name does
+    not tell if it's signed nor the source rpm it was built from, so those
+    are left as unsigned and unknown.
+
+    The source rpms are not handled, as their headers have the arch they were
+    built on (the one of their binary packages, that they are grouped with)
+    instead of the `src` of the file name.
+
+    :param path: Path or url to the rpm
+    :returns: the metadata dict as `read_rpm_metadata` would return it, or
+        None if the file name is not name-version-release.arch.rpm or it's a
+        source rpm
+    """
+    # the urls from the sources can be unicode, the headers never are
+    if isinstance(path, unicode):
+        path = path.encode('utf-8')
+    name_match = RPM_FILE_NAME_REGEX.match(path.rsplit('/', 1)[-1])
+    if not name_match or name_match.group('arch') == 'src':
+        return None
+    metadata = name_match.groupdict()
+    metadata.update({
+        'is_source': False,
+        'sourcerpm': None,
+        'signature': False,
+        'inode': path,
+    })
+    return metadata
+
+
+def _read_header_with_rpm(fdno):
+    if rpm is None:
+        raise RuntimeError(
+            'The rpm python bindings are needed to use the rpm header reader'
+        )
+    trans = rpm.TransactionSet()
+    # Do not fail for unsigned rpms
+    trans.setVSFlags(rpm._RPMVSF_NOSIGNATURES)
+    hdr = trans.hdrFromFdno(fdno)
+    return {
+        'name': hdr[rpm.RPMTAG_NAME],
+        'version': hdr[rpm.RPMTAG_VERSION],
+        'release': hdr[rpm.RPMTAG_RELEASE],
+        'arch': hdr[rpm.RPMTAG_ARCH],
+        'is_source': hdr[rpm.RPMTAG_SOURCEPACKAGE] and True or False,
+        'sourcerpm': hdr[rpm.RPMTAG_SOURCERPM],
+        'signature': (
+            hdr[rpm.RPMTAG_SIGPGP] or hdr[rpm.RPMTAG_RSAHEADER]
+        ) and True or False,
+    }
+
+
 class RPM(Artifact):
+    __slots__ = (
+        'is_source',
+        'sourcerpm',
+        '_name',
+        '_version',
+        'release',
+        'signature',
+        'distro',
+        'arch',
+        'ver_rel',
+    )
+
     def __init__(
         self,
         path,
@@ -87,6 +253,9 @@ class RPM(Artifact):
             r'ovirt-node-ng-image-update-placeholder*',
         ),
         verify_ssl=True,
+        metadata=None,
+        header_reader='builtin',
+        metadata_only=False,
     ):
         """
         :param path: Path or url to the rpm
@@ -97,37 +266,41 @@ class RPM(Artifact):
            the release string of the rpm.
         :param to_all_distros: Special rpm names that must go to all the
             distributions ignoring their release strings
+        :param metadata: Already extracted metadata for the rpm, as returned
+            by `read_rpm_metadata`, if not passed the header will be read
+            from the file
+        :param header_reader: Reader to use to read the header from the file,
+            see `read_rpm_metadata`
+        :param metadata_only: If set and path is an url, try to get only the
+            headers of the rpm instead of downloading it, the path will be the
+            url then
         """
-        trans = rpm.TransactionSet()
-        # Do not fail for unsigned rpms
-        trans.setVSFlags(rpm._RPMVSF_NOSIGNATURES)
-        if path.startswith('http:') or path.startswith('https:'):
-            name = path.rsplit('/', 1)[-1]
-            if not name:
-                raise Exception('Passed trailing slash in path %s, '
-                                'unable to guess package name'
-                                % path)
-            fpath = temp_dir + '/' + name
-            download(path, fpath, verify=verify_ssl)
+        is_url = path.startswith('http:') or path.startswith('https:')
+        if is_url and metadata_only:
+            if metadata is None:
+                metadata = get_remote_metadata(path, verify_ssl=verify_ssl)
+            is_url = metadata is None
+        if is_url:
+            fpath = get_temp_path(temp_dir, path)
+            fetch(path, fpath, verify=verify_ssl)
             path = fpath
         self.path = path
-        with open(path) as fdno:
-            try:
-                hdr = trans.hdrFromFdno(fdno)
-            except Exception:
-                logging.error("Failed to parse header for %s", path)
-                raise
-            self.inode = os.fstat(fdno.fileno()).st_ino
-        self.is_source = hdr[rpm.RPMTAG_SOURCEPACKAGE] and True or False
-        self.sourcerpm = hdr[rpm.RPMTAG_SOURCERPM]
-        self._name = hdr[rpm.RPMTAG_NAME]
-        self._version = hdr[rpm.RPMTAG_VERSION]
-        self.major_version = self._version.split('.', 1)[0]
-        self.release = hdr[rpm.RPMTAG_RELEASE]
-        self.signature = hdr[rpm.RPMTAG_SIGPGP]
-        self._raw_hdr = hdr
-        # will be calculated if needed
-        self._md5 = None
+        if metadata is None:
+            metadata = read_rpm_metadata(path, reader=header_reader)
+        self.inode = metadata['inode']
+        self.is_source = metadata['is_source']
+        self.sourcerpm = metadata['sourcerpm']
+        # the names, archs and distros are shared by many packages, so keep
+        # only one copy of each
+        self._name = intern(metadata['name'])
+        self._version = metadata['version']
+        self.release = metadata['release']
+        self.signature = metadata['signature']
+        # known if it was just downloaded, will be calculated if needed
+        # otherwise
+        self._checksums = (
+            metadata.get('checksums') or get_downloaded_checksums(path)
+        )
         # Check if this package has to go to all distros
         if any((
             self._name
@@ -137,7 +310,7 @@ class RPM(Artifact):
             self.distro = 'all'
         else:
             try:
-                self.distro = self.get_distro(self.release, distro_reg)
+                self.distro = intern(self.get_distro(self.release, distro_reg))
             except WrongDistroException as e:
                 logging.error(
                     'Wrong distribution for package: %s-%s',
@@ -145,17 +318,7 @@ class RPM(Artifact):
                     self._version
                 )
                 raise e
-        self.arch = hdr[rpm.RPMTAG_ARCH] or 'none'
-        # this property should uniquely identify a rpm entity, in the sense
-        # that if you have two rpms with the same full_name they must package
-        # the same content or one of them is wrongly generated (the version was
-        # not bumped or something)
-        self.full_name = 'rpm(%s %s %s %s)' % (
-            self._name,
-            self.distro,
-            self.arch,
-            self.is_source and 'src' or 'bin',
-        )
+        self.arch = intern(metadata['arch'] or 'none')
         # remove the distro from the release for the version string
         if self.distro:
             release = re.sub(
@@ -166,12 +329,68 @@ class RPM(Artifact):
             )
         else:
             release = self.release
-        self.ver_rel = '%s-%s' % (self._version, release)
+        self.ver_rel = intern('%s-%s' % (self._version, release))
 
     @property
     def name(self):
         return '%s.%s.%s' % (self._name, self.distro, self.arch)
 
+    @property
+    def full_name(self):
+        """
+        This property should uniquely identify a rpm entity, in the sense
+        that if you have two rpms with the same full_name they must package
+        the same content or one of them is wrongly generated (the version was
+        not bumped or something)
+        """
+        return 'rpm(%s %s %s %s)' % (
+            self._name,
+            self.distro,
+            self.arch,
+            self.is_source and 'src' or 'bin',
+        )
+
+    @property
+    def major_version(self):
+        return self._version.split('.', 1)[0]
+
+    def get_path_fields(self):
+        """
+        Returns the properties of the package that can be used as format
+        variables in the store path
+        """
+        return {
+            'name': self.name,
+            'version': self.version,
+            'full_name': self.full_name,
+            'major_version': self.major_version,
+            'ver_rel': self.ver_rel,
+            'release': self.release,
+            'distro': self.distro,
+            'arch': self.arch,
+            'is_source': self.is_source,
+            'sourcerpm': self.sourcerpm,
+            'signature': self.signature,
+            'path': self.path,
+            'inode': self.inode,
+            '_name': self._name,
+            '_version': self._version,
+            '_checksums': self._checksums,
+        }
+
+    def get_metadata(self):
+        metadata = super(RPM, self).get_metadata()
+        metadata.update({
+            'name': self._name,
+            'version': self._version,
+            'release': self.release,
+            'arch': self.arch,
+            'is_source': self.is_source,
+            'sourcerpm': self.sourcerpm,
+            'signature': self.signature,
+        })
+        return metadata
+
     @property
     def version(self):
         return self.ver_rel
@@ -301,42 +520,20 @@ class RPM(Artifact):
 
 class RPMName(ArtifactName):
     """List of available versions for a package name"""
-    def add_pkg(self, pkg, onlyifnewer):
-        is_there_newer = next(
-            (
-                ver for ver in self.keys()
-                if cmpfullver(ver, pkg.ver_rel) >= 0
-            ),
-            False,
-        )
-        if onlyifnewer and (is_there_newer or pkg.ver_rel in self):
-            return False
-        elif pkg.ver_rel not in self:
-            self[pkg.ver_rel] = ArtifactVersion(pkg.ver_rel)
-        return self[pkg.ver_rel].add_pkg(pkg)
-
     def get_latest(self, num=1):
         """
-        Returns the list of available inodes for the latest version
-        if any
+        Returns the dict of the latest num versions that have any binary
+        package, if any
         """
-        if not self:
-            return None
-        if not num:
-            num = len(self)
-        sorted_list = [
-            ver_name for ver_name, version in self.items()
-            if version.get_artifacts(
-                fmatch=lambda art: not art.is_source
-            )
-        ]
-        sorted_list.sort(cmp=cmpfullver)
-        latest = {}
-        if num > len(sorted_list):
-            num = len(sorted_list)
-        for pos in xrange(num):
-            latest[sorted_list[pos]] = self.get(sorted_list[pos])
-        return latest
+        return self._select_latest(
+            (
+                ver_name for ver_name in self.iter_newest()
+                if self[ver_name].get_artifacts(
+                    fmatch=lambda art: not art.is_source
+                )
+            ),
+            num,
+        )
 
 
 class RPMList(ArtifactList):
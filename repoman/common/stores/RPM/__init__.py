@@ -38,15 +38,17 @@ import os
 import logging
 import subprocess
 import multiprocessing as mp
+from functools import partial
 from .. import ArtifactStore
 from .RPM import (
     RPMList,
-    RPMName,
     RPM,
+    RPM_FILE_NAME_REGEX,
     WrongDistroException,
+    parse_rpm_file_name,
+    read_rpm_metadata,
 )
 from ...utils import (
-    list_files,
     save_file,
     extract_sources,
     sign_detached,
@@ -87,6 +89,22 @@ class RPMStore(ArtifactStore):
     * extra_symlinks
         Comma separated list of orig:symlink pairs to create links, the paths
 
+    * filter_by_file_name
+        If true (the default), the filters that only need the name and
+        version of the packages (like latest or only-missing) take them from
+        the file names instead of reading the headers, the source packages
+        and the ones whose file name is not name-version-release.arch.rpm are
+        still read
+
+    * header_reader
+        How to read the rpm headers, 'builtin' to use the included parser
+        (default) or 'rpm' to use the rpm python bindings
+
+    * load_workers
+        Number of processes to use to read the rpm headers when loading many
+        packages at once (like when loading the repo), 1 to read them
+        serially, 0 to use one per cpu
+
     * on_wrong_distro
         Action to execute when a package has an incorrect distro (it's release
         string does not match the distro_reg regular expression). Possible
@@ -124,10 +142,14 @@ class RPMStore(ArtifactStore):
         will be relative to the store root path.
     """
 
+    ARTIFACT_EXTENSION = '.rpm'
     CONFIG_SECTION = 'RPMStore'
     DEFAULT_CONFIG = {
         'distro_reg': r'\.(fc|el)\d+(?=\w*)',
         'extra_symlinks': '',
+        'filter_by_file_name': 'true',
+        'header_reader': 'builtin',
+        'load_workers': '1',
         'on_wrong_distro': 'fail',
         'path_prefix': 'rpm,src',
         'rpm_dir': 'rpm',
@@ -138,11 +160,13 @@ class RPMStore(ArtifactStore):
         'with_srcrpms': 'true',
     }
 
-    def __init__(self, config, repo_path=None):
+    def __init__(self, config, repo_path=None, entries=None):
         """
         :param repo_path: Path to the repository directory, if passed it will
             automatically add all the rpms under it to the repo if any.
         :param config: configuration for the store
+        :param entries: If passed, the already scanned file entries to load
+            from repo_path, instead of scanning it again
         """
         ArtifactStore.__init__(
             self,
@@ -161,21 +185,41 @@ class RPMStore(ArtifactStore):
         self.on_wrong_distro = config.get('on_wrong_distro')
         # init first, add existing repo after
         if repo_path:
-            logger.info('Loading repo %s', repo_path)
-            for pkg in list_files(repo_path, '.rpm'):
-                self.add_artifact(
-                    pkg,
-                    to_copy=False,
-                    hidelog=True,
-                )
-            logger.info('Repo %s loaded', repo_path)
+            self.load_artifacts(repo_path, entries)
 
     @property
     def path_prefix(self):
         return self._path_prefix
 
+    def inspect_artifacts(self, paths):
+        workers = self.config.getint('load_workers')
+        if workers <= 0:
+            workers = mp.cpu_count()
+        if workers == 1 or len(paths) < 2:
+            return {}
+        workers = min(workers, len(paths))
+        logger.debug(
+            'Reading %d rpm headers with %d processes',
+            len(paths),
+            workers,
+        )
+        pool = mp.Pool(workers)
+        try:
+            metadatas = pool.map(
+                partial(
+                    read_rpm_metadata,
+                    reader=self.config.get('header_reader'),
+                ),
+                paths,
+                chunksize=max(1, len(paths) // (workers * 4)),
+            )
+        finally:
+            pool.close()
+            pool.join()
+        return dict(zip(paths, metadatas))
+
     def get_store_path(self, pkg):
-        store_path = self.path.format(**pkg.__dict__)
+        store_path = self.path.format(**pkg.get_path_fields())
         self.realized_paths.add(store_path)
         return store_path
 
@@ -188,10 +232,18 @@ class RPMStore(ArtifactStore):
         else:
             return artifact.endswith('.rpm')
 
+    @classmethod
+    def guess_name(cls, artifact):
+        name_match = RPM_FILE_NAME_REGEX.match(artifact.rsplit('/', 1)[-1])
+        if not name_match:
+            return None
+        return name_match.group('name')
+
     def add_artifact(self, pkg, **args):
-        self.add_rpm(pkg, **args)
+        return self.add_rpm(pkg, **args)
 
-    def add_rpm(self, pkg, onlyifnewer=False, to_copy=True, hidelog=False):
+    def add_rpm(self, pkg, onlyifnewer=False, to_copy=True, hidelog=False,
+                metadata=None, metadata_only=False):
         """
         Generic functon to add an rpm package to the repo.
 
@@ -204,13 +256,32 @@ class RPMStore(ArtifactStore):
             adding new packages to the repo.
         :param hidelog: If set to True will not show the extra information
             (used when loading a repository to avoid verbose output)
+        :param metadata: Already extracted metadata of the package, if any
+        :param metadata_only: If set, for urls only the headers of the package
+            will be downloaded if the server allows it, useful when the
+            package is only needed to decide if it has to be added
+        :returns: the added RPM instance, or None if it was skipped
         """
+        if (
+            metadata_only
+            and metadata is None
+            and self.config.getboolean('filter_by_file_name')
+        ):
+            metadata = parse_rpm_file_name(pkg)
+            if metadata is None:
+                logger.debug(
+                    'Unable to parse the file name of %s, reading the headers',
+                    pkg,
+                )
         try:
             pkg = RPM(
                 pkg,
                 temp_dir=self.config.get('temp_dir'),
                 distro_reg=self.config.get('distro_reg'),
                 verify_ssl=self.config.getboolean('verify_ssl'),
+                metadata=metadata,
+                header_reader=self.config.get('header_reader'),
+                metadata_only=metadata_only,
             )
         except WrongDistroException:
             if self.on_wrong_distro == 'copy_to_all':
@@ -223,6 +294,10 @@ class RPMStore(ArtifactStore):
                     temp_dir=self.config.get('temp_dir'),
                     distro_reg=self.config.get('distro_reg'),
                     to_all_distros=('.*',),
+                    verify_ssl=self.config.getboolean('verify_ssl'),
+                    metadata=metadata,
+                    header_reader=self.config.get('header_reader'),
+                    metadata_only=metadata_only,
                 )
             elif self.on_wrong_distro == 'fail':
                 raise
@@ -241,7 +316,7 @@ class RPMStore(ArtifactStore):
             if to_copy:
                 self.to_copy.append(pkg)
             else:
-                store_path = self.path.format(**pkg.__dict__)
+                store_path = self.path.format(**pkg.get_path_fields())
                 self.realized_paths.add(store_path)
             if not hidelog:
                 logger.info(
@@ -256,6 +331,7 @@ class RPMStore(ArtifactStore):
                 )
         if pkg.distro != 'all':
             self.distros.add(pkg.distro)
+        return pkg
 
     def save(self, **args):
         self._save(**args)
@@ -318,8 +394,8 @@ class RPMStore(ArtifactStore):
         Check if the given package is the latest version in the repo
         :pram pkg: RPM instance of the package to compare
         """
-        verlist = self.artifacts.get(pkg.full_name, {})
-        if not verlist or pkg.full_version in verlist.get_latest():
+        verlist = self.artifacts.get(pkg.name)
+        if not verlist or pkg.version in verlist.get_latest():
             return True
         return False
 
@@ -430,20 +506,13 @@ class RPMStore(ArtifactStore):
         :param noop: If set, will only log what will be done, not actually
             doing anything.
         """
-        new_rpms = RPMList(self.artifacts)
         for name, versions in self.artifacts.iteritems():
-            if len(versions) <= keep:
-                continue
-            to_keep = RPMName()
-            for _ in range(keep):
-                latest = versions.get_latest()
-                to_keep.update(latest)
-                versions.pop(latest.keys()[0])
-            new_rpms[name] = to_keep
+            to_keep = versions.get_latest(num=keep) or {}
             for version in versions.keys():
+                if version in to_keep:
+                    continue
                 logger.info('Deleting %s version %s', name, version)
-                versions.del_version(version, noop)
-        self.artifacts = new_rpms
+                versions.delete_version(version, noop)
 
     def get_rpms(self, regmatch=None, fmatch=None, latest=0):
         """
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""
+Minimal rpm header reader, that extracts only the few tags repoman uses
+without the need of the rpm python bindings.
+
+An rpm file has the following structure::
+
+    lead (96 bytes)
+    signature header (padded to a multiple of 8 bytes)
+    header
+    payload
+
+And each of the headers is::
+
+    intro: magic(4) reserved(4) index_count(4) data_size(4)
+    index: index_count * (tag(4) type(4) offset(4) count(4))
+    data: data_size bytes, the offsets in the index are relative to it
+
+All the numbers are big endian. Only the lead and the headers are read, the
+payload is never touched.
+"""
+import mmap
+import struct
+
+
+LEAD_SIZE = 96
+LEAD_MAGIC = b'\xed\xab\xee\xdb'
+HEADER_MAGIC = b'\x8e\xad\xe8\x01'
+HEADER_INTRO = struct.Struct('>4s4xII')
+INDEX_ENTRY = struct.Struct('>IIII')
+LEAD_TYPE = struct.Struct('>H')
+INT32 = struct.Struct('>I')
+
+# tag value types
+TYPE_INT32 = 4
+TYPE_STRING = 6
+TYPE_BIN = 7
+TYPE_STRING_ARRAY = 8
+TYPE_I18NSTRING = 9
+
+# lead package types
+LEAD_TYPE_SOURCE = 1
+
+# header tags
+RPMTAG_NAME = 1000
+RPMTAG_VERSION = 1001
+RPMTAG_RELEASE = 1002
+RPMTAG_ARCH = 1022
+RPMTAG_SOURCERPM = 1044
+RPMTAG_SOURCEPACKAGE = 1106
+
+# signature header tags
+RPMSIGTAG_RSA = 268
+RPMSIGTAG_PGP = 1002
+
+HEADER_TAGS = (
+    RPMTAG_NAME,
+    RPMTAG_VERSION,
+    RPMTAG_RELEASE,
+    RPMTAG_ARCH,
+    RPMTAG_SOURCERPM,
+    RPMTAG_SOURCEPACKAGE,
+)
+SIGNATURE_TAGS = (
+    RPMSIGTAG_RSA,
+    RPMSIGTAG_PGP,
+)
+
+
+class RPMHeaderError(Exception):
+    """Thrown when the given data is not a valid rpm header"""
+    pass
+
+
+class TruncatedHeaderError(RPMHeaderError):
+    """
+    Thrown when the given data ends before the end of the headers, the
+    `needed` attribute has the minimum size required to continue parsing
+    """
+    def __init__(self, needed):
+        self.needed = needed
+        super(TruncatedHeaderError, self).__init__(
+            'Truncated rpm header, at least %d bytes needed' % needed
+        )
+
+
+def _check_size(data, size):
+    if len(data) < size:
+        raise TruncatedHeaderError(size)
+
+
+def _read_value(data, data_start, data_end, tag_type, offset, count):
+    start = data_start + offset
+    if start >= data_end:
+        raise RPMHeaderError('Tag offset out of the header data')
+    if tag_type in (TYPE_STRING, TYPE_STRING_ARRAY, TYPE_I18NSTRING):
+        # for arrays, as rpm does for the i18n strings, return the first one
+        end = data.find(b'\0', start, data_end)
+        if end == -1:
+            raise RPMHeaderError('Unterminated string in header')
+        return data[start:end]
+    elif tag_type == TYPE_INT32:
+        return INT32.unpack(data[start:start + INT32.size])[0]
+    elif tag_type == TYPE_BIN:
+        return data[start:start + count]
+    raise RPMHeaderError('Unsupported tag type %d' % tag_type)
+
+
+def _read_header(data, start, tags):
+    """
+    Reads the given tags from the header starting at the given position
+
+    :returns: tuple with the dict of tag values found and the position where
+        the header ends
+    """
+    _check_size(data, start + HEADER_INTRO.size)
+    magic, index_count, data_size = HEADER_INTRO.unpack(
+        data[start:start + HEADER_INTRO.size]
+    )
+    if magic != HEADER_MAGIC:
+        raise RPMHeaderError('Bad header magic')
+    index_start = start + HEADER_INTRO.size
+    data_start = index_start + index_count * INDEX_ENTRY.size
+    data_end = data_start + data_size
+    _check_size(data, data_end)
+    values = {}
+    for pos in range(index_start, data_start, INDEX_ENTRY.size):
+        tag, tag_type, offset, count = INDEX_ENTRY.unpack(
+            data[pos:pos + INDEX_ENTRY.size]
+        )
+        if tag in tags:
+            values[tag] = _read_value(
+                data, data_start, data_end, tag_type, offset, count,
+            )
+    return values, data_end
+
+
+def parse_header(data):
+    """
+    Extracts the metadata repoman uses from the beginning of an rpm file.
+
+    :param data: Buffer with the contents of the rpm file (or at least the
+        lead and headers), anything that supports slicing like a string or an
+        mmap object
+    :returns: dict with the name, version, release, arch, is_source,
+        sourcerpm and signature of the package
+    :raises TruncatedHeaderError: if data ends before the end of the headers
+    :raises RPMHeaderError: if the data is not a valid rpm
+    """
+    _check_size(data, LEAD_SIZE)
+    if data[:len(LEAD_MAGIC)] != LEAD_MAGIC:
+        raise RPMHeaderError('Bad rpm lead magic')
+    lead_type = LEAD_TYPE.unpack(data[6:8])[0]
+    signature, sig_end = _read_header(data, LEAD_SIZE, SIGNATURE_TAGS)
+    # the signature header is padded to 8 bytes
+    header_start = sig_end + (8 - sig_end % 8) % 8
+    header, _ = _read_header(data, header_start, HEADER_TAGS)
+    if (
+        RPMTAG_SOURCEPACKAGE not in header
+        and RPMTAG_SOURCERPM not in header
+    ):
+        # as rpm does, make sure one of them is there, this only happens on
+        # really old packages
+        if lead_type == LEAD_TYPE_SOURCE:
+            header[RPMTAG_SOURCEPACKAGE] = 1
+        else:
+            header[RPMTAG_SOURCERPM] = b'(none)'
+    return {
+        'name': header.get(RPMTAG_NAME),
+        'version': header.get(RPMTAG_VERSION),
+        'release': header.get(RPMTAG_RELEASE),
+        'arch': header.get(RPMTAG_ARCH),
+        'is_source': header.get(RPMTAG_SOURCEPACKAGE) and True or False,
+        'sourcerpm': header.get(RPMTAG_SOURCERPM),
+        'signature': any(signature.values()),
+    }
+
+
+def read_header(fdno):
+    """
+    Extracts the metadata repoman uses from an open rpm file, mapping it in
+    memory so only the pages of the headers are actually read.
+
+    :param fdno: Open file object for the rpm
+    :returns: same as `parse_header`
+    """
+    try:
+        data = mmap.mmap(fdno.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        # empty files can't be mapped
+        raise RPMHeaderError('Empty rpm file')
+    try:
+        return parse_header(data)
+    except TruncatedHeaderError:
+        raise RPMHeaderError('Truncated rpm file')
+    finally:
+        data.close()
@@ -1,11 +1,20 @@
 #!/usr/bin/env python
 import logging
+import os
 from abc import (
     ABCMeta,
     abstractmethod,
     abstractproperty,
 )
-from ..utils import get_plugins
+from ..index import (
+    ArtifactIndex,
+    stat_validator,
+)
+from ..utils import (
+    get_plugins,
+    hash_files,
+    scan_tree,
+)
 
 
 __all__ = get_plugins(plugin_dir=__file__.rsplit('/', 1)[0])
@@ -30,6 +39,8 @@ class ArtifactStore(object):
     def __init__(self, config, artifacts):
         self.config = config
         self.artifacts = artifacts
+        # metadata index of the loaded repo, if any
+        self.index = None
         super(ArtifactStore, self).__init__()
 
     @classmethod
@@ -50,6 +61,13 @@ class ArtifactStore(object):
         """
         pass
 
+    @abstractproperty
+    def ARTIFACT_EXTENSION(self):
+        """
+        Extension of the files this store loads from a repository
+        """
+        pass
+
     @abstractmethod
     def handles_artifact(self, artifact_str):
         """
@@ -66,9 +84,135 @@ class ArtifactStore(object):
         This method adds an artifact to the store
 
         :param artifact: full path or url to the artifact
+        :returns: the artifact instance, or None if it was skipped
         """
         pass
 
+    @classmethod
+    def handles_file(cls, file_name):
+        """
+        Returns True if the given file, found when loading a repository, has
+        to be loaded into this store
+
+        :param file_name: name of the file
+        """
+        return file_name.endswith(cls.ARTIFACT_EXTENSION)
+
+    @classmethod
+    def guess_name(cls, artifact_str):
+        """
+        Guesses the name of the given artifact from its path or url, without
+        reading it, used to keep together the artifacts with the same name.
+        By default the name is unknown.
+
+        :param artifact_str: full path or url to the artifact
+        :returns: the guessed name, or None if it can't be guessed
+        """
+        return None
+
+    def inspect_artifacts(self, paths):
+        """
+        Extracts in bulk the metadata of the given local artifacts, so the
+        stores can speed up the loading of many artifacts at once. By default
+        it does nothing and each artifact is inspected when added.
+
+        :param paths: List of paths to the artifacts to inspect
+        :returns: dict with the metadata for each of the inspected paths
+        """
+        return {}
+
+    def load_artifacts(self, repo_path, entries=None):
+        """
+        Adds to the store all the artifacts under the given path, without
+        copying them.
+
+        If the metadata index is configured, it will be used to avoid
+        inspecting the artifacts that did not change since the last load.
+
+        :param repo_path: Path to the repository to load
+        :param entries: File entries for the artifacts to load, as returned
+            by `repoman.common.utils.scan_tree`, if not passed the repo path
+            will be scanned
+        """
+        logger.info('Loading repo %s', repo_path)
+        if entries is None:
+            entries = [
+                entry for entry in scan_tree(repo_path)
+                if self.handles_file(entry.name)
+            ]
+        index = ArtifactIndex.from_config(
+            config=self.config,
+            repo_path=repo_path,
+            table=self.CONFIG_SECTION,
+        )
+        validators = {}
+        metadatas = {}
+        if index is not None:
+            for entry in entries:
+                validators[entry.path] = stat_validator(entry.stat())
+                metadata = index.get(entry.path, validators[entry.path])
+                if metadata is not None:
+                    metadatas[entry.path] = metadata
+        indexed = set(metadatas)
+        metadatas.update(self.inspect_artifacts([
+            entry.path
+            for entry in entries
+            if entry.path not in indexed
+        ]))
+        for entry in entries:
+            artifact = self.add_artifact(
+                entry.path,
+                to_copy=False,
+                hidelog=True,
+                metadata=metadatas.get(entry.path),
+            )
+            if index is not None and artifact and entry.path not in indexed:
+                index.set(
+                    entry.path,
+                    validators[entry.path],
+                    artifact.get_metadata(),
+                )
+        if index is not None:
+            index.prune()
+            index.commit()
+        self.index = index
+        logger.info('Repo %s loaded', repo_path)
+
+    def hash_artifacts(self, artifacts):
+        """
+        Calculates in parallel the checksums of the given artifacts that don't
+        have them yet, and stores them in the metadata index if any, so they
+        will not be calculated again until the files change.
+
+        :param artifacts: Artifacts to get the checksums for
+        """
+        pending = {}
+        for artifact in artifacts:
+            if not artifact.has_checksums:
+                pending.setdefault(artifact.path, []).append(artifact)
+        if not pending:
+            return
+        logger.debug('Calculating checksums of %d files', len(pending))
+        checksums = hash_files(
+            pending.keys(),
+            workers=self.config.getint('hash_workers'),
+        )
+        for path, path_artifacts in pending.iteritems():
+            for artifact in path_artifacts:
+                artifact.set_checksums(checksums[path])
+            if self.index is None:
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            metadata = path_artifacts[0].get_metadata()
+            # the artifact might have been copied since it was created
+            metadata['inode'] = stat.st_ino
+            self.index.set(path, stat_validator(stat), metadata)
+        if self.index is not None:
+            self.index.commit()
+
     @abstractproperty
     def path_prefix(self):
         """
@@ -102,14 +246,32 @@ class ArtifactStore(object):
         :param num: number of newest versions to return
         :rtype: `repoman.common.artifact.Artifact`
         """
-        latest = self.get_latest(num=num)
-        logging.debug('Got latest: %s', latest)
         return [
-            pkg
-            for pkg
-            in self.get_artifacts(fmatch=lambda art: art not in latest)
+            artifact
+            for _, version in self.get_old_versions(num=num)
+            for artifact in version.get_artifacts()
         ]
 
+    def get_old_versions(self, num=1):
+        """
+        Returns the versions not in the latest num versions for each artifact
+        in the store, computed in a single pass over the sorted versions.
+
+        :param num: number of newest versions to skip
+        :returns: list of (name, `repoman.common.artifact.ArtifactVersion`)
+        """
+        return self.artifacts.get_all_but_latest(num=num)
+
+    def forget_versions(self, versions):
+        """
+        Removes the given versions from the store, without touching the files
+
+        :param versions: list of (name, ArtifactVersion) as returned by
+            `get_old_versions`
+        """
+        for name, version in versions:
+            self.artifacts.pop_version(name, version.version)
+
     def get_empty_copy(self):
         """
         Returns an empty copy of this store
@@ -167,5 +329,21 @@ def has_store(artifact, stores):
         for store in stores
     )
 
+
+def get_name_key(artifact, stores):
+    """
+    Gets the key to sort the given artifact by, so the artifacts with the
+    same name, as guessed from their paths by the first store that handles
+    them, end up together
+
+    :param artifact: full path or url to the artifact
+    :param stores: stores to look into
+    :returns: tuple with the guessed name (empty if unknown) and the artifact
+    """
+    for store in stores:
+        if store.handles_artifact(artifact):
+            return (store.guess_name(artifact) or '', artifact)
+    return ('', artifact)
+
 # Force the load of all the plugins
 from . import *  # noqa
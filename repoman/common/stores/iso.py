@@ -18,15 +18,16 @@ import os
 import re
 import logging
 from getpass import getpass
+
+from six.moves import intern
+
 from . import ArtifactStore
 from ..utils import (
     save_file,
-    list_files,
     sign_detached,
 )
 from ..artifact import (
     Artifact,
-    ArtifactName,
     ArtifactList,
 )
 
@@ -45,22 +46,38 @@ class WrongIsoError(Exception):
 
 
 class Iso(Artifact):
-    def __init__(self, path, temp_dir, verify_ssl=True):
+    __slots__ = ('_name', '_version')
+
+    def __init__(self, path, temp_dir, verify_ssl=True, metadata=None,
+                 metadata_only=False):
         nv_match = re.match(ISO_REGEX, path)
         if not nv_match:
             raise WrongIsoError(
                 "Can't extract name and version from %s"
                 % path,
             )
-        self._name = nv_match.groupdict().get('name')
+        name = nv_match.groupdict().get('name')
+        # the urls from the sources can be unicode, that can't be interned
+        if isinstance(name, unicode):
+            name = name.encode('utf-8')
+        self._name = intern(name)
         self._version = nv_match.groupdict().get('version')
         super(Iso, self).__init__(
             path=path,
             temp_dir=temp_dir,
             verify_ssl=verify_ssl,
+            metadata_only=metadata_only,
         )
-        with open(self.path) as fdno:
-            self.inode = os.fstat(fdno.fileno()).st_ino
+        if metadata is None and self.path.startswith(('http:', 'https:')):
+            # name and version come from the file name, so for a not
+            # downloaded url there's nothing else to get, use it as inode
+            metadata = {'inode': path}
+        if metadata is None:
+            with open(self.path) as fdno:
+                self.inode = os.fstat(fdno.fileno()).st_ino
+        else:
+            self.inode = metadata['inode']
+            self._checksums = metadata.get('checksums')
 
     @property
     def name(self):
@@ -108,6 +125,7 @@ class IsoStore(ArtifactStore):
         Passphrase for the above key
     """
 
+    ARTIFACT_EXTENSION = '.iso'
     CONFIG_SECTION = 'IsoStore'
     DEFAULT_CONFIG = {
         'temp_dir': 'generate',
@@ -116,10 +134,12 @@ class IsoStore(ArtifactStore):
         'signing_passphrase': 'ask',
     }
 
-    def __init__(self, config, repo_path=None):
+    def __init__(self, config, repo_path=None, entries=None):
         """
         :param path: Path to the repository directory, if passed it will
             automatically add all the isos under it to the repo if any.
+        :param entries: If passed, the already scanned file entries to load
+            from repo_path, instead of scanning it again
         """
         ArtifactStore.__init__(
             self,
@@ -135,14 +155,7 @@ class IsoStore(ArtifactStore):
         if self.sign_key and self.sign_passphrase == 'ask':
             self.sign_passphrase = getpass('Key passphrase: ')
         if repo_path:
-            logger.info('Loading repo %s', repo_path)
-            for iso in list_files(repo_path, '.iso'):
-                self.add_artifact(
-                    iso,
-                    to_copy=False,
-                    hidelog=True,
-                )
-            logger.info('Repo %s loaded', repo_path)
+            self.load_artifacts(repo_path, entries)
 
     @property
     def path_prefix(self):
@@ -158,10 +171,18 @@ class IsoStore(ArtifactStore):
             logger.debug('  It is not')
             return False
 
+    @classmethod
+    def guess_name(cls, artifact_str):
+        nv_match = re.match(ISO_REGEX, artifact_str)
+        if not nv_match:
+            return None
+        return nv_match.group('name')
+
     def add_artifact(self, iso, **args):
-        self.add_iso(iso, **args)
+        return self.add_iso(iso, **args)
 
-    def add_iso(self, iso, onlyifnewer=False, to_copy=True, hidelog=False):
+    def add_iso(self, iso, onlyifnewer=False, to_copy=True, hidelog=False,
+                metadata=None, metadata_only=False):
         """
         Generic functon to add an iso package to the repo.
 
@@ -174,11 +195,17 @@ class IsoStore(ArtifactStore):
             adding new packages to the repo.
         :param hidelog: If set to True will not show the extra information
             (used when loading a repository to avoid verbose output)
+        :param metadata: Already extracted metadata of the iso, if any
+        :param metadata_only: If set, urls will not be downloaded, useful
+            when the iso is only needed to decide if it has to be added
+        :returns: the added Iso instance
         """
         iso = Iso(
             iso,
             temp_dir=self.config.get('temp_dir'),
-            verify_ssl=self.config.getboolean('verify_ssl')
+            verify_ssl=self.config.getboolean('verify_ssl'),
+            metadata=metadata,
+            metadata_only=metadata_only,
         )
         if self.artifacts.add_pkg(iso, onlyifnewer):
             if to_copy:
@@ -189,6 +216,7 @@ class IsoStore(ArtifactStore):
             if not hidelog:
                 logger.info("Not adding %s, there's already an equal or "
                             "newer version", iso)
+        return iso
 
     def save(self, **args):
         self._save(**args)
@@ -223,7 +251,7 @@ class IsoStore(ArtifactStore):
 
         :param iso: ISO instance of the package to compare
         """
-        verlist = self.artifacts.get(iso.full_name, {})
+        verlist = self.artifacts.get(iso.name)
         if not verlist or iso.version in verlist.get_latest():
             return True
         return False
@@ -236,20 +264,13 @@ class IsoStore(ArtifactStore):
         :param noop: If set, will only log what will be done, not actually
             doing anything.
         """
-        new_isos = ArtifactList(self.artifacts)
         for name, versions in self.artifacts.iteritems():
-            if len(versions) <= keep:
-                continue
-            to_keep = ArtifactName()
-            for _ in range(keep):
-                latest = versions.get_latest()
-                to_keep.update(latest)
-                versions.pop(latest.keys()[0])
-            new_isos[name] = to_keep
+            to_keep = versions.get_latest(num=keep) or {}
             for version in versions.keys():
+                if version in to_keep:
+                    continue
                 logger.info('Deleting %s version %s', name, version)
-                versions.del_version(version, noop)
-        self.artifacts = new_isos
+                versions.delete_version(version, noop)
 
     def get_artifacts(self, regmatch=None, fmatch=None):
         """
@@ -281,7 +302,9 @@ class IsoStore(ArtifactStore):
         Sign all the isos in the repo.
         """
         passphrase = self.sign_passphrase
-        for iso in self.get_artifacts():
+        isos = self.get_artifacts()
+        self.hash_artifacts(isos)
+        for iso in isos:
             logger.info('Signing %s', iso)
             iso.sign(self.sign_key, passphrase)
         logger.info("Done signing")
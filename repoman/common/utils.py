@@ -1,5 +1,7 @@
 #!/usr/bin/env python
+import errno
 import glob
+import hashlib
 import logging
 import os
 import pprint
@@ -7,10 +9,24 @@ import shutil
 import string
 import subprocess
 import sys
+import threading
+import time
+from collections import defaultdict
 from functools import partial
+from multiprocessing.pool import ThreadPool
 
-import requests
 import gnupg
+from requests.exceptions import RequestException
+
+from . import http_client
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 
 logger = logging.getLogger(__name__)
@@ -21,6 +37,16 @@ class NotSamePackage(Exception):
     pass
 
 
+class NotModified(Exception):
+    """Thrown when a conditional download was not needed"""
+    pass
+
+
+class ChecksumError(Exception):
+    """Thrown when a downloaded file does not match the expected checksum"""
+    pass
+
+
 def get_gpg(homedir=os.path.expanduser('~/.gnupg'), use_agent=False):
     try:
         # older gnupg
@@ -116,19 +142,98 @@ def get_plugins(plugin_dir=None):
     return modules
 
 
+class FileEntry(object):
+    """
+    Minimal stand-in for the entries returned by scandir, used when it's not
+    available
+    """
+    __slots__ = ('path', 'name', '_stat')
+
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        self._stat = None
+
+    def stat(self):
+        if self._stat is None:
+            self._stat = os.stat(self.path)
+        return self._stat
+
+
+def _scan_dir(dir_path):
+    """
+    Lists a single directory, returning the paths of the subdirectories to
+    descend into and the entries of the files in it. As os.walk does, it
+    does not descend into symlinked directories and ignores any errors.
+    """
+    subdirs = []
+    files = []
+    try:
+        if scandir is not None:
+            for entry in scandir(dir_path):
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        subdirs.append(entry.path)
+                else:
+                    files.append(entry)
+        else:
+            for name in os.listdir(dir_path):
+                path = os.path.join(dir_path, name)
+                if os.path.isdir(path):
+                    if not os.path.islink(path):
+                        subdirs.append(path)
+                else:
+                    files.append(FileEntry(path, name))
+    except OSError as error:
+        logger.debug('Unable to scan %s: %s', dir_path, error)
+    return subdirs, files
+
+
+def scan_tree(base_path, workers=1):
+    """
+    Walks a directory tree only once, returning the entries of all the files
+    under it. Each entry has the `path` and `name` attributes and a `stat()`
+    method that caches its result, so it can be shared by all the consumers
+    of the walk without extra syscalls.
+
+    :param base_path: Path to the directory to walk
+    :param workers: If bigger than one, scan up to that number of
+        directories of the same level in parallel, useful for wide trees on
+        network filesystems
+    """
+    logger.debug('Scanning %s', base_path)
+    entries = []
+    pending = [base_path]
+    pool = ThreadPool(workers) if workers > 1 else None
+    try:
+        while pending:
+            if pool is not None and len(pending) > 1:
+                results = pool.map(_scan_dir, pending)
+            else:
+                results = [_scan_dir(dir_path) for dir_path in pending]
+            pending = []
+            for subdirs, files in results:
+                pending.extend(subdirs)
+                entries.extend(files)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    logger.debug('Found %d files under %s', len(entries), base_path)
+    return entries
+
+
 def find_recursive(base_path, fmatch):
     """
     Walks a directory recursively and returns the list of files for which
     fmatch(filename) returns True
     """
     logger.debug('Recursively looking into %s', base_path)
-    matched_files = []
-    for root, _, files in os.walk(base_path):
-        matched_files.extend([
-            os.path.join(root, fname)
-            for fname in files
-            if fmatch(fname)
-        ])
+    matched_files = [
+        entry.path
+        for entry in scan_tree(base_path)
+        if fmatch(entry.name)
+    ]
     logger.debug('Got matched artifacts: %s', matched_files)
     return matched_files
 
@@ -143,6 +248,93 @@ def tryint(mayint):
         return mayint
 
 
+def _version_part_key(part):
+    """
+    Numeric parts sort before any non numeric ones, as python 2 does when
+    comparing ints and strings
+    """
+    try:
+        return (0, int(part))
+    except ValueError:
+        return (1, part)
+
+
+def _ver_key(ver):
+    return tuple(_version_part_key(part) for part in ver.split('.'))
+
+
+# least recently used cache of the already calculated version keys, a repo
+# usually has a few thousand distinct versions, so the limit is only reached
+# when handling huge repos, and then the versions in use are kept.
+# Each entry is a [prev, next, version, key] link of a circular list that
+# goes from the least to the most recently used, with _VERSION_KEYS_ROOT as
+# the sentinel. The sources expand in threads, so the cache is only changed
+# while holding _VERSION_KEYS_LOCK.
+_VERSION_KEYS = {}
+_VERSION_KEYS_ROOT = []
+_VERSION_KEYS_ROOT[:] = [_VERSION_KEYS_ROOT, _VERSION_KEYS_ROOT, None, None]
+_VERSION_KEYS_MAX = 100000
+_VERSION_KEYS_LOCK = threading.Lock()
+
+
+def version_key(fullver):
+    """
+    Returns a key that can be compared with the keys of other versions, in
+    the same order that `cmpfullver` uses, but from oldest to newest, so
+    `sorted(versions, key=version_key, reverse=True)` is the same as
+    `sorted(versions, cmp=cmpfullver)`.
+
+    The keys are cached, so it's cheap to call it repeatedly for the same
+    version.
+
+    :param fullver: version string in the form x.y.z-a.b.c
+    """
+    root = _VERSION_KEYS_ROOT
+    with _VERSION_KEYS_LOCK:
+        link = _VERSION_KEYS.get(fullver)
+        if link is not None:
+            # move it to the most recently used end
+            prev, next_, _, key = link
+            prev[1] = next_
+            next_[0] = prev
+            last = root[0]
+            last[1] = root[0] = link
+            link[0] = last
+            link[1] = root
+            return key
+    ver, rel = split(fullver, '-', 1)
+    key = (_ver_key(ver), _ver_key(rel))
+    with _VERSION_KEYS_LOCK:
+        if fullver in _VERSION_KEYS:
+            # another thread added it meanwhile
+            return _VERSION_KEYS[fullver][3]
+        if len(_VERSION_KEYS) >= _VERSION_KEYS_MAX:
+            # drop the least recently used link
+            link = root[1]
+            del _VERSION_KEYS[link[2]]
+            root[1] = link[1]
+            link[1][0] = root
+        last = root[0]
+        last[1] = root[0] = _VERSION_KEYS[fullver] = [last, root, fullver, key]
+    return key
+
+
+def clear_version_keys():
+    """
+    Empties the cache of version keys
+    """
+    with _VERSION_KEYS_LOCK:
+        _VERSION_KEYS.clear()
+        _VERSION_KEYS_ROOT[:] = [
+            _VERSION_KEYS_ROOT, _VERSION_KEYS_ROOT, None, None,
+        ]
+
+
+def _cmpkeys(key1, key2):
+    # newest first, as the version comparison functions always did
+    return (key2 > key1) - (key2 < key1)
+
+
 def cmpver(ver1, ver2):
     """
     Compares two version in a natural sort ordering fashion (what you usually
@@ -150,29 +342,17 @@ def cmpver(ver1, ver2):
     Thought for version strings in the form:
        x.y.z
     """
-    ver1 = '.' in ver1 and ver1.split('.') or (ver1,)
-    ver2 = '.' in ver2 and ver2.split('.') or (ver2,)
-    ver1 = [tryint(i) for i in ver1]
-    ver2 = [tryint(i) for i in ver2]
-    if ver1 > ver2:
-        return -1
-    if ver1 == ver2:
-        return 0
-    else:
-        return 1
+    return _cmpkeys(_ver_key(ver1), _ver_key(ver2))
 
 
 def cmpfullver(fullver1, fullver2):
     """
     Compares version strings in the form:
        x.y.z-a.b.c
+
+    Prefer sorting with `version_key` where possible
     """
-    ver1, rel1 = split(fullver1, '-', 1)
-    ver2, rel2 = split(fullver2, '-', 1)
-    ver_res = cmpver(ver1, ver2)
-    if ver_res != 0:
-        return ver_res
-    return cmpver(rel1, rel2)
+    return _cmpkeys(version_key(fullver1), version_key(fullver2))
 
 
 def print_busy(prev_pos=0):
@@ -208,61 +388,193 @@ def to_human_size(fsize):
     return '%dB' % fsize
 
 
-def download(path, dest_path, tries=3, verify=True):
+def fetch_range(url, start, end, verify=True):
+    """
+    Gets only the given byte range of a url, using an HTTP Range request.
+
+    :param url: Url to get the bytes from
+    :param start: First byte to get
+    :param end: Last byte to get (included)
+    :param verify: If False, will not check the ssl certificates
+    :returns: the bytes got, that might be less than requested if the file
+        is shorter, or None if the server does not support range requests
+    """
+    headers = dict(http_client.RAW_HEADERS)
+    headers['Range'] = 'bytes=%d-%d' % (start, end)
+    response = http_client.get(
+        url,
+        headers=headers,
+        stream=True,
+        verify=verify,
+    )
+    try:
+        if response.status_code == 416:
+            # asked for a range past the end of the file
+            return b''
+        response.raise_for_status()
+        if response.status_code != 206:
+            logger.debug('Range requests not supported for %s', url)
+            return None
+        return response.content
+    finally:
+        response.close()
+
+
+def _new_hashes():
+    return [
+        (algorithm, hashlib.new(algorithm))
+        for algorithm in HASH_ALGORITHMS
+    ]
+
+
+def _show_progress(progress_size, length, prev_percent):
+    """
+    Updates the progress bar started by `download`, returns the new position
+    """
+    if not length:
+        return print_busy(prev_percent)
+    cur_percent = min(int(progress_size * 100 / length), 100)
+    if cur_percent > prev_percent:
+        sys.stdout.write('=' * (cur_percent - prev_percent))
+        sys.stdout.flush()
+    return max(cur_percent, prev_percent)
+
+
+def download(path, dest_path, tries=3, verify=True, session=None,
+             progress=True, headers=None, checksums=None):
     """
     Download a package from a url.
+
+    The file is written first to dest_path + '.part', and if the connection
+    drops it's resumed from where it was left (if the server supports range
+    requests). The file is hashed while being written.
+
+    :param path: Url to download
+    :param dest_path: Path to save the file to
+    :param tries: Number of times to retry after an error
+    :param verify: If False, will not check the ssl certificates
+    :param session: `requests.Session` to use, the shared one from
+        `repoman.common.http_client` by default
+    :param progress: If False, will not show the progress bar, needed when
+        downloading several files at the same time
+    :param headers: Extra headers for the request, for example for
+        conditional requests
+    :param checksums: Expected checksums of the file, as a dict of algorithm
+        and hex digest, any of `HASH_ALGORITHMS`
+    :returns: tuple with the checksums of the downloaded file (as returned by
+        `hash_file`) and the headers of the response
+    :raises NotModified: if the server replied that the file did not change,
+        only when passing conditional headers
+    :raises ChecksumError: if the file does not match the expected checksums
     """
-    headers = requests.head(path, verify=verify)
-    chunk_size = 4096
-    # length == 0 means that we don't know the size
-    length = int(headers.headers.get('content-length', 0)) or 0
-    logging.info('Downloading %s, length %s ...',
-                 path,
-                 length and to_human_size(length) or 'unknown')
-    num_dots = 100
-    dot_frec = (length / num_dots) or 1
-    stream = requests.get(path, stream=True, verify=verify)
-    while not stream and tries:
-        stream = requests.get(path, stream=True, verify=verify)
-        tries -= 1
-    if not tries:
-        raise Exception(
-            'Failed to download %s\n\tcode: %d\n\treason: %s' %
-            (stream.url, stream.status_code, stream.reason)
-        )
+    http = session or http_client.get_session()
+    req_headers = dict(http_client.RAW_HEADERS)
+    req_headers.update(headers or {})
+    part_path = dest_path + '.part'
+    chunk_size = 64 * 1024
+    hashes = _new_hashes()
+    written = 0
+    length = 0
+    failures = 0
     prev_percent = 0
-    progress = 0
-    if length:
-        cur_percent = 0
-        sys.stdout.write(
-            '    %[' +
-            '-' * 23 + '25' + '-' * 24 +
-            '50' +
-            '-' * 23 + '75' + '-' * 24 +
-            ']\r' + '    %['
-        )
-    sys.stdout.flush()
-    with open(dest_path, 'w') as rpm_fd:
-        for chunk in stream.iter_content(chunk_size=chunk_size):
-            if chunk:
-                rpm_fd.write(chunk)
-                progress += len(chunk)
-                cur_percent = int(progress / dot_frec)
-                if length and cur_percent > prev_percent:
-                    for _ in xrange(cur_percent - prev_percent):
-                        sys.stdout.write('=')
-                    sys.stdout.flush()
-                    prev_percent = cur_percent
-                elif not length:
-                    prev_percent = print_busy(prev_percent)
-    if length:
-        if cur_percent < num_dots:
-            sys.stdout.write('=')
+    with open(part_path, 'wb') as part_fd:
+        while True:
+            if written:
+                req_headers['Range'] = 'bytes=%d-' % written
+            try:
+                response = http.get(
+                    path, stream=True, verify=verify, headers=req_headers,
+                )
+                try:
+                    if response.status_code == 304:
+                        raise NotModified(path)
+                    if 400 <= response.status_code < 500:
+                        # no point on retrying
+                        os.remove(part_path)
+                        raise Exception(
+                            'Failed to download %s\n\treason: %s'
+                            % (path, response2str(response))
+                        )
+                    response.raise_for_status()
+                    if written and response.status_code != 206:
+                        logger.info(
+                            'Unable to resume %s, starting again', path,
+                        )
+                        part_fd.seek(0)
+                        part_fd.truncate()
+                        hashes = _new_hashes()
+                        written = 0
+                    if not length:
+                        length = written + int(
+                            response.headers.get('content-length', 0)
+                        )
+                        logging.info(
+                            'Downloading %s, length %s ...',
+                            path,
+                            length and to_human_size(length) or 'unknown',
+                        )
+                        if length and progress:
+                            sys.stdout.write(
+                                '    %[' +
+                                '-' * 23 + '25' + '-' * 24 +
+                                '50' +
+                                '-' * 23 + '75' + '-' * 24 +
+                                ']\r' + '    %['
+                            )
+                            sys.stdout.flush()
+                    for chunk in response.iter_content(chunk_size=chunk_size):
+                        if not chunk:
+                            continue
+                        part_fd.write(chunk)
+                        for _, file_hash in hashes:
+                            file_hash.update(chunk)
+                        written += len(chunk)
+                        if progress:
+                            prev_percent = _show_progress(
+                                written, length, prev_percent,
+                            )
+                    response_headers = response.headers
+                finally:
+                    response.close()
+                if length and written < length:
+                    raise IOError(
+                        'Got only %d of %d bytes' % (written, length)
+                    )
+                break
+            except (RequestException, IOError) as error:
+                failures += 1
+                if failures > tries:
+                    os.remove(part_path)
+                    raise Exception(
+                        'Failed to download %s\n\treason: %s' % (path, error)
+                    )
+                logger.warn(
+                    'Error downloading %s at byte %d, retrying: %s',
+                    path,
+                    written,
+                    error,
+                )
+                time.sleep(failures)
+            except NotModified:
+                os.remove(part_path)
+                raise
+    if progress and length:
         sys.stdout.write(']\n')
-        sys.stdout.flush()
-    else:
-        sys.stdout.flush()
-        logging.info('    Done')
+    sys.stdout.flush()
+    logging.info('    Done %s', path)
+    got_checksums = dict(
+        (algorithm, file_hash.hexdigest())
+        for algorithm, file_hash in hashes
+    )
+    for algorithm, expected in (checksums or {}).iteritems():
+        if got_checksums.get(algorithm, expected) != expected:
+            os.remove(part_path)
+            raise ChecksumError(
+                'Wrong %s checksum for %s, expected %s and got %s'
+                % (algorithm, path, expected, got_checksums[algorithm])
+            )
+    os.rename(part_path, dest_path)
+    return got_checksums, response_headers
 
 
 def copy(what, where):
@@ -413,14 +725,89 @@ def save_file(src_path, dst_path):
     copy(src_path, dst_path)
 
 
+# checksums calculated for each artifact, and size of the chunks to read the
+# files in, big enough for hashlib to release the GIL and avoid syscalls
+HASH_ALGORITHMS = ('md5', 'sha1', 'sha256')
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path, algorithms=HASH_ALGORITHMS):
+    """
+    Calculates several digests of a file in a single pass, reading it in
+    chunks so big files are never loaded whole in memory.
+
+    :param path: Path to the file to hash
+    :param algorithms: Names of the hashlib algorithms to use
+    :returns: dict with the hex digest for each algorithm
+    """
+    hashes = [(algorithm, hashlib.new(algorithm)) for algorithm in algorithms]
+    with open(path, 'rb') as fdno:
+        for chunk in iter(partial(fdno.read, HASH_CHUNK_SIZE), b''):
+            for _, file_hash in hashes:
+                file_hash.update(chunk)
+    return dict(
+        (algorithm, file_hash.hexdigest())
+        for algorithm, file_hash in hashes
+    )
+
+
+def hash_files(paths, workers=1):
+    """
+    Calculates the digests of several files, hashlib releases the GIL while
+    hashing so the files are hashed in parallel using threads.
+
+    :param paths: Paths of the files to hash
+    :param workers: Maximum number of files to hash at the same time
+    :returns: dict with the digests, as returned by `hash_file`, for each
+        path
+    """
+    paths = list(paths)
+    if workers > 1 and len(paths) > 1:
+        pool = ThreadPool(min(workers, len(paths)))
+        try:
+            results = pool.map(hash_file, paths)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [hash_file(path) for path in paths]
+    return dict(zip(paths, results))
+
+
+def remove_files(paths):
+    """
+    Removes the given files, grouped by directory so each directory is only
+    visited once, ignoring the ones that are already gone.
+
+    :param paths: iterable with the paths of the files to remove
+    :returns: number of files removed
+    """
+    by_dir = defaultdict(set)
+    for path in paths:
+        dir_path, file_name = os.path.split(path)
+        by_dir[dir_path].add(file_name)
+    removed = 0
+    for dir_path in sorted(by_dir):
+        dir_removed = 0
+        for file_name in sorted(by_dir[dir_path]):
+            try:
+                os.remove(os.path.join(dir_path, file_name))
+                dir_removed += 1
+            except OSError as exc:
+                if exc.errno != errno.ENOENT:
+                    raise
+        logger.debug('Cleaned up %d files from %s', dir_removed, dir_path)
+        removed += dir_removed
+    return removed
+
+
 def list_files(path, extension):
     '''Find all the files with the given extension under the given dir'''
-    files_found = []
-    for root, _, files in os.walk(path):
-        for fname in files:
-            if fname.endswith(extension):
-                files_found.append(root + '/' + fname)
-    return files_found
+    return [
+        entry.path
+        for entry in scan_tree(path)
+        if entry.name.endswith(extension)
+    ]
 
 
 def split(what, separator, num_results=None):
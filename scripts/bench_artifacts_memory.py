@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Measures the memory footprint of the artifacts held by a big rpm store.
+
+It builds the given number of RPM instances from metadata (as when loading a
+repository with the metadata index), without touching any file, and prints
+the RSS growth per artifact. To compare two revisions, run it from a checkout
+of each of them with the same python, for example:
+
+    git worktree add /tmp/before <revision>
+    cp scripts/bench_artifacts_memory.py /tmp/before/scripts/
+    python /tmp/before/scripts/bench_artifacts_memory.py
+    python scripts/bench_artifacts_memory.py
+"""
+import argparse
+import gc
+import os
+import resource
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from repoman.common.stores.RPM import RPM  # noqa
+
+
+NAMES = 2000
+ARCHS = ('x86_64', 'noarch', 'i686')
+DISTROS = ('el7', 'fc24', 'fc25')
+
+
+def get_rss_kb():
+    # on linux, the max RSS is reported in kilobytes
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def get_metadata(num):
+    name = 'package-%d' % (num % NAMES)
+    version = '1.%d' % (num // NAMES)
+    release = '1.%s' % DISTROS[num % len(DISTROS)]
+    arch = ARCHS[num % len(ARCHS)]
+    return {
+        'inode': num,
+        'name': name,
+        'version': version,
+        'release': release,
+        'arch': arch,
+        'is_source': False,
+        'sourcerpm': '%s-%s-%s.src.rpm' % (name, version, release),
+        'signature': False,
+    }
+
+
+def build_artifacts(count):
+    artifacts = []
+    for num in range(count):
+        metadata = get_metadata(num)
+        artifacts.append(RPM(
+            path='/repo/rpm/%s-%s-%s.%s.rpm' % (
+                metadata['name'],
+                metadata['version'],
+                metadata['release'],
+                metadata['arch'],
+            ),
+            metadata=metadata,
+        ))
+    return artifacts
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '-c', '--count',
+        type=int,
+        default=100000,
+        help='Number of artifacts to build (default: %(default)s)',
+    )
+    args = parser.parse_args(args)
+    gc.collect()
+    before = get_rss_kb()
+    artifacts = build_artifacts(args.count)
+    gc.collect()
+    after = get_rss_kb()
+    print(
+        '%d artifacts: %d KB of RSS, %d bytes per artifact' % (
+            len(artifacts),
+            after - before,
+            (after - before) * 1024 // len(artifacts),
+        )
+    )
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
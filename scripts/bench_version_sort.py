@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Measures the time to sort many version strings.
+
+It sorts the given number of nightly-style versions (x.y.z-r.gitsha.distro)
+by `repoman.common.utils.version_key`, with an empty and with a warm cache,
+and with a copy of the `cmpfullver` comparator the stores used before
+sorting by key, checking that both give the same ordering.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from repoman.common import utils  # noqa
+
+
+def baseline_tryint(mayint):
+    try:
+        return int(mayint)
+    except ValueError:
+        return mayint
+
+
+def baseline_cmpver(ver1, ver2):
+    ver1 = '.' in ver1 and ver1.split('.') or (ver1,)
+    ver2 = '.' in ver2 and ver2.split('.') or (ver2,)
+    ver1 = [baseline_tryint(i) for i in ver1]
+    ver2 = [baseline_tryint(i) for i in ver2]
+    if ver1 > ver2:
+        return -1
+    if ver1 == ver2:
+        return 0
+    else:
+        return 1
+
+
+def baseline_cmpfullver(fullver1, fullver2):
+    """
+    The comparator used before `version_key`, kept here as the reference
+    """
+    ver1, rel1 = utils.split(fullver1, '-', 1)
+    ver2, rel2 = utils.split(fullver2, '-', 1)
+    ver_res = baseline_cmpver(ver1, ver2)
+    if ver_res != 0:
+        return ver_res
+    return baseline_cmpver(rel1, rel2)
+
+
+def get_versions(count, seed):
+    rand = random.Random(seed)
+    versions = []
+    for _ in range(count):
+        versions.append('%d.%d.%d-%d.%d.git%07x.%s' % (
+            rand.randint(0, 4),
+            rand.randint(0, 20),
+            rand.randint(0, 50),
+            rand.randint(0, 3),
+            rand.randint(20160101, 20171231),
+            rand.getrandbits(28),
+            rand.choice(('el7', 'fc24', 'fc25')),
+        ))
+    return versions
+
+
+def timed(what, func):
+    start = time.time()
+    result = func()
+    print('%-32s %6.2fs' % (what, time.time() - start))
+    return result
+
+
+def main(args):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument(
+        '-c', '--count',
+        type=int,
+        default=100000,
+        help='Number of versions to sort (default: %(default)s)',
+    )
+    parser.add_argument(
+        '-s', '--seed',
+        type=int,
+        default=0,
+        help='Seed for the random versions (default: %(default)s)',
+    )
+    args = parser.parse_args(args)
+    versions = get_versions(args.count, args.seed)
+    utils.clear_version_keys()
+    by_key = timed(
+        'sorted(key=version_key), cold',
+        lambda: sorted(versions, key=utils.version_key, reverse=True),
+    )
+    timed(
+        'sorted(key=version_key), warm',
+        lambda: sorted(versions, key=utils.version_key, reverse=True),
+    )
+    by_cmp = timed(
+        'sorted(cmp=baseline cmpfullver)',
+        lambda: sorted(versions, cmp=baseline_cmpfullver),
+    )
+    if by_key != by_cmp:
+        sys.exit('The orderings differ')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+from importlib import import_module
+
+import pytest
+
+from repoman.common.config import Config
+from repoman.common.index import (
+    ArtifactIndex,
+    stat_validator,
+)
+from repoman.common.stores.RPM import RPMStore
+
+
+# the module is shadowed by the RPM class in the package
+rpm_module = import_module('repoman.common.stores.RPM.RPM')
+
+
+FIXTURES_DIR = os.path.join(
+    os.path.dirname(__file__), '..', 'functional', 'fixtures',
+)
+
+
+@pytest.fixture
+def repo_dir(tmpdir):
+    repo_path = tmpdir.mkdir('repo')
+    for rpm_name in os.listdir(os.path.join(FIXTURES_DIR, 'latest_repo1')):
+        if rpm_name.endswith('.rpm'):
+            shutil.copy(
+                os.path.join(FIXTURES_DIR, 'latest_repo1', rpm_name),
+                str(repo_path),
+            )
+    return repo_path
+
+
+def get_store(repo_path, metadata_index='index.db', load_workers='1'):
+    config = Config()
+    config.set('metadata_index', metadata_index)
+    config.set('load_workers', load_workers)
+    return RPMStore(
+        config=config.get_section('store.RPMStore'),
+        repo_path=str(repo_path),
+    )
+
+
+def get_metadatas(store):
+    return sorted(
+        (artifact.path, artifact.get_metadata())
+        for artifact in store.get_artifacts()
+    )
+
+
+def count_reads(monkeypatch):
+    reads = []
+    read_rpm_metadata = rpm_module.read_rpm_metadata
+
+    def counting_read(path, *args, **kwargs):
+        reads.append(os.path.basename(path))
+        return read_rpm_metadata(path, *args, **kwargs)
+
+    monkeypatch.setattr(rpm_module, 'read_rpm_metadata', counting_read)
+    return reads
+
+
+def test_unchanged_entries_are_reused(tmpdir):
+    index_path = str(tmpdir.join('index.db'))
+    path = str(tmpdir.join('some.rpm'))
+    tmpdir.join('some.rpm').write('content')
+    validator = stat_validator(os.stat(path))
+    index = ArtifactIndex(index_path, 'RPMStore')
+    assert index.get(path, validator) is None
+    index.set(path, validator, {'name': 'some', 'inode': 1})
+    index.commit()
+
+    index = ArtifactIndex(index_path, 'RPMStore')
+    assert index.get(path, stat_validator(os.stat(path))) == {
+        'name': 'some',
+        'inode': 1,
+    }
+    # each table is independent
+    assert ArtifactIndex(index_path, 'IsoStore').get(path, validator) is None
+
+
+def test_changed_entries_are_not_reused(tmpdir):
+    index_path = str(tmpdir.join('index.db'))
+    path = str(tmpdir.join('some.rpm'))
+    tmpdir.join('some.rpm').write('content')
+    index = ArtifactIndex(index_path, 'RPMStore')
+    index.set(path, stat_validator(os.stat(path)), {'name': 'some'})
+    index.commit()
+
+    tmpdir.join('some.rpm').write('other content')
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+    index = ArtifactIndex(index_path, 'RPMStore')
+    assert index.get(path, stat_validator(os.stat(path))) is None
+
+
+def test_prune_removes_the_entries_not_seen(tmpdir):
+    index_path = str(tmpdir.join('index.db'))
+    index = ArtifactIndex(index_path, 'RPMStore')
+    index.set('/repo/kept.rpm', '1:1:1.0', {'name': 'kept'})
+    index.set('/repo/deleted.rpm', '2:2:2.0', {'name': 'deleted'})
+    index.commit()
+
+    index = ArtifactIndex(index_path, 'RPMStore')
+    assert index.get('/repo/kept.rpm', '1:1:1.0') == {'name': 'kept'}
+    index.prune()
+    index.commit()
+
+    index = ArtifactIndex(index_path, 'RPMStore')
+    assert index.get('/repo/kept.rpm', '1:1:1.0') == {'name': 'kept'}
+    assert index.get('/repo/deleted.rpm', '2:2:2.0') is None
+
+
+def test_load_artifacts_round_trip(repo_dir, monkeypatch):
+    expected = get_metadatas(get_store(repo_dir, metadata_index=''))
+    assert not repo_dir.join('index.db').exists()
+
+    reads = count_reads(monkeypatch)
+    assert get_metadatas(get_store(repo_dir)) == expected
+    assert len(reads) == len(expected)
+    assert repo_dir.join('index.db').exists()
+
+    # nothing changed, all the metadata comes from the index
+    del reads[:]
+    assert get_metadatas(get_store(repo_dir)) == expected
+    assert reads == []
+
+
+def test_load_artifacts_reads_only_the_changed_files(repo_dir, monkeypatch):
+    get_store(repo_dir)
+    changed = 'unsigned_rpm-1.0-2.fc21.x86_64.rpm'
+    deleted = 'unsigned_rpm-1.1-1.fc21.x86_64.rpm'
+    changed_path = str(repo_dir.join(changed))
+    stat = os.stat(changed_path)
+    os.utime(changed_path, (stat.st_atime, stat.st_mtime + 10))
+    repo_dir.join(deleted).remove()
+
+    reads = count_reads(monkeypatch)
+    store = get_store(repo_dir)
+    assert reads == [changed]
+    assert sorted(
+        os.path.basename(artifact.path) for artifact in store.get_artifacts()
+    ) == [
+        'unsigned_rpm-1.0-1.fc21.src.rpm',
+        changed,
+    ]
+    # the entry of the deleted file was pruned
+    index = ArtifactIndex(str(repo_dir.join('index.db')), 'RPMStore')
+    assert str(repo_dir.join(deleted)) not in index._entries
+
+
+@pytest.mark.parametrize('metadata_index', ['', 'index.db'])
+def test_parallel_load_gives_the_same_store(repo_dir, metadata_index):
+    expected = get_metadatas(
+        get_store(repo_dir, metadata_index='', load_workers='1')
+    )
+    assert len(expected) > 2
+    store = get_store(
+        repo_dir,
+        metadata_index=metadata_index,
+        load_workers='3',
+    )
+    assert get_metadatas(store) == expected
+    # the headers were really read by the pool
+    paths = [path for path, _ in expected]
+    assert sorted(store.inspect_artifacts(paths)) == paths
+    assert sorted(store.artifacts.keys()) == sorted(
+        get_store(repo_dir, metadata_index='').artifacts.keys()
+    )
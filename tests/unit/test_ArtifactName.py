@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+
+import random
+
+import pytest
+
+from repoman.common import utils
+from repoman.common.artifact import ArtifactName
+from repoman.common.utils import (
+    cmpfullver,
+    version_key,
+)
+
+
+VERSIONS = [
+    '1.0-1', '1.0-2', '1.0-10', '1.0.1-1', '1.1-0.1.rc1', '1.1-1',
+    '1.10-1', '2.0-1.el7', '2.0-1.fc21', '2.0a-1', '10.0-1',
+]
+
+
+class FakeArtifact(object):
+    def __init__(self, version):
+        self.version = version
+        self.inode = version
+        self.path = 'dummy-%s' % version
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_version_key_matches_cmpfullver(seed):
+    versions = list(VERSIONS)
+    random.Random(seed).shuffle(versions)
+    assert (
+        sorted(versions, key=version_key, reverse=True)
+        == sorted(versions, cmp=cmpfullver)
+    )
+
+
+def test_version_key_cache_drops_the_least_recently_used(monkeypatch):
+    monkeypatch.setattr(utils, '_VERSION_KEYS_MAX', 3)
+    utils.clear_version_keys()
+    for version in ('1.0-1', '1.0-2', '1.0-3'):
+        version_key(version)
+    # used again, so it's not the least recently used anymore
+    first_key = version_key('1.0-1')
+    assert version_key('1.0-1') is first_key
+    version_key('1.0-4')
+    assert sorted(utils._VERSION_KEYS) == ['1.0-1', '1.0-3', '1.0-4']
+    version_key('1.0-5')
+    assert sorted(utils._VERSION_KEYS) == ['1.0-1', '1.0-4', '1.0-5']
+    assert version_key('1.0-1') is first_key
+    assert version_key('1.0-2') == (((0, 1), (0, 0)), ((0, 2), ))
+    assert sorted(utils._VERSION_KEYS) == ['1.0-1', '1.0-2', '1.0-5']
+    utils.clear_version_keys()
+    assert utils._VERSION_KEYS == {}
+
+
+def test_get_latest_after_adding_and_removing():
+    versions = list(VERSIONS)
+    random.Random(0).shuffle(versions)
+    art_name = ArtifactName('dummy')
+    for version in versions:
+        art_name.add_artifact(FakeArtifact(version), onlyifnewer=False)
+
+    newest = sorted(VERSIONS, cmp=cmpfullver)
+    assert list(art_name.iter_newest()) == newest
+    assert sorted(art_name.get_latest(num=3)) == sorted(newest[:3])
+
+    art_name.delete_version(newest[0], noop=True)
+    art_name.pop(newest[1])
+    assert art_name.newest_version() == newest[2]
+    assert art_name.get_latest().keys() == [newest[2]]
+
+
+def test_add_only_if_newer():
+    art_name = ArtifactName('dummy')
+    assert art_name.add_artifact(FakeArtifact('1.1-1'), onlyifnewer=True)
+    assert not art_name.add_artifact(FakeArtifact('1.0-1'), onlyifnewer=True)
+    assert not art_name.add_artifact(FakeArtifact('1.1-1'), onlyifnewer=True)
+    assert art_name.add_artifact(FakeArtifact('1.1-2'), onlyifnewer=True)
+    assert list(art_name.iter_newest()) == ['1.1-2', '1.1-1']
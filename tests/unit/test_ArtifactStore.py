@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+
+import pytest
+
+from repoman.common import stores
+from repoman.common.config import Config
+from repoman.common.stores.iso import IsoStore
+from repoman.common.utils import hash_file
+
+
+FIXTURES_DIR = os.path.join(
+    os.path.dirname(__file__), '..', 'functional', 'fixtures',
+)
+
+
+@pytest.fixture
+def iso_store(tmpdir):
+    for file_name in os.listdir(os.path.join(FIXTURES_DIR, 'latest_repo1')):
+        if file_name.endswith('.iso'):
+            shutil.copy(
+                os.path.join(FIXTURES_DIR, 'latest_repo1', file_name),
+                str(tmpdir),
+            )
+    config = Config()
+    return IsoStore(
+        config=config.get_section('store.IsoStore'),
+        repo_path=str(tmpdir),
+    )
+
+
+def test_hash_artifacts_skips_the_already_hashed(iso_store, monkeypatch):
+    hashed = []
+    hash_files = stores.hash_files
+
+    def recording_hash_files(paths, workers=1):
+        paths = list(paths)
+        hashed.extend(paths)
+        return hash_files(paths, workers=workers)
+
+    monkeypatch.setattr(stores, 'hash_files', recording_hash_files)
+    artifacts = sorted(
+        iso_store.get_artifacts(), key=lambda artifact: artifact.path,
+    )
+    known = {'md5': 'known md5', 'sha1': 'known', 'sha256': 'known'}
+    artifacts[0].set_checksums(known)
+
+    iso_store.hash_artifacts(artifacts)
+    assert sorted(hashed) == [artifact.path for artifact in artifacts[1:]]
+    assert artifacts[0].checksums == known
+    for artifact in artifacts[1:]:
+        assert artifact.has_checksums
+        assert artifact.checksums == hash_file(artifact.path)
+
+    # all of them have checksums now
+    del hashed[:]
+    iso_store.hash_artifacts(artifacts)
+    assert hashed == []
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+
+import hashlib
+import os
+import threading
+
+import pytest
+from requests.exceptions import ChunkedEncodingError, HTTPError
+
+from repoman.common import downloader, utils
+
+
+def test_temp_paths_are_never_reused(tmpdir):
+    url = 'http://example.com/job1/artifact/some.rpm'
+    paths = [
+        downloader.get_temp_path(str(tmpdir), url),
+        downloader.get_temp_path(str(tmpdir), url),
+        downloader.get_temp_path(
+            str(tmpdir), 'http://example.com/job2/artifact/some.rpm',
+        ),
+    ]
+    assert len(set(paths)) == 3
+    assert all(os.path.basename(path) == 'some.rpm' for path in paths)
+    assert all(path.startswith(str(tmpdir)) for path in paths)
+
+
+CONTENT = 'abcdefghij'
+CONTENT_MD5 = hashlib.md5(CONTENT).hexdigest()
+
+
+class ResponseMock(object):
+    def __init__(self, status_code, chunks=(), headers=None, drop=False):
+        self.status_code = status_code
+        self.chunks = chunks
+        self.headers = headers or {}
+        self.drop = drop
+
+    def iter_content(self, chunk_size):
+        for chunk in self.chunks:
+            yield chunk
+        if self.drop:
+            raise ChunkedEncodingError('Connection dropped')
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise HTTPError(self.status_code)
+
+    def close(self):
+        pass
+
+
+class SessionMock(object):
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    def get(self, url, **kwargs):
+        self.requests.append(dict(kwargs['headers']))
+        return self.responses.pop(0)
+
+
+@pytest.fixture(autouse=True)
+def no_sleep(monkeypatch):
+    monkeypatch.setattr(utils.time, 'sleep', lambda seconds: None)
+
+
+def download(session, tmpdir, **kwargs):
+    dest_path = str(tmpdir.join('some.iso'))
+    checksums, _ = utils.download(
+        'http://example.com/some.iso',
+        dest_path,
+        session=session,
+        progress=False,
+        **kwargs
+    )
+    return checksums, open(dest_path).read()
+
+
+def test_download_is_resumed_after_a_drop(tmpdir):
+    session = SessionMock([
+        ResponseMock(
+            200, ['abcd'], headers={'content-length': '10'}, drop=True,
+        ),
+        ResponseMock(206, ['efghij'], headers={'content-length': '6'}),
+    ])
+    checksums, content = download(session, tmpdir)
+    assert content == CONTENT
+    assert checksums['md5'] == CONTENT_MD5
+    assert 'Range' not in session.requests[0]
+    assert session.requests[1]['Range'] == 'bytes=4-'
+
+
+def test_download_starts_again_if_range_is_ignored(tmpdir):
+    session = SessionMock([
+        ResponseMock(
+            200, ['abcd'], headers={'content-length': '10'}, drop=True,
+        ),
+        ResponseMock(
+            200, ['abcde', 'fghij'], headers={'content-length': '10'},
+        ),
+    ])
+    checksums, content = download(session, tmpdir)
+    assert content == CONTENT
+    assert checksums['md5'] == CONTENT_MD5
+
+
+def test_download_with_wrong_checksum(tmpdir):
+    session = SessionMock([
+        ResponseMock(200, [CONTENT], headers={'content-length': '10'}),
+    ])
+    with pytest.raises(utils.ChecksumError):
+        download(session, tmpdir, checksums={'md5': 'not the md5'})
+    assert tmpdir.listdir() == []
+
+
+def test_download_not_modified(tmpdir):
+    session = SessionMock([ResponseMock(304)])
+    with pytest.raises(utils.NotModified):
+        download(session, tmpdir, headers={'If-None-Match': '"1"'})
+    assert session.requests[0]['If-None-Match'] == '"1"'
+    assert tmpdir.listdir() == []
+
+
+class FetchMock(object):
+    """
+    Replaces `downloader.fetch`, keeping track of how many downloads are
+    running at the same time from each host
+    """
+    def __init__(self, delays=None, failing=()):
+        self.delays = delays or {}
+        self.failing = failing
+        self.running = {}
+        self.max_running = {}
+        self.lock = threading.Lock()
+
+    def __call__(self, url, dest_path, verify=True, progress=True):
+        host = url.split('/')[2]
+        with self.lock:
+            self.running[host] = self.running.get(host, 0) + 1
+            self.max_running[host] = max(
+                self.max_running.get(host, 0),
+                self.running[host],
+            )
+        try:
+            # time.sleep is disabled for all the tests of this module
+            threading.Event().wait(self.delays.get(url, 0.05))
+            if url in self.failing:
+                raise HTTPError('Failed to download %s' % url)
+            with open(dest_path, 'w') as dest_fd:
+                dest_fd.write(url)
+        finally:
+            with self.lock:
+                self.running[host] -= 1
+
+
+def get_urls(hosts, num):
+    return [
+        'http://%s/%d/art%d.rpm' % (host, index, index)
+        for index in range(num)
+        for host in hosts
+    ]
+
+
+def test_download_manager_limits_the_downloads_per_host(tmpdir, monkeypatch):
+    fetch_mock = FetchMock()
+    monkeypatch.setattr(downloader, 'fetch', fetch_mock)
+    manager = downloader.DownloadManager(
+        temp_dir=str(tmpdir), workers=6, per_host=2,
+    )
+    urls = get_urls(['host1', 'host2'], 6)
+    local_paths = manager.download_all(urls)
+    assert sorted(local_paths) == sorted(urls)
+    assert fetch_mock.max_running == {'host1': 2, 'host2': 2}
+    for url, local_path in local_paths.items():
+        assert open(local_path).read() == url
+
+
+@pytest.mark.parametrize('max_pending', [0, 3, 20])
+def test_iter_download_keeps_the_order(tmpdir, monkeypatch, max_pending):
+    urls = get_urls(['host1'], 6)
+    # the first ones take longer, so they finish after the rest
+    fetch_mock = FetchMock(delays=dict(
+        (url, 0.05 * (len(urls) - index)) for index, url in enumerate(urls)
+    ))
+    monkeypatch.setattr(downloader, 'fetch', fetch_mock)
+    manager = downloader.DownloadManager(
+        temp_dir=str(tmpdir), workers=3, max_pending=max_pending,
+    )
+    paths = urls[:3] + ['/some/local/path.rpm'] + urls[3:]
+    downloaded = list(manager.iter_download(iter(paths)))
+    assert [path for path, _ in downloaded] == paths
+    local_paths = [local_path for _, local_path in downloaded]
+    assert local_paths[3] == '/some/local/path.rpm'
+    assert [
+        open(local_path).read()
+        for local_path in local_paths[:3] + local_paths[4:]
+    ] == urls
+
+
+@pytest.mark.parametrize('sequential', [True, False])
+def test_download_manager_propagates_the_errors(
+    tmpdir, monkeypatch, sequential
+):
+    urls = get_urls(['host1', 'host2'], 3)
+    monkeypatch.setattr(
+        downloader, 'fetch', FetchMock(failing=[urls[2]]),
+    )
+    manager = downloader.DownloadManager(temp_dir=str(tmpdir), workers=2)
+    with pytest.raises(HTTPError):
+        if sequential:
+            manager.download_all(urls)
+        else:
+            list(manager.iter_download(urls))
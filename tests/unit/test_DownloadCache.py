@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+import os
+
+from repoman.common import download_cache
+from repoman.common.config import Config
+from repoman.common.utils import NotModified, hash_file
+
+
+class ServerMock(object):
+    """
+    Replaces `download`, serving the given contents for each url with an etag
+    and answering the conditional requests
+    """
+    def __init__(self, pages):
+        self.pages = pages
+        self.downloads = []
+
+    def __call__(self, url, dest_path, headers=None, **kwargs):
+        content, etag = self.pages[url]
+        if headers and headers.get('If-None-Match') == etag:
+            raise NotModified()
+        self.downloads.append(url)
+        with open(dest_path, 'w') as fdno:
+            fdno.write(content)
+        return hash_file(dest_path), {'etag': etag}
+
+
+def read(path):
+    with open(path) as fdno:
+        return fdno.read()
+
+
+def count_objects(cache):
+    return sum(
+        len(files) for _, _, files in os.walk(cache.objects_dir)
+    )
+
+
+def test_not_modified_urls_are_reused(monkeypatch, tmpdir):
+    server = ServerMock({'http://example.com/a.rpm': ('a' * 10, '"1"')})
+    monkeypatch.setattr(download_cache, 'download', server)
+    cache_path = str(tmpdir.join('cache'))
+    dest_path = str(tmpdir.join('a.rpm'))
+
+    checksums = download_cache.DownloadCache(cache_path, 100).fetch(
+        'http://example.com/a.rpm', dest_path,
+    )
+    os.remove(dest_path)
+    assert download_cache.DownloadCache(cache_path, 100).fetch(
+        'http://example.com/a.rpm', dest_path,
+    ) == checksums
+    assert read(dest_path) == 'a' * 10
+    assert server.downloads == ['http://example.com/a.rpm']
+
+    server.pages['http://example.com/a.rpm'] = ('b' * 10, '"2"')
+    download_cache.DownloadCache(cache_path, 100).fetch(
+        'http://example.com/a.rpm', dest_path,
+    )
+    assert read(dest_path) == 'b' * 10
+    assert len(server.downloads) == 2
+
+
+def test_same_contents_are_stored_once(monkeypatch, tmpdir):
+    server = ServerMock({
+        'http://example.com/a.rpm': ('a' * 10, '"1"'),
+        'http://mirror.example.com/a.rpm': ('a' * 10, '"2"'),
+    })
+    monkeypatch.setattr(download_cache, 'download', server)
+    cache = download_cache.DownloadCache(str(tmpdir.join('cache')), 100)
+    for num, url in enumerate(sorted(server.pages)):
+        cache.fetch(url, str(tmpdir.join('a%d.rpm' % num)))
+    assert count_objects(cache) == 1
+
+    for num, url in enumerate(sorted(server.pages)):
+        cache.fetch(url, str(tmpdir.join('a%d.rpm' % num)))
+        assert read(str(tmpdir.join('a%d.rpm' % num))) == 'a' * 10
+    assert len(server.downloads) == 2
+
+
+def test_least_recently_used_are_evicted(monkeypatch, tmpdir):
+    clock = iter(range(100))
+    monkeypatch.setattr(download_cache.time, 'time', lambda: next(clock))
+    server = ServerMock(dict(
+        ('http://example.com/%s.rpm' % name, (name * 10, '"1"'))
+        for name in 'abc'
+    ))
+    monkeypatch.setattr(download_cache, 'download', server)
+    cache = download_cache.DownloadCache(str(tmpdir.join('cache')), 25)
+    for name in 'aba':
+        cache.fetch(
+            'http://example.com/%s.rpm' % name, str(tmpdir.join(name)),
+        )
+    cache.fetch('http://example.com/c.rpm', str(tmpdir.join('c')))
+    assert count_objects(cache) == 2
+
+    del server.downloads[:]
+    for name in 'acb':
+        cache.fetch(
+            'http://example.com/%s.rpm' % name, str(tmpdir.join(name)),
+        )
+    assert server.downloads == ['http://example.com/b.rpm']
+
+
+def test_destination_is_an_independent_copy(monkeypatch, tmpdir):
+    server = ServerMock({'http://example.com/a.rpm': ('a' * 10, '"1"')})
+    monkeypatch.setattr(download_cache, 'download', server)
+    cache = download_cache.DownloadCache(str(tmpdir.join('cache')), 100)
+    dest_path = str(tmpdir.join('a.rpm'))
+    checksums = cache.fetch('http://example.com/a.rpm', dest_path)
+    obj_path = cache._object_path(checksums['sha256'])
+    assert os.stat(dest_path).st_ino != os.stat(obj_path).st_ino
+    assert int(os.stat(dest_path).st_mtime) == int(os.stat(obj_path).st_mtime)
+
+    # as signing would do, the cached object is not affected
+    with open(dest_path, 'a') as fdno:
+        fdno.write('signed')
+    assert read(obj_path) == 'a' * 10
+    assert cache.fetch('http://example.com/a.rpm', dest_path) == checksums
+    assert read(dest_path) == 'a' * 10
+    assert len(server.downloads) == 1
+
+
+def test_modified_objects_are_dropped(monkeypatch, tmpdir):
+    server = ServerMock({'http://example.com/a.rpm': ('a' * 10, '"1"')})
+    monkeypatch.setattr(download_cache, 'download', server)
+    cache = download_cache.DownloadCache(str(tmpdir.join('cache')), 100)
+    dest_path = str(tmpdir.join('a.rpm'))
+    checksums = cache.fetch('http://example.com/a.rpm', dest_path)
+
+    obj_path = cache._object_path(checksums['sha256'])
+    os.chmod(obj_path, 0o644)
+    with open(obj_path, 'a') as fdno:
+        fdno.write('modified')
+    os.remove(dest_path)
+
+    assert cache.fetch('http://example.com/a.rpm', dest_path) == checksums
+    assert read(dest_path) == 'a' * 10
+    assert len(server.downloads) == 2
+
+
+def test_configured_cache_is_shared(tmpdir):
+    config = Config()
+    config.add_to_section('main', 'download_cache', str(tmpdir.join('c1')))
+    download_cache.configure_from_config(config)
+    cache = download_cache.get_cache()
+    assert cache.max_size == 10240 * 1024 * 1024
+
+    download_cache.configure_from_config(config)
+    assert download_cache.get_cache() is cache
+
+    config.add_to_section('main', 'download_cache', '')
+    download_cache.configure_from_config(config)
+    assert download_cache.get_cache() is None
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+
+import threading
+
+import pytest
+from six.moves.BaseHTTPServer import (
+    BaseHTTPRequestHandler,
+    HTTPServer,
+)
+from six.moves.socketserver import ThreadingMixIn
+
+from repoman.common import http_client
+from repoman.common.config import Config
+
+
+@pytest.fixture(autouse=True)
+def clean_client(monkeypatch):
+    monkeypatch.setattr(
+        http_client, '_SETTINGS', dict(http_client._SETTINGS),
+    )
+    monkeypatch.setattr(http_client, '_SESSION', None)
+    yield
+    if http_client._SESSION is not None:
+        http_client._SESSION.close()
+
+
+class ThreadingServer(ThreadingMixIn, HTTPServer):
+    # the handlers wait for more requests on the kept alive connections
+    daemon_threads = True
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = b'content of ' + self.path.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server_url(monkeypatch):
+    for no_proxy in ('no_proxy', 'NO_PROXY'):
+        monkeypatch.setenv(no_proxy, '127.0.0.1')
+    server = ThreadingServer(('127.0.0.1', 0), KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield 'http://127.0.0.1:%d' % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def test_configure_recreates_the_session():
+    session = http_client.get_session()
+    assert http_client.get_session() is session
+    http_client.configure(pool_connections=3, pool_maxsize=7)
+    new_session = http_client.get_session()
+    assert new_session is not session
+    adapter = new_session.get_adapter('https://example.com')
+    assert adapter._pool_connections == 3
+    assert adapter._pool_maxsize == 7
+    # the settings not passed are kept
+    http_client.configure(verify_ssl=False)
+    adapter = http_client.get_session().get_adapter('http://example.com')
+    assert adapter._pool_maxsize == 7
+    assert http_client._SETTINGS['verify'] is False
+
+
+@pytest.mark.parametrize(
+    'options, expected_maxsize',
+    [
+        ({}, 10),
+        ({'http_pool_size': '4'}, 4),
+        ({'http_pool_size': '4', 'download_workers': '8'}, 8),
+        ({'http_pool_size': '4', 'source_workers': '6'}, 6),
+        (
+            {
+                'http_pool_size': '4',
+                'download_workers': '8',
+                'source_workers': '12',
+            },
+            12,
+        ),
+    ],
+)
+def test_pool_is_never_smaller_than_the_workers(options, expected_maxsize):
+    config = Config()
+    config.set('http_pool_hosts', '5')
+    config.set('verify_ssl', 'false')
+    for option, value in options.items():
+        config.set(option, value)
+    http_client.configure_from_config(config)
+    assert http_client._SETTINGS == {
+        'pool_connections': 5,
+        'pool_maxsize': expected_maxsize,
+        'verify': False,
+    }
+
+
+def test_get_stats_counts_the_reused_connections(server_url):
+    assert http_client.get_stats() == {}
+    for num in range(3):
+        response = http_client.get('%s/page%d' % (server_url, num))
+        assert response.content == b'content of /page%d' % num
+    assert http_client.get_stats() == {
+        server_url: {'requests': 3, 'connections': 1},
+    }
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 
 import pytest
+from requests.exceptions import RequestException
 
 from repoman.common.sources import jenkins
 
@@ -13,7 +14,7 @@ class RequestsMock(object):
     def __init__(self, build):
         self.build = build
 
-    def get(self, what):
+    def get(self, what, **kwargs):
         return self.build
 
 
@@ -29,6 +30,9 @@ class ResponseMock(object):
     def ok(self):
         return True
 
+    def close(self):
+        pass
+
 
 class MulticonfigBuild(dict, ResponseMock):
     def __init__(self, build_number, runs):
@@ -124,7 +128,7 @@ def jenkins_data(request):
 
 def test_sources(monkeypatch, jenkins_data):
     source_str, jenkins_mock, expected = jenkins_data
-    monkeypatch.setattr(jenkins, 'requests', jenkins_mock)
+    monkeypatch.setattr(jenkins, 'http_client', jenkins_mock)
     monkeypatch.setattr(
         jenkins,
         'has_store',
@@ -145,7 +149,7 @@ def test_filters_are_extracted(monkeypatch):
         )
     )
     expected = [get_url('111/artifact/myartie.rpm')]
-    monkeypatch.setattr(jenkins, 'requests', jenkins_mock)
+    monkeypatch.setattr(jenkins, 'http_client', jenkins_mock)
     monkeypatch.setattr(
         jenkins,
         'has_store',
@@ -155,3 +159,170 @@ def test_filters_are_extracted(monkeypatch):
     extracte_filters, artifacts = jenkins_source.expand(source_str)
     assert artifacts == expected
     assert extracte_filters == 'whatever:filters'
+
+
+@pytest.mark.parametrize(
+    'build_url, build, expected',
+    [
+        (get_url('job1/111'), {'number': 111, 'building': False}, True),
+        (get_url('job1/111/'), {'number': 111, 'building': False}, True),
+        (
+            get_url('job1/label=el7/111'),
+            {'number': 111, 'building': False},
+            True,
+        ),
+        (get_url('job1/111'), {'number': 111, 'building': True}, False),
+        (
+            get_url('job1/lastSuccessfulBuild'),
+            {'number': 111, 'building': False},
+            False,
+        ),
+        (
+            get_url('job1/lastBuild/'),
+            {'number': 111, 'building': False},
+            False,
+        ),
+        (get_url('job1'), {'builds': []}, False),
+    ],
+)
+def test_only_numbered_finished_builds_are_immutable(
+    build_url, build, expected
+):
+    assert jenkins.is_immutable_build(build_url, build) is expected
+
+
+class UrlRequestsMock(object):
+    """
+    Returns the build for the api url of each build url, failing the first
+    `failures` times for each of them
+    """
+    def __init__(self, builds, failures=0):
+        self.builds = builds
+        self.failures = failures
+        self.requested = []
+
+    def get(self, what, **kwargs):
+        self.requested.append(what)
+        build_url = what.split('/api/json', 1)[0]
+        if self.requested.count(what) <= self.failures:
+            raise RequestException('Failed to get %s' % what)
+        return self.builds[build_url]
+
+
+class WorkersConfigMock(ConfigMock):
+    def getint(self, name):
+        return 2
+
+
+def fingerprint(file_name, md5):
+    return {'fileName': file_name, 'hash': md5}
+
+
+def test_only_unique_fingerprints_are_used(monkeypatch):
+    build = Build(
+        build_number='111',
+        artifacts=[
+            Artifact('el7/same.rpm'),
+            Artifact('fc24/same.rpm'),
+            Artifact('unique.rpm'),
+            Artifact('no_fingerprint.rpm'),
+        ],
+        url=get_url('111'),
+    )
+    build['fingerprint'] = [
+        fingerprint('same.rpm', 'md5_el7'),
+        fingerprint('same.rpm', 'md5_fc24'),
+        fingerprint('unique.rpm', 'md5_unique'),
+        fingerprint('not_archived.rpm', 'md5_other'),
+    ]
+    expected = {}
+    monkeypatch.setattr(
+        jenkins, 'http_client', UrlRequestsMock({get_url('111'): build}),
+    )
+    monkeypatch.setattr(jenkins, 'expect_checksums', expected.__setitem__)
+    monkeypatch.setattr(
+        jenkins, 'has_store', lambda x, y: x.endswith('.rpm'),
+    )
+    jenkins_source = jenkins.JenkinsSource(config=ConfigMock(), stores=None)
+    _, artifacts = jenkins_source.expand(get_url('111'))
+    assert len(artifacts) == 4
+    assert expected == {
+        get_url('111/artifact/unique.rpm'): {'md5': 'md5_unique'},
+    }
+
+
+def test_runs_not_inlined_are_fetched(monkeypatch):
+    runs = [
+        Run(
+            build_number='111',
+            artifacts=[Artifact('run%d.rpm' % num)],
+            url=get_url('111/run%d' % num),
+        )
+        for num in range(4)
+    ]
+    parent = MulticonfigBuild(
+        build_number='111',
+        runs=[
+            {'number': run['number'], 'url': run['url']} for run in runs
+        ],
+    )
+    builds = dict((run['url'], run) for run in runs)
+    builds[get_url('111')] = parent
+    requests_mock = UrlRequestsMock(builds)
+    monkeypatch.setattr(jenkins, 'http_client', requests_mock)
+    monkeypatch.setattr(
+        jenkins, 'has_store', lambda x, y: x.endswith('.rpm'),
+    )
+    jenkins_source = jenkins.JenkinsSource(
+        config=WorkersConfigMock(),
+        stores=None,
+    )
+    _, artifacts = jenkins_source.expand(get_url('111'))
+    assert artifacts == [
+        get_url('111/run%d/artifact/run%d.rpm' % (num, num))
+        for num in range(4)
+    ]
+    # the runs are fetched with only the fields of the builds
+    assert all(
+        url.endswith('?tree=' + jenkins.BUILD_FIELDS)
+        for url in requests_mock.requested[1:]
+    )
+
+
+def test_backoff_doubles_until_the_max(monkeypatch):
+    monkeypatch.setattr(jenkins, '_HOST_FAILURES', {})
+    assert [
+        jenkins._backoff('host1', failed=True) for _ in range(7)
+    ] == [2, 4, 8, 16, 32, jenkins.MAX_BACKOFF, jenkins.MAX_BACKOFF]
+    # each host is independent
+    assert jenkins._backoff('host2', failed=True) == 2
+    assert jenkins._backoff('host1', failed=False) == 0
+    assert jenkins._backoff('host1', failed=True) == 2
+
+
+@pytest.mark.parametrize('failures', [0, 1, jenkins.MAX_TRIES - 1])
+def test_get_build_retries_with_backoff(monkeypatch, failures):
+    build = Build(build_number='111', artifacts=[], url=get_url('111'))
+    sleeps = []
+    monkeypatch.setattr(jenkins, '_HOST_FAILURES', {})
+    monkeypatch.setattr(jenkins.time, 'sleep', sleeps.append)
+    monkeypatch.setattr(
+        jenkins,
+        'http_client',
+        UrlRequestsMock({get_url('111'): build}, failures=failures),
+    )
+    assert jenkins.get_build(get_url('111')) == build
+    assert sleeps == [2 ** num for num in range(1, failures + 1)]
+    assert jenkins._HOST_FAILURES == {}
+
+
+def test_get_build_fails_after_max_tries(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(jenkins, '_HOST_FAILURES', {})
+    monkeypatch.setattr(jenkins.time, 'sleep', sleeps.append)
+    requests_mock = UrlRequestsMock({}, failures=jenkins.MAX_TRIES)
+    monkeypatch.setattr(jenkins, 'http_client', requests_mock)
+    with pytest.raises(RequestException):
+        jenkins.get_build(get_url('111'))
+    assert len(requests_mock.requested) == jenkins.MAX_TRIES
+    assert len(sleeps) == jenkins.MAX_TRIES - 1
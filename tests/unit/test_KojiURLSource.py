@@ -1,7 +1,9 @@
 #!/usr/bin/env python
+from multiprocessing.pool import ThreadPool
 
 import pytest
 
+from repoman.common.filters.name import NameFilter
 from repoman.common.sources import kojibuild
 
 
@@ -11,6 +13,9 @@ class KojiMock(object):
         self._builds = builds
         self._tag = tag
         self._package = package
+        self.multicall = False
+        self._pending_calls = []
+        self.multicalls = []
 
     def ClientSession(self, *args):
         return self
@@ -29,8 +34,18 @@ class KojiMock(object):
         return {'build_id': self._builds[0]}
 
     def listRPMs(self, buildID):
+        if self.multicall:
+            self._pending_calls.append(buildID)
+            return None
         return buildID
 
+    def multiCall(self, strict=False):
+        self.multicall = False
+        self.multicalls.append(len(self._pending_calls))
+        results = [[result] for result in self._pending_calls]
+        self._pending_calls = []
+        return results
+
     def PathInfo(self, topdir):
         self._topdir = topdir
         return self
@@ -88,6 +103,15 @@ class ConfigMock(object):
     def getboolean(self, name):
         return True
 
+    def getint(self, name):
+        return 2
+
+
+@pytest.fixture(autouse=True)
+def clean_koji_caches(monkeypatch):
+    monkeypatch.setattr(kojibuild, '_SESSIONS', {})
+    monkeypatch.setattr(kojibuild, '_LATEST_BUILDS', {})
+
 
 @pytest.fixture(params=[
     (
@@ -173,3 +197,104 @@ def test_filters_are_extracted(monkeypatch):
     extracte_filters, artifacts = koji_source.expand(source_str)
     assert artifacts == koji_mock.get_mock_expected(with_inheritance=True)
     assert extracte_filters == 'whatever:filters'
+
+
+def test_rpms_are_listed_in_batches(monkeypatch):
+    koji_mock = KojiMock(
+        builds=[
+            Build(tag='tag', packages=[Package('pkg%d' % num, 'rpm%d' % num)])
+            for num in range(5)
+        ],
+        tag='tag',
+    )
+    monkeypatch.setattr(kojibuild, 'koji', koji_mock)
+    monkeypatch.setattr(kojibuild, 'has_store', lambda x, y: True)
+    koji_source = kojibuild.KojiBuildSource(config=ConfigMock(), stores=None)
+    _, artifacts = koji_source.expand('koji:@tag')
+    assert artifacts == koji_mock.get_mock_expected()
+    assert koji_mock.multicalls == [2, 2, 1]
+    # the session and the tag listing are reused
+    monkeypatch.setattr(koji_mock, 'getLatestBuilds', None)
+    _, artifacts = koji_source.expand('koji:@tag')
+    assert artifacts == koji_mock.get_mock_expected()
+    assert koji_mock.multicalls == [2, 2, 1, 2, 2, 1]
+
+
+def test_sessions_are_reused_by_the_next_threads(monkeypatch):
+    koji_mock = KojiMock(
+        builds=(Build(tag='tag', packages=[Package('pkg1', 'rpm1')]),),
+        tag='tag',
+    )
+    sessions = []
+
+    def new_session(*args):
+        sessions.append(args)
+        return koji_mock
+
+    monkeypatch.setattr(kojibuild, 'koji', koji_mock)
+    monkeypatch.setattr(koji_mock, 'ClientSession', new_session)
+    monkeypatch.setattr(kojibuild, 'has_store', lambda x, y: True)
+    koji_source = kojibuild.KojiBuildSource(config=ConfigMock(), stores=None)
+    # each batch of sources is expanded by a new pool of threads
+    for _ in range(3):
+        pool = ThreadPool(1)
+        try:
+            _, artifacts = pool.apply(koji_source.expand, ('koji:@tag', ))
+        finally:
+            pool.close()
+            pool.join()
+        assert artifacts == koji_mock.get_mock_expected()
+    assert len(sessions) == 1
+
+
+class SessionMock(object):
+    def __init__(self, server, opts):
+        self.logged_out = False
+
+    def logout(self):
+        self.logged_out = True
+
+
+def test_failed_sessions_are_not_reused(monkeypatch):
+    monkeypatch.setattr(kojibuild.koji, 'ClientSession', SessionMock)
+    with kojibuild.get_session('hub', {}) as session:
+        pass
+    with kojibuild.get_session('hub', {}) as reused_session:
+        assert reused_session is session
+    with pytest.raises(ValueError):
+        with kojibuild.get_session('hub', {}) as failed_session:
+            raise ValueError('Broken session')
+    assert failed_session is session
+    assert failed_session.logged_out
+    with kojibuild.get_session('hub', {}) as new_session:
+        assert new_session is not session
+    assert not new_session.logged_out
+    assert kojibuild._SESSIONS == {('hub', ()): [new_session]}
+
+
+@pytest.mark.parametrize('name_filter', ['name~rpm1', 'name~rpm[23]'])
+def test_name_filter_pushdown(monkeypatch, name_filter):
+    koji_mock = KojiMock(
+        builds=(
+            Build(tag='tag', packages=[Package('pkg1', 'rpm1')]),
+            Build(
+                tag='tag',
+                packages=[Package('pkg2', 'rpm2'), Package('pkg3', 'rpm3')],
+            ),
+        ),
+        tag='tag',
+    )
+    monkeypatch.setattr(kojibuild, 'koji', koji_mock)
+    monkeypatch.setattr(kojibuild, 'has_store', lambda x, y: True)
+    koji_source = kojibuild.KojiBuildSource(config=ConfigMock(), stores=None)
+    source_str = 'koji:@tag:' + name_filter
+    name_match = NameFilter.get_name_match(source_str)
+
+    filters_str, artifacts = koji_source.expand(source_str)
+    _, expected = NameFilter(config=None, stores=None).filter(
+        filters_str,
+        artifacts,
+    )
+    _, pushed_down = koji_source.expand(source_str, name_match=name_match)
+    assert set(pushed_down) == expected
+    assert len(pushed_down) < len(artifacts)
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+import glob
+import os
+
+import pytest
+
+from repoman.common.config import Config
+from repoman.common.filters.latest import LatestFilter
+from repoman.common.stores.RPM import RPMStore
+from repoman.common.stores.iso import IsoStore
+
+
+FIXTURES_DIR = os.path.join(
+    os.path.dirname(__file__), '..', 'functional', 'fixtures',
+)
+
+
+@pytest.mark.parametrize('filter_by_file_name', ['true', 'false'])
+def test_latest_keeps_the_source_rpms(tmpdir, filter_by_file_name):
+    config = Config()
+    config.add_to_section(
+        'store.RPMStore', 'filter_by_file_name', filter_by_file_name,
+    )
+    store = RPMStore(
+        config=config.get_section('store.RPMStore'),
+        repo_path=str(tmpdir),
+    )
+    latest_filter = LatestFilter(config=None, stores=[store])
+    rpms = glob.glob(os.path.join(FIXTURES_DIR, 'latest_repo2', '*.rpm'))
+    _, filtered = latest_filter.filter('latest', rpms)
+    assert sorted(os.path.basename(path) for path in filtered) == [
+        'unsigned_rpm-1.0-1.fc21.src.rpm',
+        'unsigned_rpm-1.0-1.fc21.x86_64.rpm',
+    ]
+
+
+def test_latest_passes_each_name_before_the_next_ones_are_read(tmpdir):
+    config = Config()
+    stores = [
+        store_class(
+            config=config.get_section(store_class.get_conf_section()),
+            repo_path=str(tmpdir),
+        )
+        for store_class in (RPMStore, IsoStore)
+    ]
+    latest_filter = LatestFilter(config=None, stores=stores)
+    isos = sorted(
+        glob.glob(os.path.join(FIXTURES_DIR, 'latest_repo1', '*.iso'))
+    )
+    rpms = sorted(
+        glob.glob(os.path.join(FIXTURES_DIR, 'latest_repo1', '*.rpm'))
+    )
+    consumed = []
+
+    def source():
+        for path in isos + rpms:
+            consumed.append(path)
+            yield path
+
+    operator, _ = latest_filter.compile('latest')
+    filtered = operator(source())
+    assert os.path.basename(next(filtered)) == 'dummy-project-1.4.iso'
+    # only the first rpm was needed to know that there were no more isos
+    assert consumed == isos + rpms[:1]
+    assert [os.path.basename(path) for path in filtered] == [
+        'unsigned_rpm-1.1-1.fc21.x86_64.rpm',
+    ]
+    assert consumed == isos + rpms
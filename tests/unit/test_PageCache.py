@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+import pytest
+from requests.exceptions import HTTPError
+
+from repoman.common import page_cache
+
+
+class ResponseMock(object):
+    def __init__(self, status_code, headers=None, text=''):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = text
+        self.ok = status_code < 400
+        self.closed = False
+
+    def raise_for_status(self):
+        raise HTTPError('%d error' % self.status_code)
+
+    def close(self):
+        self.closed = True
+
+
+class ServerMock(object):
+    """
+    Replaces the http client, serving the given pages with their etag and
+    last modified date, and answering the conditional requests
+    """
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+        self.responses = []
+
+    def get(self, url, stream=False, headers=None):
+        headers = headers or {}
+        self.requests.append((url, headers))
+        status_code, text, etag, last_modified = self.pages[url]
+        validators = (
+            headers.get('If-None-Match'),
+            headers.get('If-Modified-Since'),
+        )
+        if status_code == 200 and validators == (etag, last_modified):
+            status_code = 304
+        response = ResponseMock(
+            status_code,
+            headers={'etag': etag, 'last-modified': last_modified},
+            text=text,
+        )
+        self.responses.append(response)
+        return response
+
+
+def parse_links(response):
+    parse_links.calls += 1
+    return [u'link-%s' % link for link in response.text.split()]
+
+
+@pytest.fixture(autouse=True)
+def parse_calls():
+    parse_links.calls = 0
+
+
+@pytest.fixture
+def cache(monkeypatch, tmpdir):
+    cache = page_cache.PageCache(str(tmpdir.join('pages.db')))
+    monkeypatch.setattr(page_cache._CACHE, 'cache', cache)
+    return cache
+
+
+URL = 'http://example.com/index.html'
+LAST_MODIFIED = 'Mon, 01 Jan 2018 00:00:00 GMT'
+
+
+def test_without_cache_the_page_is_always_parsed(monkeypatch):
+    monkeypatch.setattr(page_cache._CACHE, 'cache', None)
+    server = ServerMock({URL: (200, 'a b', '"1"', LAST_MODIFIED)})
+    for _ in range(2):
+        assert page_cache.fetch_parsed(
+            URL, parse_links, http=server,
+        ) == ['link-a', 'link-b']
+    assert parse_links.calls == 2
+    assert server.requests == [(URL, {}), (URL, {})]
+    assert all(response.closed for response in server.responses)
+
+
+def test_not_modified_page_is_not_parsed_again(cache):
+    server = ServerMock({URL: (200, 'a b', '"1"', LAST_MODIFIED)})
+    data = page_cache.fetch_parsed(URL, parse_links, http=server)
+    assert data == ['link-a', 'link-b']
+    assert cache.lookup(URL) == ('"1"', LAST_MODIFIED, False, data)
+
+    cached_data = page_cache.fetch_parsed(URL, parse_links, http=server)
+    assert cached_data == data
+    assert parse_links.calls == 1
+    assert server.requests[1] == (
+        URL,
+        {'If-None-Match': '"1"', 'If-Modified-Since': LAST_MODIFIED},
+    )
+    assert all(response.closed for response in server.responses)
+
+
+def test_modified_page_is_parsed_and_stored_again(cache):
+    server = ServerMock({URL: (200, 'a', '"1"', LAST_MODIFIED)})
+    page_cache.fetch_parsed(URL, parse_links, http=server)
+    server.pages[URL] = (200, 'a b', '"2"', LAST_MODIFIED)
+    assert page_cache.fetch_parsed(
+        URL, parse_links, http=server,
+    ) == ['link-a', 'link-b']
+    assert parse_links.calls == 2
+    assert cache.lookup(URL) == (
+        '"2"', LAST_MODIFIED, False, ['link-a', 'link-b'],
+    )
+
+
+def test_immutable_page_is_not_requested_again(cache):
+    server = ServerMock({URL: (200, 'a', None, None)})
+
+    def immutable(data):
+        return data == ['link-a']
+
+    data = page_cache.fetch_parsed(
+        URL, parse_links, immutable=immutable, http=server,
+    )
+    assert cache.lookup(URL) == (None, None, True, data)
+    assert page_cache.fetch_parsed(
+        URL, parse_links, immutable=immutable, http=server,
+    ) == data
+    assert len(server.requests) == 1
+    assert parse_links.calls == 1
+
+
+def test_failed_page_is_not_stored(cache):
+    server = ServerMock({URL: (404, '', None, None)})
+    with pytest.raises(HTTPError):
+        page_cache.fetch_parsed(URL, parse_links, http=server)
+    assert server.responses[0].closed
+    assert parse_links.calls == 0
+    assert cache.lookup(URL) is None
+
+
+def test_cached_data_has_the_same_types_as_the_parsed(cache):
+    server = ServerMock({URL: (200, '', '"1"', None)})
+
+    def parse(response):
+        return {u'result': u'SUCCESS', u'artifacts': [{u'path': u'x.rpm'}]}
+
+    parsed = page_cache.fetch_parsed(URL, parse, http=server)
+    cached = page_cache.fetch_parsed(URL, parse, http=server)
+    assert server.responses[1].status_code == 304
+    for data in (parsed, cached):
+        assert data == {'result': 'SUCCESS', 'artifacts': [{'path': 'x.rpm'}]}
+        assert all(isinstance(key, str) for key in data)
+        assert isinstance(data['result'], str)
+        assert isinstance(data['artifacts'][0]['path'], str)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+import os
+
+import pytest
+
+from repoman.common.config import Config
+from repoman.common.parser import Parser
+from repoman.common.stores.RPM import RPMStore
+
+
+FIXTURES_DIR = os.path.join(
+    os.path.dirname(__file__), '..', 'functional', 'fixtures',
+)
+
+
+@pytest.fixture
+def parser(tmpdir):
+    config = Config()
+    config.set('on_empty_source', 'warn')
+    store = RPMStore(
+        config=config.get_section('store.RPMStore'),
+        repo_path=str(tmpdir),
+    )
+    return Parser(config=config, stores={'RPMStore': store})
+
+
+@pytest.mark.parametrize(
+    'filters_str, patterns, expected',
+    [
+        (
+            r'name~unsigned_rpm-1\.0-2.*:latest',
+            [r'unsigned_rpm-1\.0-2.*'],
+            ['unsigned_rpm-1.0-2.fc21.x86_64.rpm'],
+        ),
+        (
+            # the name filter must be applied after latest, that selects
+            # the 1.1-1 version
+            r'latest:name~unsigned_rpm-1\.0-2.*',
+            None,
+            [],
+        ),
+        (
+            r'name~unsigned.*:latest:name~.*x86_64.*',
+            [r'unsigned.*'],
+            ['unsigned_rpm-1.1-1.fc21.x86_64.rpm'],
+        ),
+    ],
+)
+def test_name_filters_after_latest_are_not_pushed_down(
+    parser, filters_str, patterns, expected
+):
+    source_str = 'dir:%s:%s' % (
+        os.path.join(FIXTURES_DIR, 'latest_repo1'),
+        filters_str,
+    )
+    name_match = parser.get_name_match(source_str)
+    assert (name_match and name_match.patterns) == patterns
+    assert sorted(
+        os.path.basename(path) for path in parser.parse(source_str)
+    ) == expected
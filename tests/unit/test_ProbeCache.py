@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+from requests.exceptions import ConnectionError
+
+from repoman.common import probe_cache
+
+
+class ResponseMock(object):
+    def __init__(self, headers, status_code=200):
+        self.headers = headers
+        self.status_code = status_code
+
+
+def test_failed_head_probes_again(monkeypatch, tmpdir):
+    def failing_head(url, **kwargs):
+        raise ConnectionError('Connection refused')
+
+    monkeypatch.setattr(probe_cache.http_client, 'head', failing_head)
+    assert probe_cache.get_validators('http://127.0.0.1:9/x.rpm') is None
+
+    probed = []
+    cache = probe_cache.ProbeCache(str(tmpdir.join('probes.db')), 10)
+    metadata = cache.probe(
+        'http://127.0.0.1:9/x.rpm',
+        lambda url: probed.append(url) or {'name': 'x'},
+    )
+    assert metadata == {'name': 'x'}
+    assert probed == ['http://127.0.0.1:9/x.rpm']
+
+
+def test_unchanged_url_is_not_probed_again(monkeypatch, tmpdir):
+    headers = {'etag': '"1"', 'content-length': '10'}
+    monkeypatch.setattr(
+        probe_cache.http_client,
+        'head',
+        lambda url, **kwargs: ResponseMock(headers),
+    )
+    db_path = str(tmpdir.join('probes.db'))
+    probed = []
+
+    def probe(url):
+        probed.append(url)
+        return {'name': u'x', 'version': len(probed)}
+
+    url = 'http://example.com/x.rpm'
+    assert probe_cache.ProbeCache(db_path, 10).probe(url, probe) == {
+        'name': 'x', 'version': 1,
+    }
+    metadata = probe_cache.ProbeCache(db_path, 10).probe(url, probe)
+    assert metadata == {'name': 'x', 'version': 1}
+    assert isinstance(metadata['name'], str)
+    assert len(probed) == 1
+
+    headers['etag'] = '"2"'
+    assert probe_cache.ProbeCache(db_path, 10).probe(url, probe) == {
+        'name': 'x', 'version': 2,
+    }
+
+
+def test_least_recently_used_are_evicted(monkeypatch, tmpdir):
+    clock = iter(range(100))
+    monkeypatch.setattr(probe_cache.time, 'time', lambda: next(clock))
+    cache = probe_cache.ProbeCache(str(tmpdir.join('probes.db')), 2)
+    validators = ('"1"', None, '10')
+    for num in range(3):
+        cache.put('http://example.com/%d.rpm' % num, validators, {})
+    cache.get('http://example.com/0.rpm', validators)
+    cache.evict()
+    assert cache.get('http://example.com/0.rpm', validators) == {}
+    assert cache.get('http://example.com/1.rpm', validators) is None
+    assert cache.get('http://example.com/2.rpm', validators) == {}
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+import glob
+import os
+import sys
+
+import pytest
+
+from repoman.common.stores.RPM import header
+from repoman.common.stores.RPM.RPM import read_rpm_metadata
+
+
+# the RPM class shadows the module in the package namespace
+RPM = sys.modules['repoman.common.stores.RPM.RPM']
+
+
+FIXTURES_DIR = os.path.join(
+    os.path.dirname(__file__), '..', 'functional', 'fixtures',
+)
+FIXTURE_RPMS = sorted(glob.glob(os.path.join(FIXTURES_DIR, '*.rpm')))
+
+
+@pytest.mark.parametrize(
+    'rpm_path, expected',
+    [
+        (
+            'signed_rpm-1.0-1.fc21.x86_64.rpm',
+            {
+                'name': 'signed_rpm',
+                'version': '1.0',
+                'release': '1.fc21',
+                'arch': 'x86_64',
+                'is_source': False,
+                'sourcerpm': 'signed_rpm-1.0-1.fc21.src.rpm',
+                'signature': True,
+            },
+        ),
+        (
+            'unsigned_rpm-1.0-1.fc21.src.rpm',
+            {
+                'name': 'unsigned_rpm',
+                'version': '1.0',
+                'release': '1.fc21',
+                'arch': 'x86_64',
+                'is_source': True,
+                'sourcerpm': None,
+                'signature': False,
+            },
+        ),
+        (
+            'unsigned_rpm-1.0-2.fc21.noarch.rpm',
+            {
+                'name': 'unsigned_rpm',
+                'version': '1.0',
+                'release': '2.fc21',
+                'arch': 'noarch',
+                'is_source': False,
+                'sourcerpm': 'unsigned_rpm-1.0-2.fc21.src.rpm',
+                'signature': False,
+            },
+        ),
+    ],
+)
+def test_builtin_reader(rpm_path, expected):
+    metadata = read_rpm_metadata(os.path.join(FIXTURES_DIR, rpm_path))
+    metadata.pop('inode')
+    assert metadata == expected
+
+
+@pytest.mark.parametrize('rpm_path', FIXTURE_RPMS)
+def test_builtin_reader_matches_rpm(rpm_path):
+    pytest.importorskip('rpm')
+    assert (
+        read_rpm_metadata(rpm_path, reader='builtin')
+        == read_rpm_metadata(rpm_path, reader='rpm')
+    )
+
+
+def test_truncated_header_reports_needed_size():
+    with open(FIXTURE_RPMS[0], 'rb') as rpm_fd:
+        data = rpm_fd.read()
+    with pytest.raises(header.TruncatedHeaderError) as error:
+        header.parse_header(data[:header.LEAD_SIZE + 10])
+    needed = error.value.needed
+    while True:
+        try:
+            header.parse_header(data[:needed])
+            break
+        except header.TruncatedHeaderError as error:
+            assert error.needed > needed
+            needed = error.needed
+    assert header.parse_header(data[:needed]) == header.parse_header(data)
+
+
+def test_not_an_rpm():
+    with pytest.raises(header.RPMHeaderError):
+        header.parse_header(b'\0' * 200)
+
+
+@pytest.mark.parametrize('rpm_path', FIXTURE_RPMS)
+def test_probe_gets_only_the_headers(rpm_path, monkeypatch):
+    with open(rpm_path, 'rb') as rpm_fd:
+        data = rpm_fd.read()
+    requested = []
+
+    def fake_fetch_range(url, start, end, verify=True):
+        requested.append((start, end))
+        return data[start:end + 1]
+
+    monkeypatch.setattr(RPM, 'fetch_range', fake_fetch_range)
+    PROBE_SIZE = 512
+    monkeypatch.setattr(RPM, 'PROBE_SIZE', PROBE_SIZE)
+    metadata = RPM.probe_rpm_metadata('http://dummy/' + rpm_path)
+    expected = read_rpm_metadata(rpm_path)
+    expected['inode'] = 'http://dummy/' + rpm_path
+    assert metadata == expected
+    assert requested[0] == (0, PROBE_SIZE - 1)
+    assert requested[-1][0] < len(data)
+
+
+def test_probe_without_range_support(monkeypatch):
+    monkeypatch.setattr(RPM, 'fetch_range', lambda *args, **kwargs: None)
+    assert RPM.probe_rpm_metadata('http://dummy/some.rpm') is None
+
+
+@pytest.mark.parametrize('rpm_path', FIXTURE_RPMS)
+def test_file_name_matches_the_header(rpm_path):
+    metadata = RPM.parse_rpm_file_name(rpm_path)
+    expected = read_rpm_metadata(rpm_path)
+    # the headers of the source rpms have the arch they were built on, so
+    # they must always be read
+    if expected['is_source']:
+        assert metadata is None
+        return
+    for key in ('name', 'version', 'release', 'arch', 'is_source'):
+        assert metadata[key] == expected[key]
+
+
+def test_unparseable_file_name():
+    assert RPM.parse_rpm_file_name('http://dummy/some.rpm') is None
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+import os
+import shutil
+
+import pytest
+
+from repoman.common import downloader
+from repoman.common.config import Config
+from repoman.common.repo import Repo
+
+
+FIXTURES_DIR = os.path.join(
+    os.path.dirname(__file__), '..', 'functional', 'fixtures',
+)
+
+
+def make_source_dir(path, rpm_name):
+    os.makedirs(path)
+    shutil.copy(
+        os.path.join(FIXTURES_DIR, 'latest_repo1', rpm_name),
+        path,
+    )
+    return path
+
+
+@pytest.mark.parametrize('sequential_add', ['true', 'false'])
+@pytest.mark.parametrize('source_workers', ['1', '2'])
+def test_only_missing_in_conf_sees_the_previous_sources(
+    tmpdir, sequential_add, source_workers
+):
+    dir_a = make_source_dir(
+        str(tmpdir.join('A')), 'unsigned_rpm-1.0-2.fc21.x86_64.rpm',
+    )
+    dir_b = make_source_dir(
+        str(tmpdir.join('B')), 'unsigned_rpm-1.1-1.fc21.x86_64.rpm',
+    )
+    conf_path = tmpdir.join('sources.conf')
+    conf_path.write(
+        'dir:%s\ndir:%s:only-missing\ndir:%s\n' % (dir_a, dir_b, dir_a)
+    )
+    config = Config()
+    config.set('sequential_add', sequential_add)
+    config.set('source_workers', source_workers)
+    config.set('on_empty_source', 'warn')
+    config.set('temp_dir', str(tmpdir.mkdir('tmp')))
+    repo = Repo(path=str(tmpdir.join('repo')), config=config)
+    repo.add_source('conf:%s' % conf_path)
+    assert [
+        os.path.basename(path) for path in repo.added_artifacts
+    ] == ['unsigned_rpm-1.0-2.fc21.x86_64.rpm'] * 2
+
+
+@pytest.mark.parametrize('sequential_add', ['true', 'false'])
+def test_added_artifacts_keep_the_source_urls(
+    tmpdir, monkeypatch, sequential_add
+):
+    rpm_name = 'unsigned_rpm-1.0-2.fc21.x86_64.rpm'
+    url = 'http://example.com/repo/' + rpm_name
+
+    def fetch(url, dest_path, verify=True, progress=True):
+        shutil.copy(
+            os.path.join(FIXTURES_DIR, 'latest_repo1', rpm_name),
+            dest_path,
+        )
+
+    monkeypatch.setattr(downloader, 'fetch', fetch)
+    config = Config()
+    config.set('sequential_add', sequential_add)
+    config.set('temp_dir', str(tmpdir.mkdir('tmp')))
+    repo = Repo(path=str(tmpdir.join('repo')), config=config)
+    repo.add_artifacts([url])
+    assert repo.added_artifacts == [url]
+    local_path = repo.stores['RPMStore'].to_copy[0].path
+    assert local_path.startswith(repo.config.get('temp_dir'))
+
+
+def make_repo(tmpdir):
+    repo_path = tmpdir.mkdir('repo')
+    fixtures = os.path.join(FIXTURES_DIR, 'latest_repo1')
+    for file_name in os.listdir(fixtures):
+        shutil.copy(os.path.join(fixtures, file_name), str(repo_path))
+    config = Config()
+    config.set('temp_dir', str(tmpdir.mkdir('tmp')))
+    repo = Repo(path=str(repo_path), config=config)
+    repo.load()
+    return repo
+
+
+def get_file_names(repo):
+    return sorted(
+        os.path.basename(artifact.path)
+        for store in repo.stores.itervalues()
+        for artifact in store.get_artifacts()
+    )
+
+
+@pytest.mark.parametrize(
+    'num_to_keep, expected_removed',
+    [
+        (
+            1,
+            [
+                'dummy-project-1.2.3.iso',
+                'dummy-project-1.2.4.iso',
+                'unsigned_rpm-1.0-1.fc21.src.rpm',
+                'unsigned_rpm-1.0-2.fc21.x86_64.rpm',
+            ],
+        ),
+        (
+            2,
+            [
+                'dummy-project-1.2.3.iso',
+                'unsigned_rpm-1.0-1.fc21.src.rpm',
+            ],
+        ),
+        # the versions with only source rpms are never among the latest
+        (3, ['unsigned_rpm-1.0-1.fc21.src.rpm']),
+    ],
+)
+def test_delete_old(tmpdir, num_to_keep, expected_removed):
+    repo = make_repo(tmpdir)
+    all_files = sorted(os.listdir(repo.path))
+    removed = repo.delete_old(num_to_keep=num_to_keep)
+    assert sorted(
+        os.path.basename(artifact.path) for artifact in removed
+    ) == expected_removed
+    expected_kept = [
+        file_name for file_name in all_files
+        if file_name not in expected_removed
+    ]
+    assert sorted(os.listdir(repo.path)) == expected_kept
+    # the stores forget the removed versions, and keep the rest
+    assert get_file_names(repo) == expected_kept
+    assert repo.delete_old(num_to_keep=num_to_keep) == []
+
+
+def test_delete_old_noop_does_not_touch_anything(tmpdir, caplog):
+    repo = make_repo(tmpdir)
+    all_files = sorted(os.listdir(repo.path))
+    caplog.set_level('INFO')
+    removed = repo.delete_old(num_to_keep=1, noop=True)
+    assert len(removed) == 4
+    assert sorted(os.listdir(repo.path)) == all_files
+    assert get_file_names(repo) == all_files
+    assert sorted(
+        record.getMessage()
+        for record in caplog.records
+        if record.getMessage().startswith('NOOP::')
+    ) == sorted(
+        'NOOP::%s would have been removed' % artifact.path
+        for artifact in removed
+    )
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+import pytest
+from requests.exceptions import ConnectionError
+
+from repoman.common.config import Config
+from repoman.common.sources import url
+
+
+ROOT = 'http://example.com/repo/'
+PAGES = {
+    ROOT: ['a/', 'a/b/', '../', 'x.rpm'],
+    # links back to the parents, and to the same page
+    ROOT + 'a/': ['b/', '../', '/repo/', ROOT + 'a/', 'z.rpm'],
+    ROOT + 'a/b/': ['../../', 'c/', 'y.rpm'],
+    ROOT + 'a/b/c/': ['w.rpm'],
+}
+
+
+@pytest.fixture
+def fetched(monkeypatch):
+    fetched = []
+
+    def get_page_links(page_url):
+        # the links are resolved against the page url with a trailing slash
+        # added, so they have repeated slashes
+        page_url = url.get_page_key(page_url)
+        fetched.append(page_url)
+        if page_url not in PAGES:
+            raise ConnectionError('Failed to fetch %s' % page_url)
+        return set(PAGES[page_url])
+
+    monkeypatch.setattr(url, 'get_page_links', get_page_links)
+    monkeypatch.setattr(
+        url, 'has_store', lambda artifact, stores: artifact.endswith('.rpm'),
+    )
+    return fetched
+
+
+def get_source(**options):
+    config = Config()
+    for option, value in options.items():
+        config.add_to_section('source.URLSource', option, value)
+    return url.URLSource(
+        config=config.get_section('source.URLSource'),
+        stores=None,
+    )
+
+
+def test_each_page_is_fetched_once(fetched):
+    _, artifacts = get_source().expand('rec:' + ROOT)
+    assert sorted(fetched) == sorted(PAGES)
+    assert set(url.get_page_key(artifact) for artifact in artifacts) == set([
+        ROOT + 'x.rpm',
+        ROOT + 'a/z.rpm',
+        ROOT + 'a/b/y.rpm',
+        ROOT + 'a/b/c/w.rpm',
+    ])
+
+
+def test_max_depth(fetched):
+    _, artifacts = get_source(rec_max_depth='1').expand('rec:' + ROOT)
+    assert sorted(fetched) == [ROOT, ROOT + 'a/', ROOT + 'a/b/']
+    artifacts = set(url.get_page_key(artifact) for artifact in artifacts)
+    assert ROOT + 'a/b/c/w.rpm' not in artifacts
+    assert ROOT + 'a/b/y.rpm' in artifacts
+
+
+def test_max_pages(fetched):
+    get_source(rec_max_pages='2').expand('rec:' + ROOT)
+    assert sorted(fetched) == [ROOT, ROOT + 'a/']
+
+
+def test_failed_pages_are_skipped(fetched, monkeypatch):
+    monkeypatch.setitem(PAGES, ROOT, PAGES[ROOT] + ['missing/'])
+    _, artifacts = get_source(rec_workers='1').expand('rec:' + ROOT)
+    assert ROOT + 'missing/' in fetched
+    assert len(fetched) == len(set(fetched))
+    assert ROOT + 'a/b/c/w.rpm' in set(
+        url.get_page_key(artifact) for artifact in artifacts
+    )
+
+
+@pytest.mark.parametrize('rec_workers', ['1', '4'])
+def test_failed_root_page_fails(fetched, rec_workers):
+    with pytest.raises(ConnectionError):
+        get_source(rec_workers=rec_workers).expand('rec:' + ROOT + 'typo/')
+    assert fetched == [ROOT + 'typo/']
+
+
+PAGE = (
+    '<html><body><a href="../">Parent</a>\n'
+    '<a href="a/">a/</a><a href="">empty</a>'
+    '<a href="some-1.0-1.el7.x86_64.rpm">some</a> '
+    'not a link: href= nor href="unfinished\n'
+    '"</a><a class="x" href="http://example.com/other.rpm">other</a>'
+    '<a href="a/">repeated</a><a href="last.iso">'
+)
+
+
+def extract_links(chunks):
+    extractor = url.LinkExtractor()
+    for chunk in chunks:
+        extractor.feed(chunk)
+    return extractor.close()
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 5, 6, 7, 64])
+def test_link_extractor_chunks(chunk_size):
+    expected = extract_links([PAGE])
+    assert expected == set([
+        '../',
+        'a/',
+        'some-1.0-1.el7.x86_64.rpm',
+        'unfinished\n',
+        'http://example.com/other.rpm',
+        'last.iso',
+    ])
+    assert extract_links(
+        PAGE[start:start + chunk_size]
+        for start in range(0, len(PAGE), chunk_size)
+    ) == expected
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 30, 1000])
+def test_link_extractor_drops_too_long_links(monkeypatch, chunk_size):
+    monkeypatch.setattr(url.LinkExtractor, 'MAX_LINK_LENGTH', 20)
+    page = (
+        '<a href="first.rpm">first</a>'
+        '<a href="%s">too long</a>'
+        '<a href="short.rpm">short</a>'
+        '<a href="%s'
+    ) % ('x' * 50, 'never closed ' * 100)
+    extractor = url.LinkExtractor()
+    for start in range(0, len(page), chunk_size):
+        extractor.feed(page[start:start + chunk_size])
+        assert len(extractor._tail) <= len('href="') + 20 + chunk_size
+    assert extractor.close() == set(['first.rpm', 'short.rpm'])
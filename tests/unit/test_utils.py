@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+import hashlib
+import os
+import random
+import sys
+import threading
+
+import pytest
+
+from repoman.common import utils
+
+
+def test_remove_files_ignores_the_missing_ones(tmpdir, caplog):
+    paths = []
+    for dir_name in ('dir1', 'dir2'):
+        for file_name in ('file1', 'file2'):
+            tmpdir.ensure(dir_name, file_name)
+            paths.append(str(tmpdir.join(dir_name, file_name)))
+    tmpdir.ensure('dir1', 'kept')
+    missing = str(tmpdir.join('dir1', 'missing'))
+    caplog.set_level('DEBUG')
+    assert utils.remove_files(iter(paths + [missing])) == 4
+    # only the files actually removed are counted
+    assert [
+        record.getMessage()
+        for record in caplog.records
+        if record.getMessage().startswith('Cleaned up')
+    ] == [
+        'Cleaned up 2 files from %s' % tmpdir.join('dir1'),
+        'Cleaned up 2 files from %s' % tmpdir.join('dir2'),
+    ]
+    assert not any(os.path.exists(path) for path in paths)
+    assert os.listdir(str(tmpdir.join('dir1'))) == ['kept']
+
+
+@pytest.mark.parametrize('size', [0, 10, 4096 * 3 + 1])
+def test_hash_file_matches_hashlib(tmpdir, monkeypatch, size):
+    # force several chunks for the bigger files
+    monkeypatch.setattr(utils, 'HASH_CHUNK_SIZE', 4096)
+    content = os.urandom(size)
+    tmpdir.join('file').write(content, mode='wb')
+    assert utils.hash_file(str(tmpdir.join('file'))) == dict(
+        (algorithm, hashlib.new(algorithm, content).hexdigest())
+        for algorithm in ('md5', 'sha1', 'sha256')
+    )
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_hash_files(tmpdir, workers):
+    paths = []
+    for num in range(5):
+        tmpdir.join('file%d' % num).write('content %d' % num)
+        paths.append(str(tmpdir.join('file%d' % num)))
+    assert utils.hash_files(iter(paths), workers=workers) == dict(
+        (path, utils.hash_file(path)) for path in paths
+    )
+
+
+@pytest.mark.parametrize('workers', [1, 3])
+@pytest.mark.parametrize('with_scandir', [True, False])
+def test_scan_tree(tmpdir, monkeypatch, workers, with_scandir):
+    if not with_scandir:
+        monkeypatch.setattr(utils, 'scandir', None)
+    tmpdir.ensure('top.rpm')
+    tmpdir.ensure('a', 'first.rpm')
+    tmpdir.ensure('a', 'b', 'second.rpm')
+    tmpdir.ensure('a', 'b', 'c', 'third.iso')
+    tmpdir.ensure('empty', dir=True)
+    # the symlinked dirs are not descended into, as os.walk does, but the
+    # symlinks to files are listed
+    tmpdir.join('link_to_a').mksymlinkto(tmpdir.join('a'))
+    tmpdir.join('link_to_top.rpm').mksymlinkto(tmpdir.join('top.rpm'))
+    entries = utils.scan_tree(str(tmpdir), workers=workers)
+    expected = [
+        'a/b/c/third.iso',
+        'a/b/second.rpm',
+        'a/first.rpm',
+        'link_to_top.rpm',
+        'top.rpm',
+    ]
+    assert sorted(
+        os.path.relpath(entry.path, str(tmpdir)) for entry in entries
+    ) == expected
+    for entry in entries:
+        assert entry.name == os.path.basename(entry.path)
+        assert entry.stat().st_ino == os.stat(entry.path).st_ino
+    assert utils.scan_tree(str(tmpdir.join('missing'))) == []
+
+
+def get_cached_versions():
+    versions = []
+    link = utils._VERSION_KEYS_ROOT[1]
+    while link is not utils._VERSION_KEYS_ROOT:
+        assert link[1][0] is link
+        versions.append(link[2])
+        link = link[1]
+    return versions
+
+
+@pytest.mark.parametrize('max_keys', [50, 100000])
+def test_version_key_from_many_threads(monkeypatch, max_keys):
+    monkeypatch.setattr(utils, '_VERSION_KEYS_MAX', max_keys)
+    utils.clear_version_keys()
+    versions = ['1.%d-%d' % (num // 10, num % 10) for num in range(300)]
+    expected = dict(
+        (version, utils.version_key(version)) for version in versions
+    )
+    utils.clear_version_keys()
+    errors = []
+
+    def get_keys(seed):
+        rand = random.Random(seed)
+        try:
+            for _ in range(5000):
+                version = rand.choice(versions)
+                assert utils.version_key(version) == expected[version]
+        except Exception as error:
+            errors.append(error)
+
+    # switch threads as often as possible, to make any race show up
+    check_interval = sys.getcheckinterval()
+    sys.setcheckinterval(1)
+    try:
+        threads = [
+            threading.Thread(target=get_keys, args=(seed, ))
+            for seed in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setcheckinterval(check_interval)
+    assert errors == []
+    cached = get_cached_versions()
+    assert len(cached) == len(utils._VERSION_KEYS)
+    assert sorted(cached) == sorted(utils._VERSION_KEYS)
+    assert len(cached) <= max_keys
+    utils.clear_version_keys()